@@ -6,6 +6,10 @@
 #include <QApplication>
 #include <QScreen>
 #include <QCloseEvent>
+#include <QFile>
+#include <QJsonArray>
+#include <QJsonDocument>
+#include <QJsonObject>
 #include <sys/socket.h>
 #include <netinet/in.h>
 #include <arpa/inet.h>
@@ -20,28 +24,13 @@ namespace sys {
     using ::connect;
 }
 
-ControlApp::ControlApp(QWidget *parent)
+ControlApp::ControlApp(const QString& configPath, QWidget *parent)
     : QMainWindow(parent), isToggleOn(false), eventSent(false)
 {
     setWindowTitle("Control Panel");
     
-    // Initialize backends
-    backends = {
-        {
-            "localhost",
-            {9090, 9091},
-            "Backend 1",
-            false,
-            {-1, -1}
-        },
-        {
-            "localhost",
-            {9092, 9093},
-            "Backend 2",
-            false,
-            {-1, -1}
-        }
-    };
+    // Initialize backends from the config file
+    loadBackends(configPath);
     
     setupUI();
     
@@ -68,6 +57,40 @@ ControlApp::~ControlApp()
     }
 }
 
+void ControlApp::loadBackends(const QString& configPath)
+{
+    QFile file(configPath);
+    if (file.open(QIODevice::ReadOnly)) {
+        QJsonDocument doc = QJsonDocument::fromJson(file.readAll());
+        for (const QJsonValue& value : doc.object().value("backends").toArray()) {
+            QJsonObject entry = value.toObject();
+            backends.push_back({
+                entry.value("host").toString().toStdString(),
+                {entry.value("control_port").toInt(), entry.value("data_port").toInt()},
+                entry.value("name").toString().toStdString(),
+                false,
+                {-1, -1},
+                entry.value("group").toString("default").toStdString()
+            });
+        }
+    }
+    
+    // Fall back to the two default backends
+    if (backends.empty()) {
+        backends = {
+            {"localhost", {9090, 9091}, "Backend 1", false, {-1, -1}, "default"},
+            {"localhost", {9092, 9093}, "Backend 2", false, {-1, -1}, "default"}
+        };
+    }
+    
+    for (size_t i = 0; i < backends.size(); ++i) {
+        backendIndexByName[backends[i].name] = i;
+        for (int port : backends[i].ports) {
+            backendIndexByAddress[backends[i].host + ":" + std::to_string(port)] = i;
+        }
+    }
+}
+
 void ControlApp::setupUI()
 {
     QWidget* centralWidget = new QWidget(this);
@@ -293,7 +316,13 @@ void ControlApp::applyConfiguration()
                                QString::fromStdString(backends[i].name + ": IP address cannot be empty"));
             return;
         }
+        for (int port : backends[i].ports) {
+            backendIndexByAddress.erase(backends[i].host + ":" + std::to_string(port));
+        }
         backends[i].host = ip.toStdString();
+        for (int port : backends[i].ports) {
+            backendIndexByAddress[backends[i].host + ":" + std::to_string(port)] = i;
+        }
     }
     QMessageBox::information(this, "Success", "Configuration applied successfully");
 }
@@ -8,6 +8,7 @@
 #include <QTimer>
 #include <vector>
 #include <string>
+#include <unordered_map>
 
 struct Backend {
     std::string host;
@@ -15,13 +16,14 @@ struct Backend {
     std::string name;
     bool ready;
     std::vector<int> sockets;  // socket file descriptors
+    std::string group;
 };
 
 class ControlApp : public QMainWindow {
     Q_OBJECT
 
 public:
-    ControlApp(QWidget *parent = nullptr);
+    ControlApp(const QString& configPath = "backends.json", QWidget *parent = nullptr);
     ~ControlApp();
 
 protected:
@@ -35,11 +37,14 @@ private slots:
     void enableEventButton();
 
 private:
+    void loadBackends(const QString& configPath);
     void setupUI();
     void centerWindow();
     std::pair<bool, std::vector<std::string>> sendTcpMessage(const std::string& message);
     
     std::vector<Backend> backends;
+    std::unordered_map<std::string, size_t> backendIndexByName;
+    std::unordered_map<std::string, size_t> backendIndexByAddress;  // "host:port"
     std::vector<QLineEdit*> ipInputs;
     std::vector<QLabel*> statusLabels;
     
@@ -6,7 +6,8 @@ int main(int argc, char *argv[])
     QApplication app(argc, argv);
     app.setStyle("Fusion");
     
-    ControlApp window;
+    QStringList args = app.arguments();
+    ControlApp window(args.size() > 1 ? args.at(1) : QString("backends.json"));
     window.show();
     
     return app.exec();
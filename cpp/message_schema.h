@@ -0,0 +1,317 @@
+// Wire codecs shared with python/message_schema.py. Generated from the Python schemas, do not edit:
+//   python python/message_schema.py --cpp cpp/message_schema.h
+#ifndef MESSAGE_SCHEMA_H
+#define MESSAGE_SCHEMA_H
+
+#include <cstddef>
+#include <cstdint>
+#include <stdexcept>
+#include <string>
+#include <utility>
+#include <vector>
+
+namespace message_schema {
+
+constexpr size_t HEADER_SIZE = 21;
+constexpr uint32_t MAX_BODY_LENGTH = 67108864;
+constexpr uint8_t META_KEY_IDS = 0x01;  // MetaData flag: keys sent as session dictionary ids
+
+// MessageType values
+constexpr uint8_t START_CONFIG_MESSAGE_TYPE = 19;
+constexpr uint8_t END_CONFIG_MESSAGE_TYPE = 21;
+constexpr uint8_t COMMAND_MESSAGE_TYPE = 0;
+constexpr uint8_t LOGGING_MSG_TYPE = 40;
+constexpr uint8_t EVENT_RECEIVED_MESSAGE_TYPE = 42;
+constexpr uint8_t READY_MESSAGE_TYPE = 43;
+constexpr uint8_t STATS_REQUEST_MESSAGE_TYPE = 44;
+constexpr uint8_t STATS_RESPONSE_MESSAGE_TYPE = 45;
+constexpr uint8_t PIPELINE_OPEN_MESSAGE_TYPE = 46;
+constexpr uint8_t PIPELINE_ACK_MESSAGE_TYPE = 47;
+
+// Little endian writer appending to a byte string
+class Writer {
+public:
+    std::string buffer;
+
+    void u8(uint8_t value) { buffer.push_back(static_cast<char>(value)); }
+    void u32(uint32_t value) { integer(value, 4); }
+    void u64(uint64_t value) { integer(value, 8); }
+    void string(const std::string& value) {
+        u32(static_cast<uint32_t>(value.size()));
+        buffer += value;
+    }
+    void varint(uint64_t value) {
+        while (value >= 0x80) {
+            u8(static_cast<uint8_t>((value & 0x7F) | 0x80));
+            value >>= 7;
+        }
+        u8(static_cast<uint8_t>(value));
+    }
+
+private:
+    void integer(uint64_t value, int size) {
+        for (int i = 0; i < size; ++i) {
+            buffer.push_back(static_cast<char>((value >> (8 * i)) & 0xFF));
+        }
+    }
+};
+
+// Little endian reader over a received buffer; throws std::runtime_error when it runs short
+class Reader {
+public:
+    Reader(const char* data, size_t size) : pos(reinterpret_cast<const uint8_t*>(data)), end(pos + size) {}
+
+    uint8_t u8() { need(1); return *pos++; }
+    uint32_t u32() { return static_cast<uint32_t>(integer(4)); }
+    uint64_t u64() { return integer(8); }
+    std::string bytes(size_t size) {
+        need(size);
+        std::string value(reinterpret_cast<const char*>(pos), size);
+        pos += size;
+        return value;
+    }
+    std::string string() { return bytes(u32()); }
+    uint64_t varint() {
+        uint64_t value = 0;
+        for (int shift = 0; ; shift += 7) {
+            uint8_t byte = u8();
+            value |= static_cast<uint64_t>(byte & 0x7F) << shift;
+            if (byte < 0x80) {
+                return value;
+            }
+        }
+    }
+    size_t remaining() const { return static_cast<size_t>(end - pos); }
+
+private:
+    void need(size_t size) {
+        if (remaining() < size) {
+            throw std::runtime_error("Truncated message");
+        }
+    }
+    uint64_t integer(int size) {
+        need(size);
+        uint64_t value = 0;
+        for (int i = 0; i < size; ++i) {
+            value |= static_cast<uint64_t>(pos[i]) << (8 * i);
+        }
+        pos += size;
+        return value;
+    }
+
+    const uint8_t* pos;
+    const uint8_t* end;
+};
+
+inline size_t varintSize(uint64_t value) {
+    size_t size = 1;
+    while (value >= 0x80) {
+        value >>= 7;
+        ++size;
+    }
+    return size;
+}
+
+// MetaData: flags, entry count, key/value pairs, issue (see data_record_config_msg.encode_meta_data).
+// Keys are always sent inline; messages using a session key dictionary (META_KEY_IDS) are rejected.
+struct MetaData {
+    std::vector<std::pair<std::string, std::string>> Data;
+    std::string Issue;
+};
+
+inline size_t metaBlobSize(const MetaData& m) {
+    size_t size = 1 + varintSize(m.Data.size());
+    for (const auto& entry : m.Data) {
+        size += varintSize(entry.first.size() << 1) + entry.first.size();
+        size += varintSize(entry.second.size()) + entry.second.size();
+    }
+    return size + varintSize(m.Issue.size()) + m.Issue.size();
+}
+
+inline size_t encodedSize(const MetaData& m) {
+    return 4 + metaBlobSize(m);
+}
+
+inline void encode(Writer& w, const MetaData& m) {
+    w.u32(static_cast<uint32_t>(metaBlobSize(m)));
+    w.u8(0);
+    w.varint(m.Data.size());
+    for (const auto& entry : m.Data) {
+        w.varint(entry.first.size() << 1);
+        w.buffer += entry.first;
+        w.varint(entry.second.size());
+        w.buffer += entry.second;
+    }
+    w.varint(m.Issue.size());
+    w.buffer += m.Issue;
+}
+
+inline void decode(Reader& r, MetaData& m) {
+    std::string blob = r.string();
+    Reader meta(blob.data(), blob.size());
+    if (meta.u8() & META_KEY_IDS) {
+        throw std::runtime_error("MetaData uses a key dictionary");
+    }
+    uint64_t count = meta.varint();
+    m.Data.clear();
+    for (uint64_t i = 0; i < count; ++i) {
+        uint64_t reference = meta.varint();
+        if (reference & 1) {
+            throw std::runtime_error("MetaData uses a key dictionary");
+        }
+        std::string key = meta.bytes(reference >> 1);
+        std::string value = meta.bytes(meta.varint());
+        m.Data.emplace_back(std::move(key), std::move(value));
+    }
+    m.Issue = meta.bytes(meta.varint());
+    if (meta.remaining() != 0) {
+        throw std::runtime_error("Trailing bytes after MetaData");
+    }
+}
+
+
+// Frame header in front of every message body
+struct ProtocolHeader {
+    uint64_t TimeStamp = 0;
+    uint8_t MessageType = 0;
+    uint64_t SequenceNumber = 0;
+    uint32_t BodyLength = 0;
+};
+
+inline size_t encodedSize(const ProtocolHeader&) {
+    size_t size = 21;
+    return size;
+}
+
+inline void encode(Writer& w, const ProtocolHeader& m) {
+    w.u64(m.TimeStamp);
+    w.u8(m.MessageType);
+    w.u64(m.SequenceNumber);
+    w.u32(m.BodyLength);
+}
+
+inline void decode(Reader& r, ProtocolHeader& m) {
+    m.TimeStamp = r.u64();
+    m.MessageType = r.u8();
+    m.SequenceNumber = r.u64();
+    m.BodyLength = r.u32();
+}
+
+// One file of a recording
+struct LoggingFile {
+    uint32_t Id = 0;
+    std::string Enable;
+    std::string NamePrefix;
+    std::string NameSubfix;
+    std::string Extension;
+};
+
+inline size_t encodedSize(const LoggingFile& m) {
+    size_t size = 4;
+    size += 4 + m.Enable.size();
+    size += 4 + m.NamePrefix.size();
+    size += 4 + m.NameSubfix.size();
+    size += 4 + m.Extension.size();
+    return size;
+}
+
+inline void encode(Writer& w, const LoggingFile& m) {
+    w.u32(m.Id);
+    w.string(m.Enable);
+    w.string(m.NamePrefix);
+    w.string(m.NameSubfix);
+    w.string(m.Extension);
+}
+
+inline void decode(Reader& r, LoggingFile& m) {
+    m.Id = r.u32();
+    m.Enable = r.string();
+    m.NamePrefix = r.string();
+    m.NameSubfix = r.string();
+    m.Extension = r.string();
+}
+
+// Body of the START/END config frames (MessageType 19/21)
+struct DataRecordConfigMsg {
+    std::string LoggingDirectoryPath;
+    uint32_t LoggingMode = 0;
+    uint32_t HistoryTime = 0;
+    uint32_t FollowTime = 0;
+    uint32_t SplitTime = 0;
+    uint32_t DataLength = 0;
+    std::vector<LoggingFile> LoggingFileList;
+    message_schema::MetaData MetaData;
+};
+
+inline size_t encodedSize(const DataRecordConfigMsg& m) {
+    size_t size = 20;
+    size += 4 + m.LoggingDirectoryPath.size();
+    size += 4;
+    for (const auto& item : m.LoggingFileList) {
+        size += encodedSize(item);
+    }
+    size += encodedSize(m.MetaData);
+    return size;
+}
+
+inline void encode(Writer& w, const DataRecordConfigMsg& m) {
+    w.string(m.LoggingDirectoryPath);
+    w.u32(m.LoggingMode);
+    w.u32(m.HistoryTime);
+    w.u32(m.FollowTime);
+    w.u32(m.SplitTime);
+    w.u32(m.DataLength);
+    w.u32(static_cast<uint32_t>(m.LoggingFileList.size()));
+    for (const auto& item : m.LoggingFileList) {
+        encode(w, item);
+    }
+    encode(w, m.MetaData);
+}
+
+inline void decode(Reader& r, DataRecordConfigMsg& m) {
+    m.LoggingDirectoryPath = r.string();
+    m.LoggingMode = r.u32();
+    m.HistoryTime = r.u32();
+    m.FollowTime = r.u32();
+    m.SplitTime = r.u32();
+    m.DataLength = r.u32();
+    uint32_t count = r.u32();
+    m.LoggingFileList.clear();
+    for (uint32_t i = 0; i < count; ++i) {
+        LoggingFile item;
+        decode(r, item);
+        m.LoggingFileList.push_back(std::move(item));
+    }
+    decode(r, m.MetaData);
+}
+
+// Body of a viewer message
+struct DataRecordViewerMsg {
+    std::string RegisterNum;
+    std::string IssueLog;
+    std::string ControlId;
+};
+
+inline size_t encodedSize(const DataRecordViewerMsg& m) {
+    size_t size = 0;
+    size += 4 + m.RegisterNum.size();
+    size += 4 + m.IssueLog.size();
+    size += 4 + m.ControlId.size();
+    return size;
+}
+
+inline void encode(Writer& w, const DataRecordViewerMsg& m) {
+    w.string(m.RegisterNum);
+    w.string(m.IssueLog);
+    w.string(m.ControlId);
+}
+
+inline void decode(Reader& r, DataRecordViewerMsg& m) {
+    m.RegisterNum = r.string();
+    m.IssueLog = r.string();
+    m.ControlId = r.string();
+}
+
+}  // namespace message_schema
+
+#endif  // MESSAGE_SCHEMA_H
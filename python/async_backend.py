@@ -0,0 +1,155 @@
+import asyncio
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_log import ERROR, configure_from_args, define_event, get_logger
+from backend_process import BackendProcess
+from metrics import serve_from_args
+from tcp_common import HEADER_SIZE, HEADER_STRUCT, MAX_BODY_LENGTH, FrameHeader
+
+log = get_logger()
+
+LOG_LISTENING = define_event("Listening for connections on port {}...")
+LOG_CONNECTION_ERROR = define_event("Error on connection {} port {}: {}", ERROR)
+LOG_STARTING = define_event("Async backend starting on port pairs {}")
+
+
+class AsyncChannel:
+    """Notification sender for handlers running off the event loop; writes are queued onto the loop"""
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.closed = False
+        self.pipeline = None  # PipelineSession carried by this connection
+
+    def send(self, data):
+        if self.closed or self.writer.is_closing():
+            raise ConnectionError("Connection closed")
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncBackendServer:
+    """Serve any number of backend port pairs from a single asyncio event loop.
+
+    Each port pair gets its own BackendProcess so the existing handle_message /
+    handle_frame semantics and per-backend state are reused unchanged. Handlers
+    run on one worker thread per backend, which keeps message order and keeps
+    blocking work inside the handlers off the event loop.
+    """
+
+    def __init__(self, port_pairs, host='localhost', persistent=True, backlog=1024):
+        self.host = host
+        self.persistent = persistent
+        self.backlog = backlog
+        self.backends = [BackendProcess(list(ports), persistent=persistent) for ports in port_pairs]
+        self.executors = [ThreadPoolExecutor(max_workers=1) for _ in self.backends]
+        self.servers = []
+
+    async def start(self):
+        for backend_index, backend in enumerate(self.backends):
+            for socket_index, port in enumerate(backend.ports):
+                server = await asyncio.start_server(
+                    lambda r, w, b=backend_index, s=socket_index: self.serve_client(r, w, b, s),
+                    self.host, port, reuse_address=True, backlog=self.backlog)
+                self.servers.append(server)
+                log.log(LOG_LISTENING, port)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self.servers))
+        finally:
+            await self.close()
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+        for executor in self.executors:
+            executor.shutdown(wait=False)
+
+    async def serve_client(self, reader, writer, backend_index, socket_index):
+        backend = self.backends[backend_index]
+        executor = self.executors[backend_index]
+        loop = asyncio.get_running_loop()
+        addr = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if socket_index == 0:  # Only store client address from first socket
+            backend.remember_client(addr)
+        channel = AsyncChannel(loop, writer)
+
+        try:
+            if not self.persistent:
+                message = (await reader.read(1024)).decode()
+                await loop.run_in_executor(executor, backend.handle_message, message, addr)
+                return
+
+            while True:
+                try:
+                    header_data = await reader.readexactly(HEADER_SIZE)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        raise ConnectionError(f"Connection closed after {len(e.partial)} of {HEADER_SIZE} header bytes")
+                    break
+                header = FrameHeader(*HEADER_STRUCT.unpack(header_data))
+                if header.body_length > MAX_BODY_LENGTH:
+                    raise ValueError(f"Body length {header.body_length} exceeds limit {MAX_BODY_LENGTH}")
+                body = await reader.readexactly(header.body_length) if header.body_length else b''
+                await loop.run_in_executor(executor, backend.handle_frame, header, body, addr, channel)
+        except Exception as e:
+            log.log(LOG_CONNECTION_ERROR, addr, backend.ports[socket_index], str(e))
+        finally:
+            backend.channel_closed(channel, addr)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+def main():
+    args = sys.argv[1:]
+    persistent = '--legacy' not in args
+    if not persistent:
+        args.remove('--legacy')
+    try:
+        configure_from_args(args)
+        serve_from_args(args)
+    except (ValueError, OSError) as e:
+        print("Error: {}".format(str(e)))
+        sys.exit(1)
+    if not args or len(args) % 2 != 0:
+        print("Usage: python async_backend.py <port1> <port2> [<port1> <port2> ...] [--legacy] [--log-level LEVEL] "
+              "[--log-binary PATH] [--metrics-port PORT]")
+        print("Example: python async_backend.py 9090 9091 9092 9093")
+        sys.exit(1)
+
+    try:
+        ports = [int(arg) for arg in args]
+        for port in ports:
+            if port < 1024 or port > 65535:
+                raise ValueError("Port must be between 1024 and 65535")
+    except ValueError as e:
+        print("Error: {}".format(str(e)))
+        sys.exit(1)
+
+    port_pairs = [ports[i:i + 2] for i in range(0, len(ports), 2)]
+    server = AsyncBackendServer(port_pairs, persistent=persistent)
+    log.log(LOG_STARTING, port_pairs)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nBackend process terminated by user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+import random
+import selectors
+import socket
+import threading
+import time
+
+from metrics import default_registry
+from seq_window import DEFAULT_WINDOW, OPEN_STRUCT, SendWindow, decode_ack
+from tcp_common import (HEADER_SIZE, HEADER_STRUCT, HANDSHAKE_RESPONSES,
+                        STATS_REQUEST_MESSAGE_TYPE, STATS_RESPONSE_MESSAGE_TYPE, PIPELINE_OPEN_MESSAGE_TYPE, FrameHeader,
+                        pack_message, recv_message)
+
+# (request MessageType, expected response MessageType) exchanged on the control port
+HANDSHAKE_STEPS = list(HANDSHAKE_RESPONSES.items())
+HANDSHAKE_TIMEOUT = 2.0  # Seconds allowed for connect + handshake of one backend
+BROADCAST_TIMEOUT = 1.0  # Seconds allowed for a broadcast to reach every backend
+
+
+KEEPALIVE_IDLE = 10  # Seconds of silence before the first keepalive probe
+KEEPALIVE_INTERVAL = 5  # Seconds between keepalive probes
+KEEPALIVE_COUNT = 3  # Unanswered probes before the kernel drops the connection
+
+metrics = default_registry()
+HANDSHAKE_SECONDS = metrics.histogram("controller_handshake_seconds", "Connect plus 1->2, 3->4 handshake time",
+                                      ("backend",))
+CONNECT_FAILURES = metrics.counter("controller_connect_failures_total", "Failed connects or handshakes", ("backend",))
+BROADCAST_SECONDS = metrics.histogram("controller_broadcast_seconds", "Time for a broadcast to reach every backend")
+BROADCAST_FAILURES = metrics.counter("controller_broadcast_failures_total", "Backends a broadcast did not reach")
+PIPELINE_RETRANSMITS = metrics.counter("controller_pipeline_retransmits_total", "Pipelined frames sent again",
+                                       ("backend",))
+PIPELINE_IN_FLIGHT = metrics.gauge("controller_pipeline_in_flight", "Pipelined frames awaiting acknowledgement",
+                                   ("backend",))
+
+
+def remaining_time(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Handshake deadline exceeded")
+    return remaining
+
+
+def enable_keepalive(sock, idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Fine grained options are platform specific
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    elif hasattr(socket, 'TCP_KEEPALIVE'):  # macOS
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+
+def open_connection(host, port, timeout):
+    """Connect with TCP_NODELAY and keepalive enabled"""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        enable_keepalive(sock)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def is_socket_alive(sock):
+    """Cheap liveness probe: a peek sees FIN/RST without consuming data.
+
+    Readiness is polled first so the peek never blocks; MSG_DONTWAIT does not
+    exist on Windows, and the socket's blocking mode is shared with senders.
+    """
+    if sock is None:
+        return False
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            if not selector.select(0):
+                return True  # Nothing to read, connection still open
+        return sock.recv(1, socket.MSG_PEEK) != b''
+    except (BlockingIOError, InterruptedError):
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def run_handshake(control_socket, sequence_number, deadline):
+    """Run the 1->2, 3->4 handshake on an already connected control socket"""
+    for request_type, response_type in HANDSHAKE_STEPS:
+        control_socket.settimeout(remaining_time(deadline))
+        control_socket.sendall(pack_message(request_type, sequence_number))
+        sequence_number += 1
+        frame = recv_message(control_socket)
+        if frame is None:
+            raise ConnectionError("Connection closed during handshake")
+        header, _ = frame
+        if header.message_type != response_type:
+            raise Exception(f"Expected MessageType {response_type}, got {header.message_type}")
+    control_socket.settimeout(None)
+
+
+def perform_handshake(host, ports, sequence_number, timeout=HANDSHAKE_TIMEOUT):
+    """Connect to one backend and run the 1->2, 3->4 handshake on its control port.
+
+    The whole exchange, including connecting the data port, must finish within
+    timeout seconds. Returns (control_socket, data_socket); both are closed on failure.
+    """
+    connection = BackendConnection(host, ports)
+    connection.connect(sequence_number, timeout)
+    return connection.control_socket, connection.data_socket
+
+
+class BackendConnection:
+    """Control and data sockets of one backend, kept open between uses.
+
+    connect() only re-establishes the sockets that are missing, so a dead data
+    socket does not force a new handshake on a healthy control socket.
+    """
+
+    def __init__(self, host, ports):
+        self.host = host
+        self.ports = ports
+        self.control_socket = None
+        self.data_socket = None
+        self.lock = threading.Lock()  # Makes set_host and saving a new socket atomic; not held while dialling
+
+    @property
+    def sockets(self):
+        return [self.control_socket, self.data_socket]
+
+    def connect(self, sequence_number, timeout=HANDSHAKE_TIMEOUT):
+        """Reconnect whatever is missing within timeout seconds. Newly opened sockets are closed on failure."""
+        started = time.monotonic()
+        deadline = started + timeout
+        host = self.host
+        labels = (f"{host}:{self.ports[0]}",)
+        try:
+            if self.control_socket is None:
+                control_socket = open_connection(host, self.ports[0], timeout)
+                try:
+                    run_handshake(control_socket, sequence_number, deadline)
+                except Exception:
+                    control_socket.close()
+                    raise
+                self.save_socket(0, control_socket, host)
+                HANDSHAKE_SECONDS.observe(time.monotonic() - started, labels)
+            if self.data_socket is None:
+                data_socket = open_connection(host, self.ports[1], remaining_time(deadline))
+                data_socket.settimeout(None)
+                self.save_socket(1, data_socket, host)
+        except Exception:
+            CONNECT_FAILURES.inc(1, labels)
+            raise
+
+    def save_socket(self, index, sock, host):
+        # set_host may have run while sock was being opened; a socket to the old host must not be kept
+        with self.lock:
+            if host == self.host:
+                if index == 0:
+                    self.control_socket = sock
+                else:
+                    self.data_socket = sock
+                return
+        sock.close()
+        raise ConnectionError(f"Host changed from {host} to {self.host} while connecting")
+
+    def check(self):
+        """Probe both sockets, close the dead ones and return True if both are still usable"""
+        if not is_socket_alive(self.control_socket):
+            self.close_socket(0)
+        if not is_socket_alive(self.data_socket):
+            self.close_socket(1)
+        return self.control_socket is not None and self.data_socket is not None
+
+    def close_socket(self, index):
+        sock = self.sockets[index]
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        if index == 0:
+            self.control_socket = None
+        else:
+            self.data_socket = None
+
+    def set_host(self, host):
+        with self.lock:
+            if host != self.host:
+                self.close()
+                self.host = host
+
+    def close(self):
+        self.close_socket(0)
+        self.close_socket(1)
+
+
+class ConnectionPool:
+    """One BackendConnection per backend name"""
+
+    def __init__(self, backends=()):
+        self.connections = {}
+        for backend in backends:
+            self.add(backend["name"], backend["host"], backend["ports"])
+
+    def add(self, name, host, ports):
+        self.connections[name] = BackendConnection(host, ports)
+        return self.connections[name]
+
+    def get(self, name):
+        return self.connections[name]
+
+    def close_all(self):
+        for connection in self.connections.values():
+            connection.close()
+
+
+def broadcast(targets, package, timeout=BROADCAST_TIMEOUT, ack_type=None):
+    """Send the same package to every socket in parallel under one global deadline.
+
+    targets maps a backend name to its connected socket. Writes are interleaved
+    with a selector, so the total time is bounded by the slowest backend instead
+    of the sum of all sends. If ack_type is given, a backend only counts as
+    successful once a header with that MessageType has been read back.
+
+    Returns (succeeded names, {failed name: reason}).
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    payload = memoryview(package)
+    succeeded = []
+    failed = {}
+    # name -> [socket, bytes sent, header bytes received]
+    state = {}
+    selector = selectors.DefaultSelector()
+    try:
+        for name, sock in targets.items():
+            try:
+                sock.setblocking(False)
+                selector.register(sock, selectors.EVENT_WRITE, name)
+                state[name] = [sock, 0, bytearray()]
+            except (OSError, ValueError) as e:
+                failed[name] = str(e)
+
+        while state:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, events in selector.select(remaining):
+                name = key.data
+                sock, sent, ack = state[name]
+                try:
+                    if events & selectors.EVENT_WRITE:
+                        sent += sock.send(payload[sent:])
+                        state[name][1] = sent
+                        if sent < len(payload):
+                            continue
+                        if ack_type is None:
+                            succeeded.append(name)
+                        else:
+                            selector.modify(sock, selectors.EVENT_READ, name)
+                            continue
+                    else:
+                        chunk = sock.recv(HEADER_SIZE - len(ack))
+                        if not chunk:
+                            raise ConnectionError("Connection closed before acknowledgement")
+                        ack.extend(chunk)
+                        if len(ack) < HEADER_SIZE:
+                            continue
+                        message_type = HEADER_STRUCT.unpack(ack)[1]
+                        if message_type != ack_type:
+                            raise Exception(f"Expected MessageType {ack_type}, got {message_type}")
+                        succeeded.append(name)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except Exception as e:
+                    failed[name] = str(e)
+                selector.unregister(sock)
+                del state[name]
+
+        for name in state:
+            failed[name] = "Broadcast deadline exceeded"
+    finally:
+        selector.close()
+        for sock in targets.values():
+            try:
+                sock.setblocking(True)
+            except OSError:
+                pass
+    BROADCAST_SECONDS.observe(time.monotonic() - started)
+    if failed:
+        BROADCAST_FAILURES.inc(len(failed))
+    return succeeded, failed
+
+
+def request_stats(host, port, sequence_number=0, timeout=BROADCAST_TIMEOUT) -> str:
+    """Fetch a persistent-mode backend's metrics over a short-lived connection on one of its ports"""
+    with open_connection(host, port, timeout) as sock:
+        sock.sendall(pack_message(STATS_REQUEST_MESSAGE_TYPE, sequence_number))
+        while True:
+            frame = recv_message(sock)
+            if frame is None:
+                raise ConnectionError("Connection closed before the stats response")
+            header, body = frame
+            if header.message_type == STATS_RESPONSE_MESSAGE_TYPE:
+                return bytes(body).decode('utf-8')
+
+
+class PipelinedSender:
+    """Pipelined session with one backend: up to window frames in flight, matched by SequenceNumber.
+
+    Every package gets the next sequence number of this backend and is kept
+    until the backend acknowledges it, so throughput is bounded by bandwidth
+    rather than by a round trip per message. The session survives
+    reconnects: attach() resumes it on a new data socket and only the frames
+    the backend reports missing are sent again. on_ack() is called with the
+    PIPELINE_ACK frames read from that socket.
+    """
+
+    def __init__(self, name, window=DEFAULT_WINDOW, session_id=None):
+        self.name = name
+        self.window = SendWindow(window)
+        self.session_id = random.getrandbits(64) if session_id is None else session_id
+        self.sock = None
+        self.resync = False  # The next acknowledgement answers PIPELINE_OPEN
+        self.lock = threading.Lock()
+        PIPELINE_IN_FLIGHT.set_function(self.window.in_flight, (name,))
+
+    def attach(self, sock):
+        with self.lock:
+            self.sock = sock
+            sock.settimeout(BROADCAST_TIMEOUT)
+            self.window.new_connection()
+            self.resync = True
+            body = OPEN_STRUCT.pack(self.session_id, self.window.first_unacked, self.window.size)
+            return self._send([pack_message(PIPELINE_OPEN_MESSAGE_TYPE, 0, body)])
+
+    def detach(self):
+        with self.lock:
+            self.sock = None
+
+    def send(self, package) -> bool:
+        """Queue package for reliable delivery; False if the connection failed while sending"""
+        with self.lock:
+            return self._send(self.window.push(package))
+
+    def on_ack(self, header, body):
+        with self.lock:
+            resend_all, self.resync = self.resync, False
+            retransmits = self.window.retransmits
+            packages = self.window.ack(header.sequence_number, decode_ack(body), resend_all)
+            if self.window.retransmits > retransmits:
+                PIPELINE_RETRANSMITS.inc(self.window.retransmits - retransmits, (self.name,))
+            return self._send(packages)
+
+    def _send(self, packages):
+        if self.sock is None:
+            return False
+        if not packages:
+            return True
+        try:
+            self.sock.sendall(b''.join(packages))
+            return True
+        except OSError:
+            self.sock = None  # Frames stay unacked and go out again after attach()
+            return False
+
+
+class NotificationReader:
+    """Reads frames pushed by backends (EVENT_RECEIVED, READY, ...) on one background thread.
+
+    Sockets are watched with a selector and only read when readable, so they
+    can be written concurrently by other threads. on_message(name, header, body)
+    and on_closed(name) run on the reader thread.
+    """
+
+    def __init__(self, on_message, on_closed=None):
+        self.on_message = on_message
+        self.on_closed = on_closed
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.sockets = {}  # name -> socket
+        self.buffers = {}  # name -> bytearray of a partial frame
+        self.running = True
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+        self.thread = threading.Thread(target=self.run, name="notification-reader", daemon=True)
+        self.thread.start()
+
+    def add(self, name, sock):
+        with self.lock:
+            self._remove_locked(name)
+            self.selector.register(sock, selectors.EVENT_READ, name)
+            self.sockets[name] = sock
+            self.buffers[name] = bytearray()
+        self._wakeup()
+
+    def remove(self, name):
+        with self.lock:
+            self._remove_locked(name)
+        self._wakeup()
+
+    def _remove_locked(self, name):
+        sock = self.sockets.pop(name, None)
+        self.buffers.pop(name, None)
+        if sock is not None:
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            pass
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(1.0):
+                name = key.data
+                if name is None:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                self._read(name, key.fileobj)
+
+    def _read(self, name, sock):
+        frames = []
+        closed = False
+        with self.lock:
+            if self.sockets.get(name) is not sock:
+                return  # Removed while select() was waiting
+            buffer = self.buffers[name]
+            try:
+                chunk = sock.recv(65536)  # The selector reported it readable, so this does not block
+                if not chunk:
+                    closed = True
+                buffer += chunk
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                closed = True
+            while len(buffer) >= HEADER_SIZE:
+                header = FrameHeader(*HEADER_STRUCT.unpack_from(buffer, 0))
+                end = HEADER_SIZE + header.body_length
+                if len(buffer) < end:
+                    break
+                frames.append((header, bytes(buffer[HEADER_SIZE:end])))
+                del buffer[:end]
+            if closed:
+                self._remove_locked(name)
+        for header, body in frames:
+            self.on_message(name, header, body)
+        if closed and self.on_closed is not None:
+            self.on_closed(name)
+
+    def close(self):
+        self.running = False
+        self._wakeup()
+        self.thread.join()
+        self.selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
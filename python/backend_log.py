@@ -0,0 +1,292 @@
+import atexit
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+from logging_msg_queue import LoggingMsgQueue, OVERFLOW_DROP_NEWEST
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+DEFAULT_QUEUE_SIZE = 65536  # Pending records before new ones are dropped
+DRAIN_BATCH = 1024
+
+# Binary log layout: FILE_HEADER (magic, wall clock minus monotonic ns), then records of
+# RECORD_HEADER (event id, monotonic ns, encoded args length) followed by the args.
+# Event id 0 records define an event (id, level, format) the first time it is written.
+BINARY_MAGIC = b'BLG1'
+FILE_HEADER = struct.Struct('<4sq')
+RECORD_HEADER = struct.Struct('<HQI')
+DEFINE_EVENT_ID = 0
+
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_LEN = struct.Struct('<I')
+
+
+class LogEvent:
+    """A log statement: fixed format string and level, identified by a small id"""
+
+    __slots__ = ("event_id", "level", "fmt")
+
+    def __init__(self, event_id, level, fmt):
+        self.event_id = event_id
+        self.level = level
+        self.fmt = fmt
+
+    def render(self, args):
+        try:
+            return self.fmt.format(*args)
+        except (IndexError, KeyError, ValueError):
+            return f"{self.fmt} {args!r}"
+
+
+_events = [None]  # Index 0 is reserved for definition records
+_events_lock = threading.Lock()
+
+
+def define_event(fmt, level=INFO) -> LogEvent:
+    """Register a log statement; call once at import time and log it by reference"""
+    with _events_lock:
+        event = LogEvent(len(_events), level, fmt)
+        _events.append(event)
+        return event
+
+
+def format_timestamp(wall_ns) -> str:
+    return datetime.fromtimestamp(wall_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]  # Include milliseconds
+
+
+def format_record(wall_ns, event, args) -> str:
+    return f"[{format_timestamp(wall_ns)}] {event.render(args)}\n"
+
+
+def encode_args(args) -> bytes:
+    """Tagged encoding: i=int64, f=float64, s=utf-8 text, b=bytes, n=None; anything else is stored as text"""
+    out = bytearray()
+    for arg in args:
+        if arg is None:
+            out += b'n'
+        elif isinstance(arg, bool) or not isinstance(arg, (int, float, bytes, bytearray, memoryview)):
+            data = str(arg).encode('utf-8', 'replace')
+            out += b's' + _LEN.pack(len(data)) + data
+        elif isinstance(arg, int):
+            if -2 ** 63 <= arg < 2 ** 63:
+                out += b'i' + _INT.pack(arg)
+            else:
+                data = str(arg).encode()
+                out += b's' + _LEN.pack(len(data)) + data
+        elif isinstance(arg, float):
+            out += b'f' + _FLOAT.pack(arg)
+        else:
+            out += b'b' + _LEN.pack(len(arg)) + bytes(arg)
+    return bytes(out)
+
+
+def decode_args(data) -> tuple:
+    args = []
+    offset = 0
+    while offset < len(data):
+        tag = data[offset:offset + 1]
+        offset += 1
+        if tag == b'n':
+            args.append(None)
+        elif tag == b'i':
+            args.append(_INT.unpack_from(data, offset)[0])
+            offset += _INT.size
+        elif tag == b'f':
+            args.append(_FLOAT.unpack_from(data, offset)[0])
+            offset += _FLOAT.size
+        elif tag in (b's', b'b'):
+            length = _LEN.unpack_from(data, offset)[0]
+            offset += _LEN.size
+            value = bytes(data[offset:offset + length])
+            args.append(value.decode('utf-8', 'replace') if tag == b's' else value)
+            offset += length
+        else:
+            raise ValueError(f"Unknown argument tag {tag!r} at offset {offset - 1}")
+    return tuple(args)
+
+
+class BackendLogger:
+    """Level-gated logger that defers formatting and I/O to a background thread.
+
+    A call below the configured level returns before touching its arguments.
+    Otherwise only (monotonic ns, event, args) is queued; the writer thread
+    renders text lines, or appends compact binary records when binary_path is
+    set (see render_binary). Args must not be mutated after the call. When the
+    queue is full new records are dropped and counted rather than blocking.
+    """
+
+    def __init__(self, level=INFO, stream=None, binary_path=None, queue_size=DEFAULT_QUEUE_SIZE):
+        self.level = level
+        self.stream = stream
+        self.queue = LoggingMsgQueue(queue_size, OVERFLOW_DROP_NEWEST)
+        self.clock_offset_ns = time.time_ns() - time.monotonic_ns()
+        self.binary_file = None
+        self.defined = set()  # Event ids already defined in the binary file
+        self._output_lock = threading.Lock()
+        if binary_path is not None:
+            self.open_binary(binary_path)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="backend-log", daemon=True)
+        self.thread.start()
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    def open_binary(self, path):
+        """Switch output to a new binary log; records still queued go to it"""
+        binary_file = open(path, 'wb')
+        binary_file.write(FILE_HEADER.pack(BINARY_MAGIC, self.clock_offset_ns))
+        with self._output_lock:
+            previous, self.binary_file = self.binary_file, binary_file
+            self.defined = set()
+        if previous is not None:
+            previous.close()
+
+    def enabled(self, level) -> bool:
+        return level >= self.level
+
+    def log(self, event, *args):
+        if event.level < self.level:
+            return
+        self.queue.put((time.monotonic_ns(), event, args))
+
+    def run(self):
+        while self.running or self.queue:
+            batch = self.queue.drain(DRAIN_BATCH, timeout=0.2)
+            if not batch:
+                continue
+            try:
+                with self._output_lock:
+                    if self.binary_file is not None:
+                        self.write_binary(batch)
+                    else:
+                        self.write_text(batch)
+            except Exception as e:
+                sys.__stderr__.write(f"Log writer failed: {str(e)}\n")
+
+    def write_text(self, batch):
+        stream = self.stream or sys.stdout
+        offset = self.clock_offset_ns
+        stream.write("".join(format_record(mono_ns + offset, event, args) for mono_ns, event, args in batch))
+        stream.flush()
+
+    def write_binary(self, batch):
+        out = bytearray()
+        for mono_ns, event, args in batch:
+            if event.event_id not in self.defined:
+                self.defined.add(event.event_id)
+                definition = encode_args((event.event_id, event.level, event.fmt))
+                out += RECORD_HEADER.pack(DEFINE_EVENT_ID, mono_ns, len(definition)) + definition
+            data = encode_args(args)
+            out += RECORD_HEADER.pack(event.event_id, mono_ns, len(data)) + data
+        self.binary_file.write(out)
+        self.binary_file.flush()
+
+    def close(self):
+        """Write out everything queued and stop the writer thread"""
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join()
+        if self.binary_file is not None:
+            self.binary_file.close()
+            self.binary_file = None
+
+
+def read_binary(path):
+    """Yield (wall ns, level, format, args) for every record of a binary log"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, clock_offset_ns = FILE_HEADER.unpack_from(data, 0)
+    if magic != BINARY_MAGIC:
+        raise ValueError(f"{path} is not a binary backend log")
+    events = {}
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        event_id, mono_ns, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            break  # Truncated by an interrupted writer
+        args = decode_args(data[offset:offset + length])
+        offset += length
+        if event_id == DEFINE_EVENT_ID:
+            defined_id, level, fmt = args
+            events[defined_id] = LogEvent(defined_id, level, fmt)
+            continue
+        event = events.get(event_id) or LogEvent(event_id, INFO, f"<event {event_id}>")
+        yield mono_ns + clock_offset_ns, event.level, event.fmt, args
+
+
+def render_binary(path, stream=None, level=DEBUG):
+    """Write a binary log as text lines"""
+    stream = stream or sys.stdout
+    for wall_ns, event_level, fmt, args in read_binary(path):
+        if event_level >= level:
+            stream.write(format_record(wall_ns, LogEvent(0, event_level, fmt), args))
+
+
+def parse_level(name) -> int:
+    for level, level_name in LEVEL_NAMES.items():
+        if level_name == str(name).upper():
+            return level
+    return int(name)
+
+
+_default_logger = None
+_default_lock = threading.Lock()
+
+
+def get_logger() -> BackendLogger:
+    """Process wide logger, text to stdout at INFO unless configure_logger() ran first"""
+    global _default_logger
+    with _default_lock:
+        if _default_logger is None:
+            _default_logger = BackendLogger()
+            atexit.register(_default_logger.close)
+        return _default_logger
+
+
+def configure_logger(level=INFO, binary_path=None) -> BackendLogger:
+    """Set the level and output of the process wide logger in place"""
+    logger = get_logger()
+    logger.level = level
+    if binary_path is not None:
+        logger.open_binary(binary_path)
+    return logger
+
+
+def configure_from_args(args) -> BackendLogger:
+    """Remove --log-level LEVEL and --log-binary PATH from args and apply them to the process wide logger"""
+    level, binary_path = INFO, None
+    for option in ("--log-level", "--log-binary"):
+        if option in args:
+            i = args.index(option)
+            if i + 1 >= len(args):
+                raise ValueError(f"{option} needs a value")
+            value = args[i + 1]
+            del args[i:i + 2]
+            if option == "--log-level":
+                level = parse_level(value)
+            else:
+                binary_path = value
+    return configure_logger(level, binary_path)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python backend_log.py <binary log> [level]")
+        sys.exit(1)
+    render_binary(sys.argv[1], level=parse_level(sys.argv[2]) if len(sys.argv) > 2 else DEBUG)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,228 @@
+import dataclasses
+import functools
 import socket
+import struct
 import sys
 import threading
 import time
-from datetime import datetime
+from collections import OrderedDict
+from backend_log import DEBUG, WARNING, ERROR, define_event, get_logger, configure_from_args
+from metrics import default_registry, serve_from_args
+from seq_window import ACCEPTED, DUPLICATE, OPEN_STRUCT, ReceiveWindow, encode_ack
+from tcp_common import (recv_message, pack_message, HEADER_SIZE, LOGGING_MSG_TYPE, EVENT_RECEIVED_MESSAGE_TYPE,
+                        READY_MESSAGE_TYPE, STATS_REQUEST_MESSAGE_TYPE, STATS_RESPONSE_MESSAGE_TYPE,
+                        PIPELINE_OPEN_MESSAGE_TYPE, PIPELINE_ACK_MESSAGE_TYPE, COMMAND_MESSAGE_TYPE,
+                        HANDSHAKE_RESPONSES, START_CONFIG_MESSAGE_TYPE, END_CONFIG_MESSAGE_TYPE)
+from event_ring_buffer import EventRingBuffer
+from recorder import StreamRecorder
+from scheduler import default_scheduler
+from session_table import SessionTable
 
-def get_timestamp():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]  # Include milliseconds
+EVENT_READY_DELAY = 30.0  # Seconds after an EVENT until READY is sent
+READY_RETRY_DELAY = 1.0
+EVENT_DEBOUNCE = 0.5  # EVENTs closer together than this are coalesced into one
+PUSH_SEND_TIMEOUT = 1.0  # A controller that stops reading cannot stall the sender for longer
+PIPELINE_ACK_EVERY = 16  # In-order frames acknowledged together
+PIPELINE_ACK_DELAY = 0.005  # Longest an in-order frame waits for its acknowledgement
+MAX_PIPELINE_SESSIONS = 64  # Sessions kept for reconnecting controllers, least recently opened dropped first
+SESSION_GRACE = 10.0  # Seconds a STARTED lockstep session outlives its connection, waiting for a reconnect
+# A new connection resumes a detached lockstep session only if its first SequenceNumber follows the session's
+# last one by at most this much (the controller numbers the frames to all its backends from one counter)
+RESUME_SEQUENCE_SPAN = 1024
+
+# SO_SNDTIMEO value for PUSH_SEND_TIMEOUT: Windows takes DWORD milliseconds, POSIX a struct timeval
+if sys.platform == 'win32':
+    SEND_TIMEOUT_OPTION = int(PUSH_SEND_TIMEOUT * 1000)
+else:
+    SEND_TIMEOUT_OPTION = struct.pack('ll', int(PUSH_SEND_TIMEOUT), int(PUSH_SEND_TIMEOUT % 1 * 1e6))
+
+log = get_logger()
+
+metrics = default_registry()
+FRAMES_RECEIVED = metrics.counter("backend_frames_received_total", "Frames received", ("backend", "message_type"))
+BYTES_RECEIVED = metrics.counter("backend_bytes_received_total", "Frame bytes received, header included",
+                                 ("backend", "message_type"))
+FRAMES_SENT = metrics.counter("backend_frames_sent_total", "Frames pushed to the controller", ("backend", "message_type"))
+BYTES_SENT = metrics.counter("backend_bytes_sent_total", "Frame bytes pushed to the controller", ("backend", "message_type"))
+SEND_FAILURES = metrics.counter("backend_send_failures_total", "Pushes to the controller that failed", ("backend",))
+ACTIVE_TIMERS = metrics.gauge("scheduler_active_timers", "Timers pending on the backend scheduler", ("backend",))
+EVENT_BUFFER_BYTES = metrics.gauge("backend_event_buffer_bytes", "Payload bytes held by the event ring buffer",
+                                   ("backend",))
+EVENT_BUFFER_DROPPED = metrics.gauge("backend_event_buffer_dropped", "Messages evicted by the event buffer byte budget",
+                                     ("backend",))
+RECORDER_QUEUE_DEPTH = metrics.gauge("backend_recorder_queue_depth", "Payloads waiting for the recorder thread",
+                                     ("backend",))
+RECORDER_DROPPED = metrics.gauge("backend_recorder_dropped", "Payloads dropped by the current recorder", ("backend",))
+PIPELINE_OUT_OF_ORDER = metrics.counter("backend_pipeline_out_of_order_total",
+                                        "Pipelined frames received ahead of a sequence gap", ("backend",))
+PIPELINE_DUPLICATES = metrics.counter("backend_pipeline_duplicates_total", "Duplicate pipelined frames suppressed",
+                                      ("backend",))
+SESSIONS = metrics.gauge("backend_sessions", "Controller sessions", ("backend",))
+STARTED_SESSIONS = metrics.gauge("backend_started_sessions", "Controller sessions in STARTED", ("backend",))
+SEQUENCE_REGRESSIONS = metrics.counter("backend_sequence_regressions_total",
+                                       "Commands whose SequenceNumber did not increase within their session",
+                                       ("backend",))
+LOG_DROPPED = metrics.gauge("backend_log_dropped", "Log records dropped because the log queue was full")
+LOG_DROPPED.set_function(lambda: log.dropped)
+
+# Log statements; formatting happens on the log writer thread
+LOG_STARTING = define_event("Backend starting on ports {}")
+LOG_LISTENING = define_event("Listening for connections on port {}...")
+LOG_SHUTTING_DOWN = define_event("Server on port {} shutting down...")
+LOG_PORT_ERROR = define_event("Error on port {}: {}", ERROR)
+LOG_SERVER_ERROR = define_event("Server error on port {}: {}", ERROR)
+LOG_PERSISTENT_CONNECTION = define_event("Persistent connection from {} on port {}")
+LOG_CONNECTION_ERROR = define_event("Error on connection {} port {}: {}", ERROR)
+LOG_CONNECTION_CLOSED = define_event("Connection from {} on port {} closed")
+LOG_PUSH_FAILED = define_event("Failed to push MessageType {}: {}", WARNING)
+LOG_RECORDING = define_event("Recording {} streams to {}")
+LOG_EVENT_WINDOW = define_event("Event window complete: {} messages, {} bytes, {} dropped")
+LOG_READY_DUE = define_event("Event timer completed. Sending READY message to control app")
+LOG_READY_SENT = define_event("READY message sent successfully")
+LOG_READY_FAILED = define_event("Failed to send READY message: {}", WARNING)
+LOG_READY_RETRY = define_event("Will retry sending READY message in 1 second")
+LOG_MESSAGE = define_event("Message from {} on backend port {}: {}")
+LOG_STATE = define_event("Current state: {}", DEBUG)
+LOG_CONNECTION_FAIL = define_event("Connection failure reported by {} for backends: {}", WARNING)
+LOG_RESET = define_event("Resetting state to NOT STARTED")
+LOG_ERROR_RESET = define_event("Error message received, resetting state to NOT STARTED", WARNING)
+LOG_STATE_CHANGED = define_event("State changed to: {}")
+LOG_ALREADY = define_event("Already in {} state")
+LOG_EVENT_RECEIVED = define_event("Event received while STARTED")
+LOG_EVENT_COALESCED = define_event("Event coalesced with the previous one")
+LOG_EVENT_TIMER = define_event("Starting 30-second event timer")
+LOG_EVENT_ACK_SENT = define_event("Event receipt acknowledgment sent")
+LOG_EVENT_ACK_FAILED = define_event("Failed to send event acknowledgment: {}", WARNING)
+LOG_EVENT_IGNORED = define_event("Event ignored - not in STARTED state")
+LOG_UNKNOWN_TYPE = define_event("No handler for MessageType {} from {}", WARNING)
+LOG_UNKNOWN_COMMAND = define_event("Unknown command: {}", WARNING)
+LOG_CONFIG = define_event("{} config from {}: directory '{}', {} logging files")
+LOG_END_CONFIG = define_event("END config from {}")
+LOG_BAD_FRAME = define_event("Dropped MessageType {} frame from {}: {}", WARNING)
+LOG_PIPELINE_OPEN = define_event("Pipelined session {:016x} {} at sequence {} (window {})")
+LOG_SESSION_CLOSED = define_event("Controller gone while STARTED; ending its session")
+LOG_SESSION_DETACHED = define_event("Connection from {} closed while STARTED; keeping its session for {} s")
+LOG_SESSION_RESUMED = define_event("Session resumed by a new connection from {}")
+LOG_CONFIG_CONFLICT = define_event("START config from {} differs from the active recording ({}); keeping the active one",
+                                   WARNING)
+LOG_SEQUENCE_REGRESSION = define_event("SequenceNumber {} from {} does not follow {}", DEBUG)
+
+
+class SocketChannel:
+    """Thread-safe sender for notifications on an accepted persistent connection"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.closed = False
+        self.pipeline = None  # PipelineSession carried by this connection
+        # Bound sendall without putting a timeout on the reader's recv
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, SEND_TIMEOUT_OPTION)
+
+    def send(self, data):
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                # Part of the frame may be on the wire; anything sent after it would break the framing
+                self.closed = True
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)  # Also ends the reader, which cleans up the connection
+                except OSError:
+                    pass
+                raise
+
+    def close(self):
+        self.closed = True
+
+
+class PipelineSession:
+    """Receive state of one pipelined controller session and the connection currently carrying it"""
+
+    def __init__(self, session_id, window):
+        self.session_id = session_id
+        self.window = window
+        self.channel = None
+        self.lock = threading.Lock()
+        self.unacked_frames = 0  # Delivered since the last acknowledgement
+        self.ack_timer = None
 
 class BackendProcess:
-    def __init__(self, ports):
+    def __init__(self, ports, persistent=False, scheduler=None, event_debounce=EVENT_DEBOUNCE, reuse_port=False,
+                 session_grace=SESSION_GRACE):
         self.ports = ports  # List of two ports
         self.host = 'localhost'
+        self.persistent = persistent  # Keep connections open and read header-framed messages
+        self.reuse_port = reuse_port  # Share the ports with other worker processes (SO_REUSEPORT)
         self.running = False
-        self.is_started = False
-        self.event_timer = None
-        self.last_client_addr = None
-        self.server_sockets = [None, None]  # Store server sockets
+        self.coordinator = None  # Shares state changes with sibling workers, see backend_supervisor
+        self.record_suffix = ""  # Appended to recorded file names
+        self.active_connections = 0
+        self.connections_lock = threading.Lock()
+        self.scheduler = scheduler or default_scheduler()  # Owns every deadline of this backend
+        self.event_debounce = event_debounce
+        self.session_grace = session_grace
+        # START/END, EVENT and READY are tracked per controller; see session_key
+        self.sessions = SessionTable()
+        self.detached = {}  # Host -> STARTED lockstep sessions whose connection closed, see channel_closed
+        self.detached_lock = threading.Lock()
+        self.started_sessions = 0  # Recording runs while any session is STARTED
+        self.remote_started = False  # Sessions on sibling workers are STARTED, as reported by the supervisor
+        self.recording_config = None  # DataRecordConfigMsg being recorded
+        self.state_lock = threading.Lock()  # Guards started_sessions, remote_started and the recording
+        self.server_sockets = [None] * len(ports)  # Store server sockets
+        # Pre/post event recording window, sized by history_time/follow_time of the config
+        self.event_buffer = EventRingBuffer(writer=self.write_event_window, scheduler=self.scheduler)
+        self.recorder = None  # StreamRecorder while recording
+        self.pipelines = OrderedDict()  # Session id -> PipelineSession
+        self.pipeline_lock = threading.Lock()
+        self.metrics_label = str(ports[0])
+        self.register_metrics()
+        # MessageType -> handler(header, body, addr, channel)
+        self.handlers = {
+            COMMAND_MESSAGE_TYPE: self.handle_command,
+            LOGGING_MSG_TYPE: self.handle_logging,
+            STATS_REQUEST_MESSAGE_TYPE: self.handle_stats_request,
+            START_CONFIG_MESSAGE_TYPE: self.handle_start_config,
+            END_CONFIG_MESSAGE_TYPE: self.handle_end_config,
+        }
+        for request_type in HANDSHAKE_RESPONSES:
+            self.handlers[request_type] = self.handle_handshake
+        for message_type, handler in MESSAGE_HANDLERS.items():
+            self.handlers[message_type] = functools.partial(handler, self)
+        # Text command -> handler(message, addr, channel, sequence_number)
+        self.commands = {
+            "START": self.command_start,
+            "END": self.command_end,
+            "EVENT": self.command_event,
+            "ERROR": self.command_error,
+            "CONNECTION_FAIL": self.command_connection_fail,
+        }
         
+    def register_metrics(self):
+        labels = (self.metrics_label,)
+        ACTIVE_TIMERS.set_function(lambda: self.scheduler.active_timers, labels)
+        EVENT_BUFFER_BYTES.set_function(lambda: self.event_buffer.held_bytes, labels)
+        EVENT_BUFFER_DROPPED.set_function(lambda: self.event_buffer.dropped, labels)
+        RECORDER_QUEUE_DEPTH.set_function(lambda: len(self.recorder.queue) if self.recorder else 0, labels)
+        RECORDER_DROPPED.set_function(lambda: self.recorder.dropped if self.recorder else 0, labels)
+        SESSIONS.set_function(lambda: len(self.sessions), labels)
+        STARTED_SESSIONS.set_function(lambda: self.started_sessions, labels)
+
+    @property
+    def is_started(self):
+        """Any controller session, here or on a sibling worker, is STARTED"""
+        return self.started_sessions > 0 or self.remote_started
+
     def start_server(self):
-        print(f"[{get_timestamp()}] Backend starting on ports {self.ports[0]}, {self.ports[1]}")
+        log.log(LOG_STARTING, ', '.join(str(port) for port in self.ports))
+        self.running = True
         
         # Create and start server threads for each port
         server_threads = []
-        for i in range(2):
+        for i in range(len(self.ports)):
             thread = threading.Thread(target=self.run_server, args=(i,))
             thread.daemon = True
             thread.start()
@@ -36,125 +236,589 @@ class BackendProcess:
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
                 server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.reuse_port:
+                    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
                 server_socket.bind((self.host, self.ports[socket_index]))
                 server_socket.listen()
                 self.server_sockets[socket_index] = server_socket
                 
-                print(f"[{get_timestamp()}] Listening for connections on port {self.ports[socket_index]}...")
+                log.log(LOG_LISTENING, self.ports[socket_index])
                 
-                while True:
+                while self.running:
                     try:
                         client_socket, addr = server_socket.accept()
                         if socket_index == 0:  # Only store client address from first socket
-                            self.last_client_addr = addr
+                            self.remember_client(addr)
+                        if self.persistent:
+                            thread = threading.Thread(target=self.serve_connection,
+                                                      args=(client_socket, addr, socket_index))
+                            thread.daemon = True
+                            thread.start()
+                            continue
                         with client_socket:
                             message = client_socket.recv(1024).decode()
                             self.handle_message(message, addr)
                     except KeyboardInterrupt:
-                        print(f"\n[{get_timestamp()}] Server on port {self.ports[socket_index]} shutting down...")
+                        log.log(LOG_SHUTTING_DOWN, self.ports[socket_index])
                         break
                     except Exception as e:
-                        print(f"[{get_timestamp()}] Error on port {self.ports[socket_index]}: {str(e)}")
+                        if not self.running:
+                            break  # shutdown() closed the listening socket
+                        log.log(LOG_PORT_ERROR, self.ports[socket_index], str(e))
         except Exception as e:
-            print(f"[{get_timestamp()}] Server error on port {self.ports[socket_index]}: {str(e)}")
+            log.log(LOG_SERVER_ERROR, self.ports[socket_index], str(e))
     
-    def send_ready_message(self):
-        timestamp = get_timestamp()
-        print(f"[{timestamp}] Event timer completed. Sending READY message to control app")
-        
+    def shutdown(self):
+        """Stop accepting connections; start_server() returns once the listeners are closed"""
+        self.running = False
+        for server_socket in self.server_sockets:
+            if server_socket is None:
+                continue
+            try:
+                server_socket.shutdown(socket.SHUT_RDWR)  # Wakes a blocked accept()
+            except OSError:
+                pass
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for open connections to finish, then flush the recorder"""
+        deadline = time.monotonic() + timeout
+        while self.active_connections and time.monotonic() < deadline:
+            time.sleep(0.1)
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+        self.event_buffer.close()
+
+    def serve_connection(self, client_socket, addr, socket_index):
+        """Handle a stream of ProtocolHeader framed messages until the peer disconnects"""
+        port = self.ports[socket_index]
+        log.log(LOG_PERSISTENT_CONNECTION, addr, port)
+        with self.connections_lock:
+            self.active_connections += 1
+        with client_socket:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            channel = SocketChannel(client_socket)
+            try:
+                while True:
+                    frame = recv_message(client_socket)
+                    if frame is None:
+                        break
+                    header, body = frame
+                    self.handle_frame(header, body, addr, channel)
+            except Exception as e:
+                log.log(LOG_CONNECTION_ERROR, addr, port, str(e))
+            finally:
+                self.channel_closed(channel, addr)
+                with self.connections_lock:
+                    self.active_connections -= 1
+        log.log(LOG_CONNECTION_CLOSED, addr, port)
+
+    def channel_closed(self, channel, addr):
+        channel.close()
+        pipeline = getattr(channel, 'pipeline', None)
+        if pipeline is not None:
+            # A pipelined controller resumes its session by id
+            with pipeline.lock:
+                if pipeline.channel is channel:
+                    pipeline.channel = None
+            return
+        # A lockstep controller's session is its connection. A STARTED one is kept for session_grace
+        # seconds, so a controller that replaces a broken connection carries on where it was
+        session = self.sessions.remove(channel)
+        if session is None:
+            return
+        if not session.is_started or self.session_grace <= 0:
+            self.close_session(session)
+            return
+        with session.lock:
+            session.channel = None
+        with self.detached_lock:
+            self.detached.setdefault(addr[0], []).append(session)
+            session.grace_timer = self.scheduler.call_later(self.session_grace, self.expire_session, addr[0],
+                                                            session)
+        log.log(LOG_SESSION_DETACHED, addr, self.session_grace)
+
+    def resume_session(self, channel, addr, sequence_number):
+        """Hand a session detached from addr's host to its new connection.
+
+        Only a session whose numbering the command continues is resumed, so another controller on the
+        same host gets a session of its own. Returns None if there is no such session.
+        """
+        with self.detached_lock:
+            waiting = self.detached.get(addr[0])
+            if not waiting:
+                return None
+            continued = [s for s in waiting if s.last_sequence is not None
+                         and 0 < sequence_number - s.last_sequence <= RESUME_SEQUENCE_SPAN]
+            if not continued:
+                return None
+            session = max(continued, key=lambda s: s.last_sequence)
+            waiting.remove(session)
+            if not waiting:
+                del self.detached[addr[0]]
+            session.grace_timer.cancel()
+            session.grace_timer = None
+        session.key = channel
+        self.sessions.add(session)
+        log.log(LOG_SESSION_RESUMED, addr)
+        return session
+
+    def expire_session(self, host, session):
+        with self.detached_lock:
+            waiting = self.detached.get(host, [])
+            if session not in waiting:
+                return  # Resumed meanwhile
+            waiting.remove(session)
+            if not waiting:
+                del self.detached[host]
+            session.grace_timer = None
+        self.close_session(session)
+
+    def notify(self, channel, message_type, sequence_number=0):
+        """Push a header-only notification to the controller over its open connection"""
+        return self.send_frame(channel, pack_message(message_type, sequence_number), message_type)
+
+    def send_frame(self, channel, package, message_type):
+        labels = (self.metrics_label, message_type)
+        try:
+            channel.send(package)
+        except Exception as e:
+            SEND_FAILURES.inc(1, labels[:1])
+            log.log(LOG_PUSH_FAILED, message_type, str(e))
+            return False
+        FRAMES_SENT.inc(1, labels)
+        BYTES_SENT.inc(len(package), labels)
+        return True
+
+    def handle_frame(self, header, body, addr, channel=None):
+        labels = (self.metrics_label, header.message_type)
+        FRAMES_RECEIVED.inc(1, labels)
+        BYTES_RECEIVED.inc(HEADER_SIZE + header.body_length, labels)
+        if header.message_type == PIPELINE_OPEN_MESSAGE_TYPE:
+            self.open_pipeline(body, channel)
+            return
+        session = getattr(channel, 'pipeline', None)
+        if session is not None:
+            self.receive_pipelined(session, header, body, addr, channel)
+            return
+        self.dispatch_frame(header, body, addr, channel)
+
+    def open_pipeline(self, body, channel):
+        """Start a session, or resume it on a new connection, and report what has been received so far"""
+        if channel is None or len(body) < OPEN_STRUCT.size:
+            return
+        session_id, first_sequence, size = OPEN_STRUCT.unpack_from(body, 0)
+        evicted = []
+        with self.pipeline_lock:
+            session = self.pipelines.get(session_id)
+            resumed = session is not None
+            if session is None:
+                session = self.pipelines[session_id] = PipelineSession(session_id, ReceiveWindow(first_sequence, size))
+                while len(self.pipelines) > MAX_PIPELINE_SESSIONS:
+                    evicted.append(self.pipelines.popitem(last=False)[1])
+            else:
+                self.pipelines.move_to_end(session_id)
+        for pipeline in evicted:
+            self.end_session(pipeline)
+        with session.lock:
+            window = session.window
+            window.size = size
+            if first_sequence > window.next_expected:
+                # The controller no longer holds anything before first_sequence
+                window.next_expected = first_sequence
+                window.pending = {s: item for s, item in window.pending.items() if s > first_sequence}
+            session.channel = channel
+        channel.pipeline = session
+        log.log(LOG_PIPELINE_OPEN, session_id, "resumed" if resumed else "opened", window.next_expected, size)
+        self.send_pipeline_ack(session)
+
+    def receive_pipelined(self, session, header, body, addr, channel):
+        """Deliver frames in SequenceNumber order, once each, and acknowledge them"""
+        with session.lock:
+            status, ready = session.window.receive(header.sequence_number, (header, body))
+            # Delivered under the lock so a reconnect racing this connection cannot reorder frames
+            for ready_header, ready_body in ready:
+                self.dispatch_frame(ready_header, ready_body, addr, channel)
+            session.unacked_frames += len(ready)
+            ack_now = status != ACCEPTED or session.unacked_frames >= PIPELINE_ACK_EVERY
+            if not ack_now and session.ack_timer is None:
+                session.ack_timer = self.scheduler.call_later(PIPELINE_ACK_DELAY, self.send_pipeline_ack, session)
+        if status != ACCEPTED:
+            counter = PIPELINE_DUPLICATES if status == DUPLICATE else PIPELINE_OUT_OF_ORDER
+            counter.inc(1, (self.metrics_label,))
+        if ack_now:
+            self.send_pipeline_ack(session)
+
+    def send_pipeline_ack(self, session):
+        with session.lock:
+            if session.ack_timer is not None:
+                session.ack_timer.cancel()
+                session.ack_timer = None
+            session.unacked_frames = 0
+            window = session.window
+            package = pack_message(PIPELINE_ACK_MESSAGE_TYPE, window.cumulative_ack, encode_ack(window.selective_acks()))
+            channel = session.channel
+        if channel is not None:
+            self.send_frame(channel, package, PIPELINE_ACK_MESSAGE_TYPE)
+
+    def register_handler(self, message_type, handler):
+        """Route frames of message_type to handler(header, body, addr, channel); body is a memoryview"""
+        self.handlers[message_type] = handler
+
+    def register_command(self, name, handler):
+        """Route text command name (the part before any ':') to handler(message, addr, channel, sequence_number)"""
+        self.commands[name] = handler
+
+    def dispatch_frame(self, header, body, addr, channel=None):
+        handler = self.handlers.get(header.message_type)
+        if handler is None:
+            log.log(LOG_UNKNOWN_TYPE, header.message_type, addr)
+            return
+        try:
+            handler(header, memoryview(body), addr, channel)
+        except Exception as e:
+            # The frame was read whole, so the connection is still in step; only this frame is lost
+            log.log(LOG_BAD_FRAME, header.message_type, addr, f"{type(e).__name__}: {e}")
+
+    def handle_logging(self, header, body, addr, channel):
+        self.event_buffer.append(body, header)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write_frame(body, header)
+
+    def handle_stats_request(self, header, body, addr, channel):
+        if channel is not None:
+            stats = metrics.render().encode('utf-8')
+            self.send_frame(channel, pack_message(STATS_RESPONSE_MESSAGE_TYPE, header.sequence_number, stats),
+                            STATS_RESPONSE_MESSAGE_TYPE)
+
+    def handle_handshake(self, header, body, addr, channel):
+        # Each handshake request is answered with its response type, echoing the SequenceNumber
+        if channel is not None:
+            response_type = HANDSHAKE_RESPONSES[header.message_type]
+            self.send_frame(channel, pack_message(response_type, header.sequence_number), response_type)
+
+    def handle_start_config(self, header, body, addr, channel):
+        config = decode_config(header, body)
+        log.log(LOG_CONFIG, "START", addr, config.logging_directory_path, len(config.logging_file_list))
+        self.command_start("START", addr, channel, header.sequence_number, config)
+
+    def handle_end_config(self, header, body, addr, channel):
+        log.log(LOG_END_CONFIG, addr)
+        self.command_end("END", addr, channel, header.sequence_number)
+
+    def handle_command(self, header, body, addr, channel):
+        # Text commands (START, END, EVENT, ...) are carried as the frame body
+        self.handle_message(bytes(body).decode(), addr, channel, header.sequence_number)
+
+    def configure_recording(self, history_time, follow_time):
+        self.event_buffer.configure(history_time, follow_time)
+
+    def start_recording(self, config, publish=True):
+        """Start writing enabled LoggingFile streams as described by a DataRecordConfigMsg"""
+        self.stop_recording()
+        self.configure_recording(config.history_time, config.follow_time)
+        self.recorder = StreamRecorder.from_config(config, file_suffix=self.record_suffix)
+        self.recording_config = config
+        log.log(LOG_RECORDING, len(self.recorder.logging_files), self.recorder.directory)
+        if publish:
+            self.publish("record", config)
+
+    def publish(self, operation, *args):
+        """Tell sibling worker processes about a state change made here"""
+        if self.coordinator is not None:
+            self.coordinator.publish(operation, *args)
+
+    def apply_remote(self, operation, args):
+        """Apply a state change published by a sibling worker"""
+        # Sessions stay with the worker their connection landed on; the supervisor only tells each worker
+        # whether any other worker has STARTED sessions
+        if operation == "start":
+            with self.state_lock:
+                self.remote_started = True
+        elif operation == "reset":
+            with self.state_lock:
+                self.remote_started = False
+                if not self.started_sessions:
+                    self.stop_recording()
+        elif operation == "event":
+            # Every worker captures its own connections' data around the EVENT; READY comes from the receiver
+            self.event_buffer.trigger()
+        elif operation == "record":
+            with self.state_lock:
+                self.start_recording(args[0], publish=False)
+
+    def stop_recording(self):
+        self.recording_config = None
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            # Flushing can wait on the disk; keep it off the receive path
+            threading.Thread(target=recorder.close, daemon=True).start()
+
+    def write_event_window(self, window):
+        total_bytes = sum(msg.size for msg in window.messages)
+        log.log(LOG_EVENT_WINDOW, len(window.messages), total_bytes, window.dropped)
+
+    def remember_client(self, addr):
+        # Legacy mode: READY is dialled back to the controller's last connection on the first port
+        if not self.persistent:
+            self.sessions.get_or_create(addr[0]).client_addr = addr
+
+    def session_key(self, addr, channel):
+        # A pipelined controller keeps its session across reconnects and a lockstep one is its
+        # connection; connect-per-message (legacy) controllers can only be told apart by host
+        if channel is None:
+            return addr[0]
+        pipeline = getattr(channel, 'pipeline', None)
+        return pipeline if pipeline is not None else channel
+
+    def session_for(self, addr, channel, sequence_number):
+        """The sender's session, created (or resumed, see channel_closed) on its first command"""
+        key = self.session_key(addr, channel)
+        session = self.sessions.get(key)
+        if session is None and channel is not None and key is channel and self.detached:
+            session = self.resume_session(channel, addr, sequence_number)
+        if session is None:
+            session = self.sessions.get_or_create(key)
+        if channel is not None:
+            with session.lock:
+                last = session.last_sequence
+                session.last_sequence = sequence_number
+                session.channel = channel
+            if last is not None and sequence_number <= last:
+                SEQUENCE_REGRESSIONS.inc(1, (self.metrics_label,))
+                log.log(LOG_SEQUENCE_REGRESSION, sequence_number, addr, last)
+        return session
+
+    @staticmethod
+    def session_channel(session):
+        # A pipelined session is pushed to on whichever connection carries it now
+        if isinstance(session.key, PipelineSession):
+            return session.key.channel
+        return session.channel
+
+    def end_session(self, key):
+        """Forget a controller that is gone; a STARTED session ends as if it had sent END"""
+        session = self.sessions.remove(key)
+        if session is not None:
+            self.close_session(session)
+
+    def close_session(self, session):
+        if session.is_started:
+            log.log(LOG_SESSION_CLOSED)
+        self.reset_state(session)
+
+    def cancel_event_timer(self, session):
+        # Called with session.lock held
+        if session.event_timer is not None:
+            session.event_timer.cancel()
+            session.event_timer = None
+
+    def send_ready_message(self, session):
+        log.log(LOG_READY_DUE)
+
+        with session.lock:
+            session.event_timer = None
+            channel = self.session_channel(session)
+            client_addr = session.client_addr
+        if channel is not None:
+            # Persistent connections: push over the socket the controller is already reading
+            if self.notify(channel, READY_MESSAGE_TYPE):
+                log.log(LOG_READY_SENT)
+            return
+
+        if self.persistent:
+            # A session between connections; pushed once it has resumed
+            log.log(LOG_READY_FAILED, "Session has no connection")
+            self.retry_ready(session)
+            return
+        # Legacy connect-per-message mode: dial back to the controller. The connect can block, which
+        # the scheduler thread must not, so it runs on a thread of its own
+        threading.Thread(target=self.dial_ready, args=(session, client_addr), daemon=True).start()
+
+    def dial_ready(self, session, client_addr):
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.settimeout(1.0)  # Increase timeout for reliability
-                s.connect((self.last_client_addr[0], self.last_client_addr[1]))
+                s.connect((client_addr[0], client_addr[1]))
                 s.sendall("READY".encode())
-                print(f"[{timestamp}] READY message sent successfully")
+                log.log(LOG_READY_SENT)
         except Exception as e:
-            print(f"[{timestamp}] Failed to send READY message: {str(e)}")
-            # Try to resend after 1 second if failed
-            print(f"[{timestamp}] Will retry sending READY message in 1 second")
-            self.event_timer = threading.Timer(1.0, self.send_ready_message)
-            self.event_timer.start()
-            return
-        
-        self.event_timer = None
-    
-    def handle_message(self, message, addr):
-        timestamp = get_timestamp()
+            log.log(LOG_READY_FAILED, str(e))
+            self.retry_ready(session)
+
+    def retry_ready(self, session):
+        # Try to resend after 1 second if failed
+        with session.lock:
+            if session.is_started and session.event_timer is None:
+                log.log(LOG_READY_RETRY)
+                session.event_timer = self.scheduler.call_later(READY_RETRY_DELAY, self.send_ready_message, session)
+
+    def handle_message(self, message, addr, channel=None, sequence_number=0):
         port = addr[1]  # 클라이언트의 포트
         backend_port = self.ports[0] if port == 9090 else self.ports[1]  # 백엔드의 포트
-        print(f"[{timestamp}] Message from {addr} on backend port {backend_port}: {message}")
-        print(f"[{timestamp}] Current state: {'STARTED' if self.is_started else 'NOT STARTED'}")
-        
-        if message.startswith("CONNECTION_FAIL:"):
-            # Reset state to NOT STARTED when connection failure is detected
-            failed_backends = message.split(":")[1].split(",")
-            print(f"[{timestamp}] Connection failure detected on port {backend_port} from backends: {failed_backends}")
-            print(f"[{timestamp}] Resetting state to NOT STARTED")
-            self.is_started = False
-            # Cancel any pending event timer
-            if self.event_timer and self.event_timer.is_alive():
-                self.event_timer.cancel()
-                self.event_timer = None
+        log.log(LOG_MESSAGE, addr, backend_port, message)
+        log.log(LOG_STATE, 'STARTED' if self.is_started else 'NOT STARTED')
+
+        handler = self.commands.get(message.split(":", 1)[0])
+        if handler is None:
+            log.log(LOG_UNKNOWN_COMMAND, message)
             return
-            
-        if message == "ERROR":
-            # Reset state to NOT STARTED when error message is received
-            print(f"[{timestamp}] Error message received, resetting state to NOT STARTED")
-            self.is_started = False
+        handler(message, addr, channel, sequence_number)
+
+    def session_started(self, session, config=None, addr=None):
+        """Move session to STARTED; returns False if it already was.
+
+        Recording starts with the first STARTED session, here or on a sibling worker. The config of a
+        later START replaces the active one only if no other session is STARTED.
+        """
+        with session.lock:
+            changed = not session.is_started
+            session.is_started = True
+        with self.state_lock:
+            if changed:
+                self.started_sessions += 1
+            first = changed and self.started_sessions == 1
+            if config is not None:
+                active = self.recording_config
+                if active is None or (self.started_sessions == 1 and not self.remote_started):
+                    if active is None or not same_recording(config, active):
+                        self.start_recording(config)
+                elif not same_recording(config, active):
+                    log.log(LOG_CONFIG_CONFLICT, addr, active.logging_directory_path)
+        if first:
+            self.publish("start")
+        return changed
+
+    def reset_state(self, session):
+        """Move session to NOT STARTED; returns False if it already was.
+
+        Recording stops with the last STARTED session.
+        """
+        with session.lock:
+            was_started = session.is_started
+            session.is_started = False
             # Cancel any pending event timer
-            if self.event_timer and self.event_timer.is_alive():
-                self.event_timer.cancel()
-                self.event_timer = None
+            self.cancel_event_timer(session)
+        if not was_started:
+            return False
+        with self.state_lock:
+            self.started_sessions -= 1
+            last = self.started_sessions == 0
+            if last and not self.remote_started:
+                # Under the lock, so a session starting concurrently records after this stop
+                self.stop_recording()
+        if last:
+            self.publish("reset")
+        return True
+
+    def command_connection_fail(self, message, addr, channel, sequence_number):
+        # Reset state to NOT STARTED when connection failure is detected
+        failed = message.partition(":")[2]
+        failed_backends = failed.split(",") if failed else []
+        log.log(LOG_CONNECTION_FAIL, addr, failed_backends)
+        log.log(LOG_RESET)
+        self.reset_state(self.session_for(addr, channel, sequence_number))
+
+    def command_error(self, message, addr, channel, sequence_number):
+        # Reset state to NOT STARTED when error message is received
+        log.log(LOG_ERROR_RESET)
+        self.reset_state(self.session_for(addr, channel, sequence_number))
+
+    def command_start(self, message, addr, channel, sequence_number, config=None):
+        if self.session_started(self.session_for(addr, channel, sequence_number), config, addr):
+            log.log(LOG_STATE_CHANGED, "STARTED")
+        else:
+            log.log(LOG_ALREADY, "STARTED")
+
+    def command_end(self, message, addr, channel, sequence_number):
+        if self.reset_state(self.session_for(addr, channel, sequence_number)):
+            log.log(LOG_STATE_CHANGED, "NOT STARTED")
+        else:
+            log.log(LOG_ALREADY, "NOT STARTED")
+
+    def command_event(self, message, addr, channel, sequence_number):
+        session = self.session_for(addr, channel, sequence_number)
+        now = time.monotonic()
+        with session.lock:
+            started = session.is_started
+            coalesced = (started and session.last_event_time is not None
+                         and now - session.last_event_time < self.event_debounce)
+            if started and not coalesced:
+                session.last_event_time = now
+                # Restart this controller's 30-second timer
+                if session.event_timer is None:
+                    session.event_timer = self.scheduler.call_later(EVENT_READY_DELAY, self.send_ready_message,
+                                                                    session)
+                else:
+                    self.scheduler.reschedule(session.event_timer, EVENT_READY_DELAY)
+        if not started:
+            log.log(LOG_EVENT_IGNORED)
             return
-            
-        if message == "START":
-            if not self.is_started:
-                self.is_started = True
-                print(f"[{timestamp}] State changed to: STARTED")
-            else:
-                print(f"[{timestamp}] Already in STARTED state")
-        elif message == "END":
-            if self.is_started:
-                self.is_started = False
-                print(f"[{timestamp}] State changed to: NOT STARTED")
-                # Cancel any pending event timer
-                if self.event_timer and self.event_timer.is_alive():
-                    self.event_timer.cancel()
-                    self.event_timer = None
-            else:
-                print(f"[{timestamp}] Already in NOT STARTED state")
-        elif message == "EVENT":
-            if self.is_started:
-                print(f"[{timestamp}] Event received while STARTED")
-                # Cancel existing timer if there is one
-                if self.event_timer and self.event_timer.is_alive():
-                    self.event_timer.cancel()
-                
-                # Start new 30-second timer
-                print(f"[{timestamp}] Starting 30-second event timer")
-                self.event_timer = threading.Timer(30.0, self.send_ready_message)
-                self.event_timer.start()
-                
-                # Send acknowledgment of event receipt
-                try:
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                        s.settimeout(0.5)
-                        s.connect((addr[0], addr[1]))
-                        s.sendall("EVENT_RECEIVED".encode())
-                        print(f"[{timestamp}] Event receipt acknowledgment sent")
-                except Exception as e:
-                    print(f"[{timestamp}] Failed to send event acknowledgment: {str(e)}")
-            else:
-                print(f"[{timestamp}] Event ignored - not in STARTED state")
+        log.log(LOG_EVENT_RECEIVED)
+        if coalesced:
+            log.log(LOG_EVENT_COALESCED)
+        else:
+            # Freeze the history window and capture follow_time more seconds
+            self.event_buffer.trigger()
+            self.publish("event")
+            log.log(LOG_EVENT_TIMER)
+
+        # Send acknowledgment of event receipt
+        if channel is not None:
+            if self.notify(channel, EVENT_RECEIVED_MESSAGE_TYPE, sequence_number):
+                log.log(LOG_EVENT_ACK_SENT)
+            return
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.settimeout(0.5)
+                s.connect((addr[0], addr[1]))
+                s.sendall("EVENT_RECEIVED".encode())
+                log.log(LOG_EVENT_ACK_SENT)
+        except Exception as e:
+            log.log(LOG_EVENT_ACK_FAILED, str(e))
+
+def same_recording(config, other):
+    """Configs that differ only in their frame header describe the same recording"""
+    return dataclasses.replace(config, header=other.header) == other
+
+
+def decode_config(header, body):
+    """Decode a DataRecordConfigMsg body in place; the header was already parsed from the frame"""
+    # Imported on first use: importing it compiles the codecs, and decoding pulls in NumPy
+    from data_record_config_msg import DataRecordConfigMsgHandler
+    msg, _ = DataRecordConfigMsgHandler().deserialize_body_view(body, 0)
+    msg.header = header
+    return msg
+
+
+# Handlers for additional MessageTypes: message_type -> handler(backend, header, body, addr, channel).
+# Every BackendProcess created afterwards routes those frames to them; see register_message_type.
+MESSAGE_HANDLERS = {}
+
+
+def register_message_type(message_type, handler):
+    MESSAGE_HANDLERS[message_type] = handler
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python backend_process.py <port1> <port2>")
+    args = sys.argv[1:]
+    persistent = '--persistent' in args
+    if persistent:
+        args.remove('--persistent')
+    try:
+        configure_from_args(args)
+        serve_from_args(args)
+    except (ValueError, OSError) as e:
+        print("Error: {}".format(str(e)))
+        sys.exit(1)
+    if len(args) != 2:
+        print("Usage: python backend_process.py <port1> <port2> [--persistent] [--log-level LEVEL] "
+              "[--log-binary PATH] [--metrics-port PORT]")
         print("Example: python backend_process.py 9090 9091")
         sys.exit(1)
     
     try:
-        ports = [int(sys.argv[1]), int(sys.argv[2])]
+        ports = [int(args[0]), int(args[1])]
         for port in ports:
             if port < 1024 or port > 65535:
                 raise ValueError("Port must be between 1024 and 65535")
@@ -162,7 +826,7 @@ def main():
         print("Error: {}".format(str(e)))
         sys.exit(1)
     
-    backend = BackendProcess(ports)
+    backend = BackendProcess(ports, persistent=persistent)
     try:
         backend.start_server()
     except KeyboardInterrupt:
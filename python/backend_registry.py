@@ -0,0 +1,110 @@
+import json
+import os
+
+DEFAULT_CONFIG_PATH = "backends.json"
+
+# Used when no config file is present
+DEFAULT_BACKENDS = [
+    {"name": "Backend 1", "host": "localhost", "control_port": 9090, "data_port": 9091, "group": "default"},
+    {"name": "Backend 2", "host": "localhost", "control_port": 9092, "data_port": 9093, "group": "default"},
+]
+
+
+def make_backend(name, host, control_port, data_port, group="default"):
+    """Create a backend entry in the dict layout used by ControlApp"""
+    return {
+        "name": name,
+        "host": host,
+        "ports": [int(control_port), int(data_port)],
+        "group": group,
+        "ready": False,
+    }
+
+
+def load_backend_config(path):
+    """Read backend definitions from a JSON file: {"backends": [{name, host, control_port, data_port, group}]}"""
+    with open(path) as f:
+        config = json.load(f)
+    entries = config["backends"] if isinstance(config, dict) else config
+    for entry in entries:
+        for key in ("name", "host", "control_port", "data_port"):
+            if key not in entry:
+                raise ValueError(f"Backend entry {entry} is missing '{key}'")
+    return entries
+
+
+class BackendRegistry:
+    """In-memory backend list with O(1) lookup by name and by (host, port)"""
+
+    def __init__(self, entries=()):
+        self.backends = []
+        self.by_name = {}
+        self.by_address = {}
+        self.index_by_name = {}
+        self.groups = {}
+        for entry in entries:
+            self.add(make_backend(entry["name"], entry["host"], entry["control_port"],
+                                  entry["data_port"], entry.get("group", "default")))
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_CONFIG_PATH):
+        """Load the registry from path, or fall back to the two default backends if it does not exist"""
+        if path and os.path.exists(path):
+            return cls(load_backend_config(path))
+        return cls(DEFAULT_BACKENDS)
+
+    def add(self, backend):
+        name = backend["name"]
+        if name in self.by_name:
+            raise ValueError(f"Duplicate backend name: {name}")
+        for port in backend["ports"]:
+            if (backend["host"], port) in self.by_address:
+                raise ValueError(f"Duplicate backend address: {backend['host']}:{port}")
+        self.index_by_name[name] = len(self.backends)
+        self.backends.append(backend)
+        self.by_name[name] = backend
+        self.groups.setdefault(backend["group"], []).append(backend)
+        self._index_address(backend)
+
+    def _index_address(self, backend):
+        for port in backend["ports"]:
+            self.by_address[(backend["host"], port)] = backend
+
+    def _unindex_address(self, backend):
+        for port in backend["ports"]:
+            if self.by_address.get((backend["host"], port)) is backend:
+                del self.by_address[(backend["host"], port)]
+
+    def set_host(self, name, host):
+        backend = self.by_name[name]
+        for port in backend["ports"]:
+            owner = self.by_address.get((host, port))
+            if owner is not None and owner is not backend:
+                raise ValueError(f"Duplicate backend address: {host}:{port}")
+        self._unindex_address(backend)
+        backend["host"] = host
+        self._index_address(backend)
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def index_of(self, name):
+        return self.index_by_name[name]
+
+    def find_by_address(self, host, port):
+        return self.by_address.get((host, port))
+
+    def group(self, group):
+        return self.groups.get(group, [])
+
+    def ready_backends(self):
+        return [backend for backend in self.backends if backend["ready"]]
+
+    def __iter__(self):
+        return iter(self.backends)
+
+    def __len__(self):
+        return len(self.backends)
+
+    def __getitem__(self, index):
+        return self.backends[index]
@@ -0,0 +1,331 @@
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+
+from backend_log import INFO, WARNING, ERROR, configure_from_args, configure_logger, define_event, get_logger
+
+DRAIN_TIMEOUT = 30.0  # Seconds a retiring worker keeps serving its open connections
+LISTEN_TIMEOUT = 10.0  # Seconds a new worker gets to bind its ports
+RESTART_BACKOFF = 1.0  # Minimum delay before replacing a worker that died
+MAX_STARTUP_FAILURES = 3  # Workers in a row that exit before listening before the supervisor gives up
+
+log = get_logger()
+
+LOG_SUPERVISOR_STARTING = define_event("Supervisor starting {} workers on ports {}")
+LOG_WORKER_STARTED = define_event("Worker {} started (pid {})")
+LOG_WORKER_EXITED = define_event("Worker {} (pid {}) exited with code {}", WARNING)
+LOG_WORKER_RETIRING = define_event("Worker {} (pid {}) draining")
+LOG_ROLLING_RESTART = define_event("Rolling restart of {} workers")
+LOG_SUPERVISOR_STOPPING = define_event("Supervisor stopping")
+LOG_PIPE_ERROR = define_event("Control pipe to worker {} failed: {}", ERROR)
+LOG_STARTUP_FAILED = define_event("Worker {} (pid {}) exited with code {} before binding its ports", ERROR)
+LOG_GIVING_UP = define_event("{} workers in a row failed to start; stopping", ERROR)
+LOG_LISTEN_FAILED = define_event("Worker {} (pid {}) did not bind its ports; keeping the worker it was to replace",
+                                 ERROR)
+
+
+class WorkerCoordinator:
+    """Worker end of the control pipe.
+
+    State changes made by this worker's BackendProcess are sent to the
+    supervisor, which forwards them to every other worker; changes arriving
+    from the supervisor are applied on a listener thread.
+    """
+
+    def __init__(self, conn, backend):
+        self.conn = conn
+        self.backend = backend
+        self.lock = threading.Lock()  # Connection threads publish concurrently
+        self.drain_timeout = None  # Set when the supervisor asks this worker to stop
+        self.thread = threading.Thread(target=self.run, name="worker-coordinator", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def publish(self, operation, *args):
+        with self.lock:
+            try:
+                self.conn.send((operation, args))
+            except (OSError, EOFError):
+                pass  # Supervisor gone; this worker keeps serving on its own
+
+    def run(self):
+        while True:
+            try:
+                operation, args = self.conn.recv()
+            except (OSError, EOFError):
+                operation, args = "drain", (0.0,)  # Supervisor gone; shut down
+            if operation == "drain":
+                self.drain_timeout = args[0]
+                self.backend.shutdown()
+                return
+            try:
+                self.backend.apply_remote(operation, args)
+            except Exception as e:
+                log.log(LOG_PIPE_ERROR, os.getpid(), str(e))
+
+
+def report_listening(backend, coordinator):
+    """Tell the supervisor once every port is bound, so the worker this one replaces can retire"""
+    deadline = time.monotonic() + LISTEN_TIMEOUT
+    while None in backend.server_sockets and time.monotonic() < deadline:
+        time.sleep(0.05)
+    coordinator.publish("listening" if None not in backend.server_sockets else "listen_failed")
+
+
+def run_worker(ports, worker_id, conn, persistent, state, log_level, log_binary):
+    """Entry point of a worker process"""
+    from backend_process import BackendProcess  # Imported in the child so nothing is shared with the parent
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The supervisor decides when workers stop
+    configure_logger(log_level, f"{log_binary}.w{worker_id}" if log_binary else None)
+    backend = BackendProcess(ports, persistent=persistent, reuse_port=True)
+    backend.record_suffix = f"_w{worker_id}"
+    coordinator = WorkerCoordinator(conn, backend)
+    backend.coordinator = coordinator
+    # Catch up with the state the other workers already have
+    if state.get("config") is not None:
+        backend.start_recording(state["config"], publish=False)
+    backend.remote_started = state.get("started", False)
+    coordinator.start()
+    threading.Thread(target=report_listening, args=(backend, coordinator), daemon=True).start()
+    backend.start_server()
+    backend.drain(coordinator.drain_timeout if coordinator.drain_timeout is not None else 0.0)
+    log.close()
+
+
+class Worker:
+    def __init__(self, worker_id, process, conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.conn = conn
+        self.retiring = False
+        self.replaces = None  # Worker to retire once this one is listening
+        self.listening = False  # Reported that every port is bound
+        self.remote_started = False  # Last told that other workers have STARTED sessions
+
+
+class BackendSupervisor:
+    """Runs one BackendProcess per worker process, all listening on the same ports.
+
+    The kernel spreads incoming connections over the workers (SO_REUSEPORT),
+    so receiving, parsing and recording use several cores. START/END/EVENT and
+    recording configs received by any worker are forwarded to all others
+    through per-worker control pipes. Each worker reports when its first
+    session STARTs and its last one ENDs; the supervisor tracks which workers
+    have STARTED sessions and tells every worker whether any other one has, so
+    recording stops only when no session on any worker is STARTED. It keeps
+    the recording config while one is, so replacement workers start
+    consistent. SIGHUP replaces the workers one by
+    one, each old worker draining its connections first; a worker that dies is
+    restarted. SIGTERM/SIGINT drain and stop everything.
+
+    The kernel picks the worker for every new connection, so a pipelined
+    controller that reconnects can land on a worker that does not have its
+    PipelineSession. That worker starts a new session at the controller's
+    first unacknowledged sequence; frames the old worker received but had not
+    acknowledged are then delivered a second time.
+    """
+
+    def __init__(self, ports, workers=None, persistent=True, log_level=INFO, log_binary=None,
+                 drain_timeout=DRAIN_TIMEOUT):
+        self.ports = ports
+        self.worker_count = workers or os.cpu_count() or 1
+        self.persistent = persistent
+        self.log_level = log_level
+        self.log_binary = log_binary
+        self.drain_timeout = drain_timeout
+        self.context = multiprocessing.get_context("spawn")  # Threads of this process must not be forked
+        self.workers = []
+        self.next_worker_id = 0
+        self.started_workers = set()  # Ids of the workers with STARTED sessions
+        self.config = None  # Recording config while any worker has STARTED sessions
+        self.stopping = False
+        self.restart_requested = False
+        self.startup_failures = 0  # Workers in a row that exited before listening
+        self.exit_code = 0
+
+    def spawn_worker(self):
+        parent_conn, child_conn = self.context.Pipe()
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        state = {"started": bool(self.started_workers), "config": self.config}
+        process = self.context.Process(
+            target=run_worker, name=f"backend-worker-{worker_id}",
+            args=(self.ports, worker_id, child_conn, self.persistent, state, self.log_level, self.log_binary))
+        process.start()
+        child_conn.close()
+        worker = Worker(worker_id, process, parent_conn)
+        worker.remote_started = state["started"]
+        self.workers.append(worker)
+        log.log(LOG_WORKER_STARTED, worker_id, process.pid)
+        return worker
+
+    def send(self, worker, message):
+        try:
+            worker.conn.send(message)
+        except (OSError, EOFError) as e:
+            log.log(LOG_PIPE_ERROR, worker.worker_id, str(e))
+
+    def retire(self, worker, timeout):
+        worker.retiring = True
+        log.log(LOG_WORKER_RETIRING, worker.worker_id, worker.process.pid)
+        self.send(worker, ("drain", (timeout,)))
+
+    def set_started(self, worker_id, started):
+        """Record whether worker_id has STARTED sessions and tell each worker if any other one has"""
+        if started:
+            self.started_workers.add(worker_id)
+        else:
+            self.started_workers.discard(worker_id)
+            if not self.started_workers:
+                self.config = None
+        for worker in self.workers:
+            remote_started = bool(self.started_workers - {worker.worker_id})
+            if remote_started != worker.remote_started:
+                worker.remote_started = remote_started
+                self.send(worker, ("start" if remote_started else "reset", ()))
+
+    def forward(self, source, message):
+        if message[0] == "listening":
+            source.listening = True
+            self.startup_failures = 0
+            if source.replaces is not None:
+                self.retire(source.replaces, self.drain_timeout)
+                source.replaces = None
+            return
+        if message[0] == "listen_failed":
+            # A worker that cannot accept connections goes; its exit is handled as a failed start
+            self.retire(source, 0.0)
+            return
+        operation, args = message
+        if operation in ("start", "reset"):
+            self.set_started(source.worker_id, operation == "start")
+            return
+        if operation == "record":
+            self.config = args[0]
+        for worker in self.workers:
+            if worker is not source:
+                self.send(worker, message)
+
+    def rolling_restart(self):
+        """Retire each worker only once its replacement is listening, so the ports are never unserved"""
+        current = [worker for worker in self.workers if not worker.retiring]
+        log.log(LOG_ROLLING_RESTART, len(current))
+        for worker in current:
+            self.spawn_worker().replaces = worker
+
+    def run(self):
+        log.log(LOG_SUPERVISOR_STARTING, self.worker_count, ', '.join(str(port) for port in self.ports))
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'restart_requested', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'stopping', True))
+        for _ in range(self.worker_count):
+            self.spawn_worker()
+        last_restart = {}
+        try:
+            while self.workers:
+                if self.restart_requested and not self.stopping:
+                    self.restart_requested = False
+                    self.rolling_restart()
+                if self.stopping:
+                    self.stop()
+                waitables = {}
+                for worker in self.workers:
+                    waitables[worker.conn] = worker
+                    waitables[worker.process.sentinel] = worker
+                for ready in wait(list(waitables), timeout=1.0):
+                    worker = waitables[ready]
+                    if ready is worker.conn:
+                        try:
+                            message = worker.conn.recv()
+                        except (OSError, EOFError):
+                            continue  # The sentinel reports the exit
+                        self.forward(worker, message)
+                        continue
+                    if worker not in self.workers:
+                        continue
+                    worker.process.join()
+                    self.workers.remove(worker)
+                    worker.conn.close()
+                    # Its sessions are gone with it
+                    self.set_started(worker.worker_id, False)
+                    if self.stopping or (worker.retiring and worker.listening):
+                        continue
+                    if worker.replaces is not None:
+                        # Exited before listening: the worker it was to replace keeps serving
+                        log.log(LOG_LISTEN_FAILED, worker.worker_id, worker.process.pid)
+                        continue
+                    if not worker.listening:
+                        # Most likely a port is taken; respawning would fail the same way forever
+                        log.log(LOG_STARTUP_FAILED, worker.worker_id, worker.process.pid, worker.process.exitcode)
+                        self.startup_failures += 1
+                        if self.startup_failures >= MAX_STARTUP_FAILURES:
+                            log.log(LOG_GIVING_UP, self.startup_failures)
+                            self.exit_code = 1
+                            self.stop()
+                            continue
+                    else:
+                        log.log(LOG_WORKER_EXITED, worker.worker_id, worker.process.pid, worker.process.exitcode)
+                    # Replace it, but do not spin if workers die right after starting
+                    delay = RESTART_BACKOFF - (time.monotonic() - last_restart.get(worker.worker_id, 0.0))
+                    if delay > 0:
+                        time.sleep(delay)
+                    last_restart[self.spawn_worker().worker_id] = time.monotonic()
+        except KeyboardInterrupt:
+            self.stop()
+            for worker in self.workers:
+                worker.process.join()
+        return self.exit_code
+
+    def stop(self):
+        """Drain every worker; run() returns once they have exited"""
+        active = [worker for worker in self.workers if not worker.retiring]
+        if active:
+            log.log(LOG_SUPERVISOR_STOPPING)
+        self.stopping = True
+        for worker in active:
+            self.retire(worker, self.drain_timeout)
+
+
+def main():
+    args = sys.argv[1:]
+    persistent = '--legacy' not in args
+    if not persistent:
+        args.remove('--legacy')
+    workers = None
+    try:
+        if '--workers' in args:
+            i = args.index('--workers')
+            workers = int(args[i + 1])
+            del args[i:i + 2]
+        # Each worker writes its own binary log, <PATH>.w<worker id>
+        log_binary = args[args.index('--log-binary') + 1] if '--log-binary' in args else None
+        log_level = configure_from_args(args).level
+    except (ValueError, IndexError) as e:
+        print("Error: {}".format(str(e)))
+        sys.exit(1)
+    if len(args) != 2:
+        print("Usage: python backend_supervisor.py <port1> <port2> [--workers N] [--legacy] [--log-level LEVEL] "
+              "[--log-binary PATH]")
+        print("Example: python backend_supervisor.py 9090 9091 --workers 4")
+        sys.exit(1)
+
+    try:
+        ports = [int(args[0]), int(args[1])]
+        for port in ports:
+            if port < 1024 or port > 65535:
+                raise ValueError("Port must be between 1024 and 65535")
+    except ValueError as e:
+        print("Error: {}".format(str(e)))
+        sys.exit(1)
+
+    sys.exit(BackendSupervisor(ports, workers=workers, persistent=persistent, log_level=log_level,
+                               log_binary=log_binary).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from metrics import percentile
+from tcp_common import pack_message
+
+LOGGING_FILE_COUNTS = [0, 10, 1000, 10000]
+HANDLED_TIMEOUT = 5.0  # Seconds a loopback round trip may take before the benchmark gives up
+
+
+def measure(name, func, iterations, params=None, warmup=None):
+    """Time func() per call and measure the peak memory allocated by a single call"""
+    if warmup is None:
+        warmup = max(1, iterations // 10)
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        t0 = clock()
+        func()
+        samples.append(clock() - t0)
+    elapsed = clock() - started
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "name": name,
+        "params": params or {},
+        "iterations": iterations,
+        "ops_per_sec": iterations / (elapsed / 1e9) if elapsed else 0.0,
+        "p50_us": percentile(samples, 0.50) / 1000,
+        "p99_us": percentile(samples, 0.99) / 1000,
+        "p999_us": percentile(samples, 0.999) / 1000,
+        "alloc_peak_bytes": peak - baseline,
+    }
+
+
+def bench_tcp_common(iterations):
+    from tcp_common import ProtocolHeader
+    header = ProtocolHeader()
+    now = time.time_ns()
+    return [measure("tcp_common.get_header_message",
+                    lambda: header.get_header_message(now, 1, 1, 0), iterations)]
+
+
+def make_config_msg(file_count):
+    from data_record_config_msg import DataRecordConfigMsg, Header, LoggingFile, MetaData
+    files = [LoggingFile(i, "1", f"cam{i}_", "_raw", "bin") for i in range(file_count)]
+    return DataRecordConfigMsg(
+        header=Header(time.time_ns(), 19, 1, 0),
+        logging_directory_path="/data/recording",
+        logging_mode=1,
+        history_time=10,
+        follow_time=20,
+        split_time=60,
+        data_length=0,
+        logging_file_list=files,
+        meta_data=MetaData({"vehicle": "test", "driver": "bench"}, "")
+    )
+
+
+def bench_data_record_config_msg(iterations):
+    from data_record_config_msg import DataRecordConfigMsgHandler, ProtocolHeader
+    results = []
+
+    header = ProtocolHeader(time.time_ns(), 19, 1, 0)
+    header_bytes = header.to_bytes()
+    results.append(measure("data_record_config_msg.ProtocolHeader.to_bytes", header.to_bytes, iterations))
+    results.append(measure("data_record_config_msg.ProtocolHeader.from_bytes",
+                           lambda: ProtocolHeader.from_bytes(header_bytes), iterations))
+
+    handler = DataRecordConfigMsgHandler()
+    for file_count in LOGGING_FILE_COUNTS:
+        msg = make_config_msg(file_count)
+        package = handler.make_package(msg)
+        # Keep total work per case roughly constant
+        case_iterations = max(10, iterations // max(1, file_count // 10))
+        params = {"logging_files": file_count, "package_bytes": len(package)}
+        results.append(measure("DataRecordConfigMsgHandler.make_package",
+                               lambda: handler.make_package(msg), case_iterations, params))
+        results.append(measure("DataRecordConfigMsgHandler.parsing_data",
+                               lambda: handler.parsing_data(package), case_iterations, params))
+    return results
+
+
+def free_port_pair():
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_STREAM) for _ in range(2)]
+    for s in sockets:
+        s.bind(('localhost', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def start_backend(persistent):
+    from backend_process import BackendProcess
+
+    class SignallingBackend(BackendProcess):
+        """Signals once a message has been fully handled"""
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.handled = threading.Semaphore(0)
+
+        def handle_message(self, *args, **kwargs):
+            try:
+                super().handle_message(*args, **kwargs)
+            finally:
+                self.handled.release()
+
+        def wait_handled(self):
+            if not self.handled.acquire(timeout=HANDLED_TIMEOUT):
+                raise RuntimeError(f"Backend did not handle the message within {HANDLED_TIMEOUT} s")
+
+    backend = SignallingBackend(free_port_pair(), persistent=persistent)
+    thread = threading.Thread(target=backend.start_server)
+    thread.daemon = True
+    thread.start()
+    deadline = time.monotonic() + 5.0
+    while not all(backend.server_sockets):
+        if time.monotonic() > deadline:
+            raise RuntimeError("Backend did not start listening")
+        time.sleep(0.01)
+    return backend
+
+
+def bench_loopback(iterations):
+    results = []
+    # END keeps the backend in NOT STARTED, so every message takes the same path
+    frame = pack_message(0, 1, b"END")
+
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        backend = start_backend(persistent=True)
+        client = socket.create_connection(('localhost', backend.ports[1]))
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def persistent_round_trip():
+            client.sendall(frame)
+            backend.wait_handled()
+            sink.seek(0)
+            sink.truncate()
+
+        results.append(measure("loopback.persistent_round_trip", persistent_round_trip, iterations))
+        client.close()
+
+        backend = start_backend(persistent=False)
+
+        def connect_per_message_round_trip():
+            with socket.create_connection(('localhost', backend.ports[1])) as s:
+                s.sendall(b"END")
+            backend.wait_handled()
+            sink.seek(0)
+            sink.truncate()
+
+        results.append(measure("loopback.connect_per_message_round_trip",
+                               connect_per_message_round_trip, max(10, iterations // 10)))
+    return results
+
+
+BENCHMARKS = {
+    "tcp_common": bench_tcp_common,
+    "data_record_config_msg": bench_data_record_config_msg,
+    "loopback": bench_loopback,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit', '?')}):")
+    for result in results:
+        old = previous.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if old is None or not old["ops_per_sec"]:
+            continue
+        change = (result["ops_per_sec"] / old["ops_per_sec"] - 1) * 100
+        print(f"  {result['name']} {result['params']}: {change:+.1f}% ops/s, "
+              f"p99 {old['p99_us']:.1f} -> {result['p99_us']:.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wire codec and loopback latency")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append",
+                        help="Run only the given group (can be repeated)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    parser.add_argument("--compare", help="Earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    results = []
+    skipped = {}
+    for group in args.only or list(BENCHMARKS):
+        try:
+            group_results = BENCHMARKS[group](args.iterations)
+        except ImportError as e:
+            skipped[group] = str(e)
+            print(f"Skipping {group}: {e}")
+            continue
+        for result in group_results:
+            print(f"{result['name']} {result['params'] or ''}: {result['ops_per_sec']:.0f} ops/s, "
+                  f"p50 {result['p50_us']:.1f} us, p99 {result['p99_us']:.1f} us, "
+                  f"p999 {result['p999_us']:.1f} us, peak alloc {result['alloc_peak_bytes']} B")
+        results.extend(group_results)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
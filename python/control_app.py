@@ -2,31 +2,90 @@ import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout, 
                            QWidget, QMessageBox, QLabel, QGridLayout, QLineEdit,
                            QGroupBox, QFormLayout)
-from PyQt5.QtCore import Qt, QTimer
-import socket
+from PyQt5.QtCore import Qt, QTimer, QObject, pyqtSignal
 import threading
-import time
-from tcp_common import ProtocolHeader
-import numpy as np
-import boost.python as bp
-from data_record_config_msg import DataRecordConfigMsgHandler, DataRecordConfigMsg, Header
+from concurrent.futures import ThreadPoolExecutor
+from backend_client import HANDSHAKE_TIMEOUT
+from backend_registry import DEFAULT_CONFIG_PATH
+from controller import Controller, EVENT_READY_TIMEOUT, HEALTH_CHECK_INTERVAL
+from data_record_config_msg import MetaData
+from metrics import serve_from_args
+
+
+HEALTH_CHECK_INTERVAL_MS = int(HEALTH_CHECK_INTERVAL * 1000)  # Liveness probe period for connected backends
+EVENT_READY_TIMEOUT_MS = int(EVENT_READY_TIMEOUT * 1000)  # Re-enable the event button if a READY never arrives
+
+
+class NotificationBridge(QObject):
+    """Moves backend notifications from the reader thread onto the GUI thread"""
+    message = pyqtSignal(str, int, int)  # backend name, MessageType, SequenceNumber
+    closed = pyqtSignal(str)  # backend name
+
+
+class HandshakeWorker(QObject):
+    """Runs backend handshakes concurrently on a thread pool and reports back through signals"""
+    backend_connected = pyqtSignal(int)  # backend index
+    backend_failed = pyqtSignal(int, str)  # backend index, error
+    finished = pyqtSignal()
+
+    def __init__(self, max_workers=32, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handshake")
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def is_running(self):
+        with self.lock:
+            return self.pending > 0
+
+    def start(self, jobs, timeout=HANDSHAKE_TIMEOUT):
+        """jobs: list of (backend index, BackendConnection, first sequence number)"""
+        if not jobs:
+            self.finished.emit()
+            return
+        with self.lock:
+            self.pending += len(jobs)
+        for index, connection, sequence_number in jobs:
+            self.executor.submit(self.run_handshake, index, connection, sequence_number, timeout)
+
+    def run_handshake(self, index, connection, sequence_number, timeout):
+        try:
+            connection.connect(sequence_number, timeout)
+            self.backend_connected.emit(index)
+        except Exception as e:
+            self.backend_failed.emit(index, str(e))
+        finally:
+            with self.lock:
+                self.pending -= 1
+                done = self.pending == 0
+            if done:
+                self.finished.emit()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+STATUS_COLUMNS = 4  # Status labels per row in the control panel
 
 
 class ControlApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, pipelined=False):
         super().__init__()
         self.setWindowTitle("Control Panel")
         
-        # TCP/IP settings for two backends
-        self.backends = [
-            {"host": "localhost", "ports": [9090, 9091], "name": "Backend 1", 
-             "ready": False, "sockets": [None, None]},
-            {"host": "localhost", "ports": [9092, 9093], "name": "Backend 2",
-             "ready": False, "sockets": [None, None]}
-        ]
+        # TCP/IP settings, loaded from the backend config file. Connecting and sending is done by the
+        # headless Controller; notifications it reads on its thread reach the GUI through the bridge.
+        self.notification_bridge = NotificationBridge(self)
+        self.controller = Controller(config_path, pipelined=pipelined,
+                                     on_message=self.notification_bridge.message.emit,
+                                     on_closed=self.notification_bridge.closed.emit,
+                                     on_disconnected=self.on_backend_disconnected)
+        self.controller.set_config(meta_data=MetaData({"a": "a", "b": "b"}, ""))
+        self.registry = self.controller.registry
+        self.backends = self.controller.backends
+        self.pool = self.controller.pool
         self.is_toggle_on = False
         self.event_sent = False
-        self.message_counter = 0
         
         # Create central widget and layout
         central_widget = QWidget()
@@ -89,8 +148,9 @@ class ControlApp(QMainWindow):
         for i, backend in enumerate(self.backends):
             label = QLabel(f"{backend['name']}: Not Connected")
             label.setStyleSheet("color: red; font-size: 32px;")
-            control_layout.addWidget(label, 0, i, alignment=Qt.AlignCenter)
+            control_layout.addWidget(label, i // STATUS_COLUMNS, i % STATUS_COLUMNS, alignment=Qt.AlignCenter)
             self.status_labels.append(label)
+        button_row = (len(self.backends) + STATUS_COLUMNS - 1) // STATUS_COLUMNS
         
         # Create buttons with larger font
         self.toggle_btn = QPushButton("Start")
@@ -132,8 +192,8 @@ class ControlApp(QMainWindow):
         self.event_btn.clicked.connect(self.send_event)
         
         # Add buttons to layout
-        control_layout.addWidget(self.toggle_btn, 1, 0, 1, 2, alignment=Qt.AlignCenter)
-        control_layout.addWidget(self.event_btn, 2, 0, 1, 2, alignment=Qt.AlignCenter)
+        control_layout.addWidget(self.toggle_btn, button_row, 0, 1, STATUS_COLUMNS, alignment=Qt.AlignCenter)
+        control_layout.addWidget(self.event_btn, button_row + 1, 0, 1, STATUS_COLUMNS, alignment=Qt.AlignCenter)
         
         control_group.setLayout(control_layout)
         main_layout.addWidget(control_group)
@@ -147,11 +207,27 @@ class ControlApp(QMainWindow):
         self.timer = QTimer()
         self.timer.timeout.connect(self.enable_event_button)
         
+        # Backend -> controller notifications arrive on the data sockets
+        self.notification_bridge.message.connect(self.on_notification)
+        self.notification_bridge.closed.connect(self.on_backend_closed)
+        
+        # Background worker for backend handshakes
+        self.handshake_worker = HandshakeWorker(parent=self)
+        self.reconnect_pending = False  # apply_configuration ran while handshakes were in progress
+        self.handshake_worker.backend_connected.connect(self.on_backend_connected)
+        self.handshake_worker.backend_failed.connect(self.on_backend_failed)
+        self.handshake_worker.finished.connect(self.on_handshake_finished)
+        
         # Create timer for checking backend status
         self.status_timer = QTimer()
         self.status_timer.timeout.connect(self.connect_to_server)
         self.status_timer.start(1000)  # Check every 1 second
         
+        # Timer for probing established connections
+        self.health_timer = QTimer()
+        self.health_timer.timeout.connect(self.check_connections)
+        self.health_timer.start(HEALTH_CHECK_INTERVAL_MS)
+        
         # Set window style
         self.setStyleSheet("""
             QGroupBox {
@@ -174,62 +250,44 @@ class ControlApp(QMainWindow):
         self.event_btn.setEnabled(True)  # Enable event button in initial state
         
     def connect_to_server(self):
-        all_connected = True
-        message_handler = DataRecordConfigMsgHandler()
+        # Handshakes run in the background; results arrive through the worker's signals
+        if self.handshake_worker.is_running():
+            return
         
-        # 각 백엔드에 대해
+        jobs = []
         for i, backend in enumerate(self.backends):
-            prev_counter = self.message_counter
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.connect((backend["host"], backend["ports"][0]))
-
-                # First message (MessageType 1)
-                self.message_counter += 1
-                first_msg = Header(time.time_ns(), 1, self.message_counter, 0)
-                s.sendall(first_msg.tobytes())
-                response_data = s.recv(21)
-                response = Header.from_bytes(response_data)
-                if response.message_type != 2:
-                    raise Exception(f"Expected MessageType 2, got {response.message_type}")
-                
-                # Second message (MessageType 3)
-                self.message_counter += 1
-                second_msg = Header(time.time_ns(), 3, self.message_counter, 0)
-                s.sendall(second_msg.tobytes())
-                response_data = s.recv(21)
-                response = Header.from_bytes(response_data)
-                if response.message_type != 4:
-                    raise Exception(f"Expected MessageType 2, got {response.message_type}")
-
-                backend["ready"] = True
-                self.status_labels[i].setText(f"{backend['name']}: Connected")
-                self.status_labels[i].setStyleSheet("color: green; font-size: 32px;")
-                backend["sockets"][0] = s
-                
-            except Exception as e:
-                print(f"Error with {backend['name']}:{backend['ports'][0]}: {e}")
-                all_connected = False
-                self.status_labels[i].setText(f"{backend['name']}: Not Connected")
-                self.status_labels[i].setStyleSheet("color: red; font-size: 32px;")
-                if 's' in locals():
-                    s.close()
-                self.message_counter = prev_counter
+            if backend["ready"]:
                 continue
-            
-        if all_connected and all(backend["ready"] for backend in self.backends):
+            jobs.append((i, self.pool.get(backend["name"]), self.controller.message_counter + 1))
+            self.controller.message_counter += 2  # Two handshake messages per backend
+        self.handshake_worker.start(jobs)
+    
+    def on_backend_connected(self, index):
+        backend = self.backends[index]
+        if None in self.pool.get(backend["name"]).sockets:
+            return  # apply_configuration closed them after the handshake; the new host is dialled instead
+        self.controller.attach(backend["name"])
+        self.status_labels[index].setText(f"{backend['name']}: Connected")
+        self.status_labels[index].setStyleSheet("color: green; font-size: 32px;")
+    
+    def on_backend_failed(self, index, error):
+        backend = self.backends[index]
+        print(f"Error with {backend['name']}:{backend['ports'][0]}: {error}")
+        self.status_labels[index].setText(f"{backend['name']}: Not Connected")
+        self.status_labels[index].setStyleSheet("color: red; font-size: 32px;")
+    
+    def on_handshake_finished(self):
+        if self.reconnect_pending:
+            # Hosts changed while these handshakes ran; dial the new ones
+            self.reconnect_pending = False
+            self.connect_to_server()
+            return
+        if all(backend["ready"] for backend in self.backends):
             self.status_timer.stop()
             self.event_sent = False
             self.event_btn.setEnabled(True)
             self.toggle_btn.setEnabled(True)
-
-            for backend in self.backends:
-                backend["sockets"][1] = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                backend["sockets"][1].connect((backend["host"], backend["ports"][1]))
             print("All backends connected successfully")
-            return True
-        
-        return False
         
     def apply_configuration(self):
         for i, backend in enumerate(self.backends):
@@ -239,16 +297,21 @@ class ControlApp(QMainWindow):
                 if not ip:
                     raise ValueError(f"{backend['name']}: IP address cannot be empty")
                 
-                # Update backend configuration
-                backend['host'] = ip
-                for sock in backend['sockets']:
-                    sock = None
+                # Update backend configuration; sockets to the old host are closed
+                if ip != backend['host']:
+                    self.registry.set_host(backend['name'], ip)
+                    self.pool.get(backend['name']).set_host(ip)
+                    self.mark_disconnected(i)
                 
             except ValueError as e:
                 QMessageBox.warning(self, "Configuration Error", str(e))
                 return
             
-        self.connect_to_server()
+        if self.handshake_worker.is_running():
+            # Handshakes to an old host fail once they finish; the new hosts are dialled then
+            self.reconnect_pending = True
+        else:
+            self.connect_to_server()
         
         QMessageBox.information(self, "Success", "Configuration applied successfully")
 
@@ -264,49 +327,23 @@ class ControlApp(QMainWindow):
         message.BodyLength = 0
         return message
 
-    def send_tcp_message(self, start=True):
-        message_handler = DataRecordConfigMsgHandler()
-        
-        if start:
-            self.message_counter += 1
-            config_msg = DataRecordConfigMsg(
-                header=Header(time.time_ns(), 19, self.message_counter, 0),
-                logging_directory_path="",
-                logging_mode=np.uint32(0),
-                history_time=np.uint32(0),
-                follow_time=np.uint32(0),
-                split_time=np.uint32(0),
-                data_length=np.uint32(0),
-                logging_file_list=[],
-                meta_data={"data": {"a": "a", "b": "b"}, "issue": ""}
-            )
-        else:
-            self.message_counter += 1
-            config_msg = DataRecordConfigMsg(
-                header=Header(time.time_ns(), 21, self.message_counter, 0),
-                logging_directory_path="",
-                logging_mode=np.uint32(0),
-                history_time=np.uint32(0),
-                follow_time=np.uint32(0),
-                split_time=np.uint32(0),
-                data_length=np.uint32(0),
-                logging_file_list=[],
-                meta_data={"data": {"a": "a", "b": "b"}, "issue": ""}
-            )
-            
-        # Calculate body length
-        body_size = message_handler.calculate_body_size()
-        config_msg.header.body_length = np.uint32(body_size)
-            
-        serialized_data = message_handler.make_package(config_msg)
-        
-        for backend in self.backends:
-            if backend["ready"]:
-                backend["sockets"][1].sendall(serialized_data)
+    def check_connections(self):
+        self.controller.check_connections()
+    
+    def mark_disconnected(self, index):
+        self.controller.mark_disconnected(self.backends[index]["name"])
+    
+    def on_backend_disconnected(self, name):
+        # Let the status timer reconnect whatever sockets the pool no longer holds
+        index = self.registry.index_of(name)
+        self.status_labels[index].setText(f"{name}: Not Connected")
+        self.status_labels[index].setStyleSheet("color: red; font-size: 32px;")
+        if not self.status_timer.isActive():
+            self.status_timer.start(1000)
     
     def toggle_action(self):
         if not self.is_toggle_on:  # Sending START
-            success, failed_backends = self.send_tcp_message()
+            success, _ = self.controller.start()  # Backends that got START are told about the ones that did not
             if success:
                 self.toggle_btn.setText("End")
                 self.toggle_btn.setStyleSheet("""
@@ -325,11 +362,6 @@ class ControlApp(QMainWindow):
                 self.is_toggle_on = True
                 self.event_btn.setEnabled(False)  # Disable event button after successful START
             else:
-                # If START fails, notify other backend
-                if len(failed_backends) < len(self.backends):
-                    failure_message = f"CONNECTION_FAIL:{','.join(failed_backends)}"
-                    self.send_tcp_message(failure_message)
-                
                 self.toggle_btn.setText("Start")
                 self.toggle_btn.setStyleSheet("""
                     QPushButton {
@@ -347,7 +379,7 @@ class ControlApp(QMainWindow):
                 self.is_toggle_on = False
                 self.event_btn.setEnabled(True)  # Enable event button if START fails
         else:  # Sending END
-            success, _ = self.send_tcp_message(start=False)
+            success, _ = self.controller.end()
             if success:
                 self.toggle_btn.setText("Start")
                 self.toggle_btn.setStyleSheet("""
@@ -367,27 +399,40 @@ class ControlApp(QMainWindow):
                 self.event_btn.setEnabled(True)  # Enable event button when END is sent
 
     def send_event(self):
-        # 이벤트 전송 로직 구현 필요
-        pass
+        self.controller.event()
+        if self.controller.pending_ready:
+            # Stays disabled until every backend pushes READY
+            self.event_sent = True
+            self.event_btn.setEnabled(False)
+            self.timer.start(EVENT_READY_TIMEOUT_MS)
+    
+    def on_notification(self, name, message_type, sequence_number):
+        if self.controller.handle_notification(name, message_type, sequence_number) and self.event_sent:
+            self.enable_event_button()
+    
+    def on_backend_closed(self, name):
+        self.controller.handle_closed(name)
     
     def enable_event_button(self):
+        self.event_sent = False
+        self.controller.pending_ready.clear()
         self.event_btn.setEnabled(True)
         self.timer.stop()
 
     def closeEvent(self, event):
+        self.handshake_worker.shutdown()
         # 프로그램 종료 시 모든 소켓 정리
-        for backend in self.backends:
-            for socket in backend["sockets"]:
-                if socket is not None:
-                    try:
-                        socket.close()
-                    except:
-                        pass
+        self.controller.close()
         event.accept()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    args = sys.argv[1:]
+    serve_from_args(args)  # --metrics-port PORT
+    pipelined = '--pipelined' in args
+    if pipelined:
+        args.remove('--pipelined')
+    app = QApplication(sys.argv[:1] + args)
     app.setStyle('Fusion')
-    window = ControlApp()
+    window = ControlApp(args[0] if args else DEFAULT_CONFIG_PATH, pipelined=pipelined)
     window.show()
     sys.exit(app.exec_()) 
\ No newline at end of file
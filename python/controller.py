@@ -0,0 +1,471 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from backend_client import ConnectionPool, NotificationReader, PipelinedSender, broadcast, HANDSHAKE_TIMEOUT
+from backend_registry import BackendRegistry, DEFAULT_CONFIG_PATH
+from data_record_config_msg import CONFIG_CODEC, DataRecordConfigMsg, Header, MetaData
+from metrics import default_registry, serve_from_args
+from tcp_common import (pack_message, HEADER_SIZE, HEADER_STRUCT, COMMAND_MESSAGE_TYPE, EVENT_RECEIVED_MESSAGE_TYPE,
+                        READY_MESSAGE_TYPE, PIPELINE_ACK_MESSAGE_TYPE, START_CONFIG_MESSAGE_TYPE,
+                        END_CONFIG_MESSAGE_TYPE)
+
+HEALTH_CHECK_INTERVAL = 5.0  # Seconds between liveness probes / reconnects in daemon mode
+EVENT_READY_TIMEOUT = 35.0  # Seconds to wait for every READY after an EVENT
+MAX_HANDSHAKE_WORKERS = 32
+UNLOCKED_COMMANDS = ("sleep", "wait-ready")  # Daemon commands that only wait, so other clients need not
+
+metrics = default_registry()
+FRAMES_SENT = metrics.counter("controller_frames_sent_total", "Frames broadcast to backends", ("message_type",))
+BYTES_SENT = metrics.counter("controller_bytes_sent_total", "Frame bytes broadcast to backends", ("message_type",))
+FRAMES_RECEIVED = metrics.counter("controller_frames_received_total", "Frames pushed by backends",
+                                  ("backend", "message_type"))
+BACKENDS_READY = metrics.gauge("controller_backends_ready", "Backends with both sockets connected")
+
+
+def report(message):
+    # stdout is left to command results, so scripts can parse them
+    print(message, file=sys.stderr, flush=True)
+
+
+class Controller:
+    """Connect, START, END and EVENT for every configured backend, without a GUI.
+
+    Only the standard library and the wire modules are imported, so scripts start
+    fast. Notifications pushed by the backends are read on a background thread
+    and passed to on_message(name, MessageType, SequenceNumber), and closed
+    connections to on_closed(name). Both default to handle_notification and
+    handle_closed; a GUI passes callables that move the call onto its own thread
+    first. on_disconnected(name) is called whenever a backend stops being ready.
+    """
+
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, pipelined=False, on_message=None, on_closed=None,
+                 on_disconnected=None):
+        self.registry = BackendRegistry.from_file(config_path)
+        self.backends = self.registry.backends
+        self.pool = ConnectionPool(self.backends)
+        # Pipelined mode: per-backend sequence numbers and windowed acknowledgements instead of lockstep sends
+        self.senders = {backend["name"]: PipelinedSender(backend["name"]) for backend in self.backends} if pipelined else None
+        self.message_counter = 0
+        self.on_message = on_message or self.handle_notification
+        self.on_closed = on_closed or self.handle_closed
+        self.on_disconnected = on_disconnected
+        self.config = DataRecordConfigMsg(Header(0, 0, 0, 0), "", 0, 0, 0, 0, 0, [], MetaData({}, ""))
+        self.meta_key_dictionary = None  # Optional MetaKeyDictionary shared with the backends
+        self._config_body = None  # Encoded config body, rebuilt after set_config
+        self.pending_ready = set()  # Backends that have not pushed READY for the last EVENT
+        self.ready_condition = threading.Condition()
+        self.notification_reader = NotificationReader(self.forward_notification, lambda name: self.on_closed(name))
+        BACKENDS_READY.set_function(lambda: sum(1 for backend in self.backends if backend["ready"]))
+
+    def set_config(self, config=None, meta_data=None, meta_key_dictionary=None):
+        """Replace the recording config sent with START/END, or only its MetaData"""
+        if config is not None:
+            self.config = config
+        if meta_data is not None:
+            self.config.meta_data = meta_data
+        if meta_key_dictionary is not None:
+            self.meta_key_dictionary = meta_key_dictionary
+        self._config_body = None
+
+    def connect(self, timeout=HANDSHAKE_TIMEOUT):
+        """Handshake with every backend that is not ready, all at once. Returns {name: error} of the failures."""
+        from concurrent.futures import ThreadPoolExecutor  # Only paid for when connecting
+
+        jobs = []
+        for backend in self.backends:
+            if backend["ready"]:
+                continue
+            jobs.append((backend["name"], self.message_counter + 1))
+            self.message_counter += 2  # Two handshake messages per backend
+        failed = {}
+        if not jobs:
+            return failed
+        with ThreadPoolExecutor(max_workers=min(MAX_HANDSHAKE_WORKERS, len(jobs)),
+                                thread_name_prefix="handshake") as executor:
+            futures = [(name, executor.submit(self.pool.get(name).connect, sequence_number, timeout))
+                       for name, sequence_number in jobs]
+            for name, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[name] = str(e)
+                    continue
+                self.attach(name)
+        return failed
+
+    def attach(self, name):
+        """Start using a backend whose handshake has completed"""
+        backend = self.registry.by_name[name]
+        backend["ready"] = True
+        data_socket = self.pool.get(name).data_socket
+        self.notification_reader.add(name, data_socket)
+        if self.senders is not None:
+            self.senders[name].attach(data_socket)
+
+    def mark_disconnected(self, name):
+        backend = self.registry.by_name[name]
+        backend["ready"] = False
+        self.notification_reader.remove(name)
+        if self.senders is not None:
+            self.senders[name].detach()
+        with self.ready_condition:
+            self.pending_ready.discard(name)
+            self.ready_condition.notify_all()
+        if self.on_disconnected is not None:
+            self.on_disconnected(name)
+
+    def check_connections(self):
+        # Probe established connections; only the sockets found dead are closed and reconnected
+        for backend in self.backends:
+            if backend["ready"] and not self.pool.get(backend["name"]).check():
+                report(f"Lost connection to {backend['name']}")
+                self.mark_disconnected(backend["name"])
+
+    def config_package(self, message_type):
+        # START (19) and END (21) share the same encoded config body; only the header differs
+        if self._config_body is None:
+            self._config_body = bytes(CONFIG_CODEC.encode(self.config, HEADER_SIZE, self.meta_key_dictionary))
+        self.message_counter += 1
+        package = bytearray(self._config_body)
+        HEADER_STRUCT.pack_into(package, 0, time.time_ns(), message_type, self.message_counter,
+                                len(package) - HEADER_SIZE)
+        return bytes(package)
+
+    def start(self):
+        """Send START. If some backends did not get it, tell the others. Returns (success, failed names)"""
+        success, failed_backends = self.broadcast_package(self.config_package(START_CONFIG_MESSAGE_TYPE))
+        if not success and len(failed_backends) < len(self.backends):
+            self.send_connection_fail(failed_backends)
+        return success, failed_backends
+
+    def end(self):
+        """Send END. Returns (success, failed names)"""
+        return self.broadcast_package(self.config_package(END_CONFIG_MESSAGE_TYPE))
+
+    def event(self):
+        """Send EVENT. Returns (success, failed names); wait_ready() waits for the READY pushes"""
+        self.message_counter += 1
+        package = pack_message(COMMAND_MESSAGE_TYPE, self.message_counter, b"EVENT")
+        with self.ready_condition:
+            # Set before sending, so a fast READY is not missed
+            self.pending_ready = {backend["name"] for backend in self.backends if backend["ready"]}
+        success, failed_backends = self.broadcast_package(package)
+        if failed_backends:
+            report(f"EVENT not delivered to: {', '.join(failed_backends)}")
+        return success, failed_backends
+
+    def wait_ready(self, timeout=EVENT_READY_TIMEOUT):
+        """Wait until every backend that got the last EVENT pushed READY. Returns the ones still missing."""
+        with self.ready_condition:
+            self.ready_condition.wait_for(lambda: not self.pending_ready, timeout)
+            return sorted(self.pending_ready)
+
+    def send_connection_fail(self, failed_backends):
+        self.message_counter += 1
+        failure_message = f"CONNECTION_FAIL:{','.join(failed_backends)}"
+        package = pack_message(COMMAND_MESSAGE_TYPE, self.message_counter, failure_message.encode())
+        self.broadcast_package(package)
+
+    def broadcast_package(self, package):
+        """Send package to every ready backend in parallel. Returns (success, failed backend names)"""
+        if self.senders is not None:
+            return self.send_pipelined(package)
+        targets = {}
+        failed_backends = []
+        for backend in self.backends:
+            if backend["ready"]:
+                targets[backend["name"]] = self.pool.get(backend["name"]).data_socket
+            else:
+                failed_backends.append(backend["name"])
+
+        _, failed = broadcast(targets, package)
+        labels = (HEADER_STRUCT.unpack_from(package, 0)[1],)
+        delivered = len(targets) - len(failed)
+        FRAMES_SENT.inc(delivered, labels)
+        BYTES_SENT.inc(delivered * len(package), labels)
+        for name, reason in failed.items():
+            report(f"Failed to send to {name}: {reason}")
+            self.pool.get(name).close_socket(1)  # A partially written socket cannot be reused
+            self.mark_disconnected(name)
+            failed_backends.append(name)
+        return not failed_backends, failed_backends
+
+    def send_pipelined(self, package):
+        """Queue package on every ready backend's session without waiting for acknowledgements.
+
+        A backend whose socket fails mid-send still counts as reached: the frame
+        stays in its window and is sent again once the connection is re-established.
+        """
+        failed_backends = []
+        labels = (HEADER_STRUCT.unpack_from(package, 0)[1],)
+        for backend in self.backends:
+            name = backend["name"]
+            if not backend["ready"]:
+                failed_backends.append(name)
+                continue
+            if not self.senders[name].send(package):
+                report(f"Connection to {name} failed; pipelined frames will be resent on reconnect")
+                self.pool.get(name).close_socket(1)
+                self.mark_disconnected(name)
+            FRAMES_SENT.inc(1, labels)
+            BYTES_SENT.inc(len(package), labels)
+        return not failed_backends, failed_backends
+
+    def forward_notification(self, name, header, body):
+        # Runs on the reader thread
+        FRAMES_RECEIVED.inc(1, (name, header.message_type))
+        if header.message_type == PIPELINE_ACK_MESSAGE_TYPE and self.senders is not None:
+            self.senders[name].on_ack(header, body)
+            return
+        self.on_message(name, header.message_type, header.sequence_number)
+
+    def handle_notification(self, name, message_type, sequence_number):
+        """Returns True when this READY was the last one the pending EVENT waited for"""
+        if message_type == EVENT_RECEIVED_MESSAGE_TYPE:
+            report(f"{name} acknowledged EVENT #{sequence_number}")
+        elif message_type == READY_MESSAGE_TYPE:
+            report(f"{name} is READY")
+            with self.ready_condition:
+                was_pending = bool(self.pending_ready)
+                self.pending_ready.discard(name)
+                self.ready_condition.notify_all()
+                return was_pending and not self.pending_ready
+        return False
+
+    def handle_closed(self, name):
+        if self.registry.by_name[name]["ready"]:
+            report(f"{name} closed the connection")
+            self.pool.get(name).close_socket(1)
+            self.mark_disconnected(name)
+
+    def status(self):
+        return [(backend["name"], backend["ready"]) for backend in self.backends]
+
+    def close(self):
+        self.notification_reader.close()
+        self.pool.close_all()
+
+
+# Commands of the CLI and the daemon: name -> number of optional numeric arguments
+COMMANDS = {"connect": 1, "start": 0, "end": 0, "event": 0, "wait-ready": 1, "status": 0, "sleep": 1}
+
+
+def run_command(controller, command, args=()):
+    """Run one command. Returns (ok, one line of text)"""
+    if command == "connect":
+        failed = controller.connect(*args)
+        ready = sum(1 for _, is_ready in controller.status() if is_ready)
+        if failed:
+            return False, f"{ready}/{len(controller.backends)} ready; " + "; ".join(
+                f"{name}: {error}" for name, error in failed.items())
+        return True, f"{ready}/{len(controller.backends)} ready"
+    if command in ("start", "end", "event"):
+        success, failed_backends = getattr(controller, command)()
+        if success:
+            return True, f"{command.upper()} sent"
+        return False, f"{command.upper()} not delivered to: {', '.join(failed_backends)}"
+    if command == "wait-ready":
+        missing = controller.wait_ready(*args)
+        if missing:
+            return False, f"No READY from: {', '.join(missing)}"
+        return True, "READY"
+    if command == "status":
+        return True, ", ".join(f"{name}={'ready' if is_ready else 'down'}" for name, is_ready in controller.status())
+    if command == "sleep":
+        time.sleep(*args)
+        return True, "slept"
+    return False, f"Unknown command: {command}"
+
+
+def parse_commands(words):
+    """['start', 'sleep', '5', 'end'] -> [('start', ()), ('sleep', (5.0,)), ('end', ())]"""
+    commands = []
+    i = 0
+    while i < len(words):
+        command = words[i]
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command: {command}")
+        i += 1
+        args = []
+        while len(args) < COMMANDS[command] and i < len(words):
+            try:
+                args.append(float(words[i]))
+            except ValueError:
+                break
+            i += 1
+        if command == "sleep" and not args:
+            raise ValueError("sleep needs a number of seconds")
+        commands.append((command, tuple(args)))
+    return commands
+
+
+def run_script(controller, commands):
+    """Run commands in order, printing one result line each. Stops at the first failure; returns the exit code."""
+    for command, args in commands:
+        ok, text = run_command(controller, command, args)
+        print(f"{'ok' if ok else 'error'} {text}", flush=True)
+        if not ok:
+            return 1
+    return 0
+
+
+def serve(controller, path, health_check_interval=HEALTH_CHECK_INTERVAL, stopping=None):
+    """Daemon mode: keep the backends connected and run commands received on a Unix socket.
+
+    A client sends one command per line and gets one "ok ..." or "error ..." line
+    back for each. Every client is served on its own thread, so an idle one does
+    not hold up the others or the health checks; commands and health checks take
+    turns on the controller. Runs until SIGTERM, Ctrl-C or stopping is set.
+    """
+    if os.path.exists(path):
+        os.unlink(path)  # Left over from a daemon that did not exit cleanly
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(16)
+    server.settimeout(min(1.0, health_check_interval))  # accept() must not delay the health checks
+    stopping = stopping or threading.Event()
+    lock = threading.Lock()  # Controller is not thread-safe
+    try:
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    except ValueError:
+        pass  # Not the main thread
+    report(f"Controller daemon listening on {path}")
+    next_check = 0.0
+    try:
+        while not stopping.is_set():
+            if time.monotonic() >= next_check:
+                with lock:
+                    controller.check_connections()
+                    failed = controller.connect()
+                for name, error in failed.items():
+                    report(f"Error with {name}: {error}")
+                next_check = time.monotonic() + health_check_interval
+            try:
+                client, _ = server.accept()
+            except socket.timeout:
+                continue
+            client.settimeout(None)
+            threading.Thread(target=serve_client, args=(controller, client, lock), name="controller-client",
+                             daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+def serve_client(controller, client, lock):
+    with client:
+        reader = client.makefile('r', encoding='utf-8')
+        for line in reader:
+            words = line.split()
+            if not words:
+                continue
+            try:
+                commands = parse_commands(words)
+            except ValueError as e:
+                replies = [f"error {e}"]
+            else:
+                replies = []
+                for command, args in commands:
+                    if command in UNLOCKED_COMMANDS:
+                        ok, text = run_command(controller, command, args)
+                    else:
+                        with lock:
+                            ok, text = run_command(controller, command, args)
+                    replies.append(f"{'ok' if ok else 'error'} {text}")
+            try:
+                client.sendall(("\n".join(replies) + "\n").encode('utf-8'))
+            except OSError:
+                return
+
+
+def send_to_daemon(path, commands):
+    """Client side of serve(): run commands on a running daemon. Returns the exit code."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        reader = sock.makefile('r', encoding='utf-8')
+        for command, args in commands:
+            sock.sendall((" ".join([command] + [repr(arg) for arg in args]) + "\n").encode('utf-8'))
+            reply = reader.readline().rstrip("\n")
+            print(reply, flush=True)
+            if not reply.startswith("ok"):
+                return 1
+    return 0
+
+
+USAGE = """Usage: python controller.py [--config PATH] [--pipelined] [--metrics-port PORT] COMMAND...
+       python controller.py [--config PATH] [--pipelined] [--metrics-port PORT] --serve SOCKET
+       python controller.py --daemon SOCKET COMMAND...
+
+Commands run in order, one result line each ("ok ..." or "error ..."); the first error stops
+the script with exit code 1. "-" reads further commands from stdin, one or more per line.
+  connect [TIMEOUT]       handshake with backends that are not ready (done first automatically)
+  start | end | event     send START / END / EVENT to every ready backend
+  wait-ready [TIMEOUT]    wait for READY from every backend that got the last EVENT
+  status                  list the backends and whether they are ready
+  sleep SECONDS
+--serve keeps the connections open and runs commands received on the Unix socket SOCKET;
+--daemon sends the commands to such a daemon instead of connecting to the backends itself.
+Example: python controller.py start sleep 10 event wait-ready end"""
+
+
+def take_option(args, flag):
+    if flag not in args:
+        return None
+    i = args.index(flag)
+    if i + 1 >= len(args):
+        raise ValueError(f"{flag} needs a value")
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        daemon_path = take_option(args, "--daemon")
+        serve_path = take_option(args, "--serve")
+        config_path = take_option(args, "--config") or DEFAULT_CONFIG_PATH
+        pipelined = "--pipelined" in args
+        if pipelined:
+            args.remove("--pipelined")
+        serve_from_args(args)  # --metrics-port PORT
+        if "-" in args:
+            i = args.index("-")
+            args[i:i + 1] = sys.stdin.read().split()
+        commands = parse_commands(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        print(USAGE)
+        sys.exit(2)
+    if not commands and serve_path is None:
+        print(USAGE)
+        sys.exit(2)
+
+    if daemon_path is not None:
+        try:
+            sys.exit(send_to_daemon(daemon_path, commands))
+        except OSError as e:
+            print(f"error Controller daemon at {daemon_path}: {e}")
+            sys.exit(1)
+
+    controller = Controller(config_path, pipelined=pipelined)
+    try:
+        if serve_path is not None:
+            serve(controller, serve_path)
+            sys.exit(0)
+        if commands[0][0] != "connect":
+            for name, error in controller.connect().items():
+                report(f"Error with {name}: {error}")
+        sys.exit(run_script(controller, commands))
+    finally:
+        controller.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,32 @@
-import numpy as np
+from __future__ import annotations  # numpy types in annotations are not evaluated, numpy is imported on use
+
 from dataclasses import dataclass
 from typing import List, Dict, Optional
-import pickle
-import boost.python as bp
 import struct
+import threading
+import time
+import zlib
+from logging_msg_queue import LoggingMsgQueue, OVERFLOW_DROP_OLDEST
+from message_schema import DATA_RECORD_CONFIG_MSG, DATA_RECORD_VIEWER_MSG, compile_codec
+from metrics import default_registry
+from tcp_common import HEADER_SIZE, HEADER_STRUCT, MAX_BODY_LENGTH, recv_exact_into
+
+LOGGING_QUEUE_SIZE = 10000  # Default bound of logging_msg_queue
+
+metrics = default_registry()
+PACKAGES_ENCODED = metrics.counter("config_packages_encoded_total", "Config packages built", ("message_type",))
+PACKAGE_BYTES = metrics.counter("config_package_bytes_total", "Bytes of config packages built", ("message_type",))
+MESSAGES_PARSED = metrics.counter("config_messages_parsed_total", "Config messages decoded", ("message_type",))
+LOGGING_QUEUE_DEPTH = metrics.gauge("logging_msg_queue_depth", "LoggingMsg waiting in logging_msg_queue")
+LOGGING_QUEUE_DROPPED = metrics.gauge("logging_msg_queue_dropped", "LoggingMsg dropped by the overflow policy")
+
+_U32 = struct.Struct('<I')
+
+# MetaData body: flags (u8), [dictionary fingerprint (u32) if META_KEY_IDS], entry count,
+# then per entry a key reference and a length-prefixed UTF-8 value, then the issue.
+# Counts, lengths and key references are unsigned LEB128 varints. A key reference is
+# (dictionary id << 1) | 1, or (key length << 1) followed by the key itself.
+META_KEY_IDS = 0x01  # Keys may be sent as ids of the session MetaKeyDictionary
 
 @dataclass
 class ProtocolHeader:
@@ -14,7 +37,7 @@ class ProtocolHeader:
     body_length: np.uint32
 
     def to_bytes(self) -> bytes:
-        return struct.pack('<QIQI', 
+        return HEADER_STRUCT.pack(
             self.timestamp,
             self.message_type,
             self.sequence_number,
@@ -23,7 +46,7 @@ class ProtocolHeader:
 
     @classmethod
     def from_bytes(cls, data: bytes) -> 'ProtocolHeader':
-        timestamp, message_type, sequence_number, body_length = struct.unpack('<QIQI', data)
+        timestamp, message_type, sequence_number, body_length = HEADER_STRUCT.unpack(data)
         return cls(timestamp, message_type, sequence_number, body_length)
 
 @dataclass
@@ -55,6 +78,110 @@ class MetaData:
     data: Dict[str, str]
     issue: str
 
+class MetaKeyDictionary:
+    """Session level MetaData key table shared by both ends.
+
+    Keys found in the table are sent as their small integer id instead of the key
+    string. Both ends must install the same key list; its fingerprint travels with
+    every message so a mismatch is detected instead of decoding the wrong keys.
+    """
+
+    def __init__(self, keys: List[str]):
+        self.keys = list(keys)
+        if len(set(self.keys)) != len(self.keys):
+            raise ValueError("MetaData key dictionary has duplicate keys")
+        self.ids = {key: i for i, key in enumerate(self.keys)}
+        self.fingerprint = zlib.crc32('\0'.join(self.keys).encode('utf-8'))
+
+def _pack_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _unpack_varint(view, offset: int):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(view):
+            raise ValueError("Truncated MetaData")
+        byte = view[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def _unpack_text(view, offset: int):
+    length, offset = _unpack_varint(view, offset)
+    end = offset + length
+    if end > len(view):
+        raise ValueError("Truncated MetaData")
+    return str(view[offset:end], 'utf-8'), end
+
+def encode_meta_data(meta_data: MetaData, dictionary: Optional[MetaKeyDictionary] = None) -> bytes:
+    """Encode MetaData as length-prefixed key/value pairs, using dictionary ids where possible"""
+    out = bytearray()
+    if dictionary is not None:
+        out.append(META_KEY_IDS)
+        out += _U32.pack(dictionary.fingerprint)
+        ids = dictionary.ids
+    else:
+        out.append(0)
+        ids = {}
+    _pack_varint(out, len(meta_data.data))
+    for key, value in meta_data.data.items():
+        key_id = ids.get(key)
+        if key_id is not None:
+            _pack_varint(out, (key_id << 1) | 1)
+        else:
+            encoded = key.encode('utf-8')
+            _pack_varint(out, len(encoded) << 1)
+            out += encoded
+        encoded = value.encode('utf-8')
+        _pack_varint(out, len(encoded))
+        out += encoded
+    encoded = meta_data.issue.encode('utf-8')
+    _pack_varint(out, len(encoded))
+    out += encoded
+    return bytes(out)
+
+def decode_meta_data(view, dictionary: Optional[MetaKeyDictionary] = None) -> MetaData:
+    """Inverse of encode_meta_data"""
+    view = memoryview(view)
+    if not len(view):
+        raise ValueError("Truncated MetaData")
+    flags = view[0]
+    offset = 1
+    keys = None
+    if flags & META_KEY_IDS:
+        if len(view) < offset + 4:
+            raise ValueError("Truncated MetaData")
+        fingerprint = _U32.unpack_from(view, offset)[0]
+        offset += 4
+        if dictionary is None or dictionary.fingerprint != fingerprint:
+            raise ValueError(f"MetaData uses key dictionary {fingerprint:08x}, which is not installed")
+        keys = dictionary.keys
+    count, offset = _unpack_varint(view, offset)
+    data = {}
+    for _ in range(count):
+        reference, offset = _unpack_varint(view, offset)
+        if reference & 1:
+            if keys is None or (reference >> 1) >= len(keys):
+                raise ValueError(f"Unknown MetaData key id {reference >> 1}")
+            key = keys[reference >> 1]
+        else:
+            end = offset + (reference >> 1)
+            if end > len(view):
+                raise ValueError("Truncated MetaData")
+            key = str(view[offset:end], 'utf-8')
+            offset = end
+        data[key], offset = _unpack_text(view, offset)
+    issue, offset = _unpack_text(view, offset)
+    if offset != len(view):
+        raise ValueError(f"{len(view) - offset} trailing bytes after MetaData")
+    return MetaData(data, issue)
+
 @dataclass
 class DataRecordConfigMsg:
     """Main data record configuration message structure"""
@@ -76,6 +203,29 @@ class DataRecordViewerMsg:
     issue_log: str
     control_id: str
 
+def _make_config_msg(logging_directory_path, logging_mode, history_time, follow_time, split_time, data_length,
+                     logging_file_list, meta_data) -> DataRecordConfigMsg:
+    import numpy as np
+    return DataRecordConfigMsg(
+        header=Header(0, 0, 0, 0),  # Will be set by caller
+        logging_directory_path=logging_directory_path,
+        logging_mode=np.uint32(logging_mode),
+        history_time=np.uint32(history_time),
+        follow_time=np.uint32(follow_time),
+        split_time=np.uint32(split_time),
+        data_length=np.uint32(data_length),
+        logging_file_list=logging_file_list,
+        meta_data=meta_data
+    )
+
+def _make_viewer_msg(register_num, issue_log, control_id) -> DataRecordViewerMsg:
+    return DataRecordViewerMsg(Header(0, 0, 0, 0), register_num, issue_log, control_id)
+
+# Generated from the schemas in message_schema
+CONFIG_CODEC = compile_codec(DATA_RECORD_CONFIG_MSG, _make_config_msg, {"LoggingFile": LoggingFile},
+                             (encode_meta_data, decode_meta_data))
+VIEWER_CODEC = compile_codec(DATA_RECORD_VIEWER_MSG, _make_viewer_msg)
+
 class DataRecordConfigMsgHandler:
     """Handler class for DataRecordConfigMsg operations"""
     _instance = None
@@ -86,7 +236,19 @@ class DataRecordConfigMsgHandler:
         return cls._instance
 
     def __init__(self):
-        self.logging_msg_queue = []
+        if getattr(self, '_initialized', False):  # Singleton: keep state across DataRecordConfigMsgHandler() calls
+            return
+        import numpy as np
+        self._initialized = True
+        self.logging_msg_queue = LoggingMsgQueue(LOGGING_QUEUE_SIZE, OVERFLOW_DROP_OLDEST)
+        self._recv_buffer = bytearray(4096)  # Reused by receive_config_msg
+        self.config_version = 0  # Bumped by every setter that changes the encoded body
+        self._package_cache = None
+        self._package_cache_version = -1
+        self._package_lock = threading.Lock()
+        self.meta_key_dictionary = None  # Optional MetaKeyDictionary shared with the peer
+        LOGGING_QUEUE_DEPTH.set_function(lambda: len(self.logging_msg_queue))
+        LOGGING_QUEUE_DROPPED.set_function(lambda: self.logging_msg_queue.dropped)
         self.data_record_config_msg = DataRecordConfigMsg(
             header=Header(0, 0, 0, 0),
             logging_directory_path="",
@@ -107,45 +269,66 @@ class DataRecordConfigMsgHandler:
 
     def set_data_length(self, data_length: np.uint32):
         self.data_record_config_msg.data_length = data_length
+        self.config_version += 1
 
     def get_data_length(self) -> np.uint32:
         return self.data_record_config_msg.data_length
 
     def set_data(self, data: List[LoggingFile]):
         self.data_record_config_msg.logging_file_list = data
+        self.config_version += 1
 
     def get_data(self) -> DataRecordConfigMsg:
         return self.data_record_config_msg
 
+    def set_meta_data(self, meta_data: MetaData):
+        self.data_record_config_msg.meta_data = meta_data
+        self.config_version += 1
+
     def get_meta_data(self) -> MetaData:
         return self.data_record_config_msg.meta_data
 
+    def set_meta_key_dictionary(self, keys: Optional[List[str]]):
+        """Send these MetaData keys as small ids; the receiving side must install the same list"""
+        self.meta_key_dictionary = MetaKeyDictionary(keys) if keys is not None else None
+        self.config_version += 1
+
+    def mark_config_changed(self):
+        """Call after mutating the object returned by get_data() in place"""
+        self.config_version += 1
+
     def set_logging_directory_path(self, path: str):
         self.data_record_config_msg.logging_directory_path = path
+        self.config_version += 1
 
     def get_logging_directory_path(self) -> str:
         return self.data_record_config_msg.logging_directory_path
 
     def set_logging_mode(self, logging_mode: np.uint32):
         self.data_record_config_msg.logging_mode = logging_mode
+        self.config_version += 1
 
     def get_logging_mode(self) -> np.uint8:
+        import numpy as np
         return np.uint8(self.data_record_config_msg.logging_mode)
 
     def set_history_time(self, history_time: np.uint32):
         self.data_record_config_msg.history_time = history_time
+        self.config_version += 1
 
     def get_history_time(self) -> np.uint32:
         return self.data_record_config_msg.history_time
 
     def set_follow_time(self, follow_time: np.uint32):
         self.data_record_config_msg.follow_time = follow_time
+        self.config_version += 1
 
     def get_follow_time(self) -> np.uint32:
         return self.data_record_config_msg.follow_time
 
     def set_split_time(self, split_time: np.uint32):
         self.data_record_config_msg.split_time = split_time
+        self.config_version += 1
 
     def get_split_time(self) -> np.uint32:
         return self.data_record_config_msg.split_time
@@ -154,6 +337,7 @@ class DataRecordConfigMsgHandler:
         self.data_record_config_msg.header.message_type = message_type
 
     def get_msg_type(self) -> np.uint8:
+        import numpy as np
         return np.uint8(self.data_record_config_msg.header.message_type)
 
     def get_logging_file(self) -> List[LoggingFile]:
@@ -161,155 +345,140 @@ class DataRecordConfigMsgHandler:
 
     def get_package_size(self) -> np.uint32:
         """Calculate the total package size including header and body"""
-        header_size = 21  # Size of ProtocolHeader (8 + 4 + 8 + 4 bytes)
-        body_size = self.calculate_body_size()
-        return np.uint32(header_size + body_size)
+        import numpy as np
+        return np.uint32(HEADER_SIZE + self.calculate_body_size())
 
     def calculate_body_size(self) -> int:
         """Calculate the size of the message body"""
-        # This should match the C++ server's serialization format
-        size = 0
-        size += len(self.data_record_config_msg.logging_directory_path.encode('utf-8')) + 4
-        size += 4  # logging_mode
-        size += 4  # history_time
-        size += 4  # follow_time
-        size += 4  # split_time
-        size += 4  # data_length
-        size += 4  # logging_file_list size
-        for file in self.data_record_config_msg.logging_file_list:
-            size += 4  # id
-            size += len(file.enable.encode('utf-8')) + 4
-            size += len(file.name_prefix.encode('utf-8')) + 4
-            size += len(file.name_subfix.encode('utf-8')) + 4
-            size += len(file.extension.encode('utf-8')) + 4
-        size += 4  # meta_data size
-        size += len(str(self.data_record_config_msg.meta_data).encode('utf-8')) + 4
-        return size
+        return CONFIG_CODEC.size(self.data_record_config_msg, self.meta_key_dictionary)
 
     def make_package(self, msg: DataRecordConfigMsg) -> bytes:
         """Serialize the message into bytes"""
-        # First serialize the header
-        header_bytes = msg.header.to_bytes()
-        
-        # Then serialize the body
-        body_bytes = self.serialize_body(msg)
-        
-        # Combine header and body
-        return header_bytes + body_bytes
+        package = self.encode_package(msg)
+        HEADER_STRUCT.pack_into(package, 0,
+            msg.header.timestamp,
+            msg.header.message_type,
+            msg.header.sequence_number,
+            len(package) - HEADER_SIZE
+        )
+        self.count_package(msg.header.message_type, len(package))
+        return bytes(package)
+
+    def make_config_package(self, message_type: int, sequence_number: int, timestamp: Optional[int] = None) -> bytes:
+        """Serialize the handler's current config, reusing the encoded body while config_version is unchanged.
+
+        Only the header (timestamp, message type, sequence number) is written per call.
+        """
+        if timestamp is None:
+            timestamp = time.time_ns()
+        with self._package_lock:
+            if self._package_cache_version != self.config_version:
+                self._package_cache = self.encode_package(self.data_record_config_msg)
+                self._package_cache_version = self.config_version
+            package = self._package_cache
+            HEADER_STRUCT.pack_into(package, 0, timestamp, message_type, sequence_number, len(package) - HEADER_SIZE)
+            package = bytes(package)
+        self.count_package(message_type, len(package))
+        return package
+
+    @staticmethod
+    def count_package(message_type, size):
+        labels = (int(message_type),)
+        PACKAGES_ENCODED.inc(1, labels)
+        PACKAGE_BYTES.inc(size, labels)
 
     def serialize_body(self, msg: DataRecordConfigMsg) -> bytes:
         """Serialize the message body"""
-        body_data = bytearray()
-        
-        # Serialize logging_directory_path
-        path_bytes = msg.logging_directory_path.encode('utf-8')
-        body_data.extend(struct.pack('<I', len(path_bytes)))
-        body_data.extend(path_bytes)
-        
-        # Serialize numeric fields
-        body_data.extend(struct.pack('<IIIII',
-            msg.logging_mode,
-            msg.history_time,
-            msg.follow_time,
-            msg.split_time,
-            msg.data_length
-        ))
-        
-        # Serialize logging_file_list
-        body_data.extend(struct.pack('<I', len(msg.logging_file_list)))
-        for file in msg.logging_file_list:
-            body_data.extend(struct.pack('<I', file.id))
-            
-            # Serialize string fields
-            for field in [file.enable, file.name_prefix, file.name_subfix, file.extension]:
-                field_bytes = field.encode('utf-8')
-                body_data.extend(struct.pack('<I', len(field_bytes)))
-                body_data.extend(field_bytes)
-        
-        # Serialize meta_data
-        meta_data_str = str(msg.meta_data)
-        meta_bytes = meta_data_str.encode('utf-8')
-        body_data.extend(struct.pack('<I', len(meta_bytes)))
-        body_data.extend(meta_bytes)
-        
-        return bytes(body_data)
+        return bytes(memoryview(self.encode_package(msg))[HEADER_SIZE:])
+
+    def encode_package(self, msg: DataRecordConfigMsg) -> bytearray:
+        """Encode the body into a preallocated buffer that leaves room for the header.
+
+        Every string is encoded exactly once; the header bytes are left zeroed.
+        """
+        return CONFIG_CODEC.encode(msg, HEADER_SIZE, self.meta_key_dictionary)
 
     def parsing_data(self, data: bytes) -> DataRecordConfigMsg:
         """Deserialize the message from bytes"""
-        # First parse the header
-        header = ProtocolHeader.from_bytes(data[:21])
-        
-        # Then parse the body
-        body_data = data[21:]
-        msg = self.deserialize_body(body_data)
+        view = memoryview(data)
+        header = ProtocolHeader(*HEADER_STRUCT.unpack_from(view, 0))
+        msg, _ = self.deserialize_body_view(view, HEADER_SIZE)
         msg.header = header
+        MESSAGES_PARSED.inc(1, (int(header.message_type),))
         return msg
 
     def deserialize_body(self, data: bytes) -> DataRecordConfigMsg:
         """Deserialize the message body"""
-        offset = 0
-        
-        # Deserialize logging_directory_path
-        path_len = struct.unpack('<I', data[offset:offset+4])[0]
-        offset += 4
-        logging_directory_path = data[offset:offset+path_len].decode('utf-8')
-        offset += path_len
-        
-        # Deserialize numeric fields
-        logging_mode, history_time, follow_time, split_time, data_length = struct.unpack('<IIIII', data[offset:offset+20])
-        offset += 20
-        
-        # Deserialize logging_file_list
-        file_list_size = struct.unpack('<I', data[offset:offset+4])[0]
-        offset += 4
-        logging_file_list = []
-        
-        for _ in range(file_list_size):
-            file_id = struct.unpack('<I', data[offset:offset+4])[0]
-            offset += 4
-            
-            # Deserialize string fields
-            strings = []
-            for _ in range(4):  # enable, name_prefix, name_subfix, extension
-                str_len = struct.unpack('<I', data[offset:offset+4])[0]
-                offset += 4
-                string_value = data[offset:offset+str_len].decode('utf-8')
-                offset += str_len
-                strings.append(string_value)
-            
-            logging_file_list.append(LoggingFile(
-                id=file_id,
-                enable=strings[0],
-                name_prefix=strings[1],
-                name_subfix=strings[2],
-                extension=strings[3]
-            ))
-        
-        # Deserialize meta_data
-        meta_len = struct.unpack('<I', data[offset:offset+4])[0]
-        offset += 4
-        meta_data_str = data[offset:offset+meta_len].decode('utf-8')
-        
-        # Create and return the message
-        return DataRecordConfigMsg(
-            header=Header(0, 0, 0, 0),  # Will be set by caller
-            logging_directory_path=logging_directory_path,
-            logging_mode=np.uint32(logging_mode),
-            history_time=np.uint32(history_time),
-            follow_time=np.uint32(follow_time),
-            split_time=np.uint32(split_time),
-            data_length=np.uint32(data_length),
-            logging_file_list=logging_file_list,
-            meta_data=MetaData({"data": {}, "issue": ""})  # Simplified meta_data
+        msg, _ = self.deserialize_body_view(memoryview(data), 0)
+        return msg
+
+    def deserialize_body_view(self, view: memoryview, offset: int = 0):
+        """Deserialize the message body from a buffer without copying it.
+
+        Only the decoded strings are allocated. Returns the message and the offset
+        just past the body.
+        """
+        return CONFIG_CODEC.decode(view, offset, self.meta_key_dictionary)
+
+    def make_viewer_package(self, msg: DataRecordViewerMsg) -> bytes:
+        """Serialize a DataRecordViewerMsg into bytes"""
+        package = VIEWER_CODEC.encode(msg, HEADER_SIZE)
+        HEADER_STRUCT.pack_into(package, 0,
+            msg.header.timestamp,
+            msg.header.message_type,
+            msg.header.sequence_number,
+            len(package) - HEADER_SIZE
         )
+        self.count_package(msg.header.message_type, len(package))
+        return bytes(package)
+
+    def parsing_viewer_data(self, data: bytes) -> DataRecordViewerMsg:
+        """Deserialize a DataRecordViewerMsg from bytes"""
+        view = memoryview(data)
+        header = ProtocolHeader(*HEADER_STRUCT.unpack_from(view, 0))
+        msg, _ = VIEWER_CODEC.decode(view, HEADER_SIZE)
+        msg.header = header
+        MESSAGES_PARSED.inc(1, (int(header.message_type),))
+        return msg
+
+    def receive_config_msg(self, sock) -> Optional[DataRecordConfigMsg]:
+        """Read one framed config message from sock straight into a reused buffer and decode it.
+
+        Returns None if the peer closed the connection before a new message started.
+        """
+        view = memoryview(self._recv_buffer)
+        if not recv_exact_into(sock, view[:HEADER_SIZE]):
+            return None
+        header = ProtocolHeader(*HEADER_STRUCT.unpack_from(view, 0))
+        if header.body_length > MAX_BODY_LENGTH:
+            raise ValueError(f"Body length {header.body_length} exceeds limit {MAX_BODY_LENGTH}")
+        if header.body_length > len(self._recv_buffer):
+            view.release()
+            self._recv_buffer = bytearray(header.body_length)
+            view = memoryview(self._recv_buffer)
+        body = view[:header.body_length]
+        if not recv_exact_into(sock, body):
+            raise ConnectionError("Connection closed before message body")
+        msg, _ = self.deserialize_body_view(body, 0)
+        msg.header = header
+        MESSAGES_PARSED.inc(1, (int(header.message_type),))
+        return msg
+
+    def set_logging_queue(self, maxsize: int, overflow: str = OVERFLOW_DROP_OLDEST):
+        """Replace logging_msg_queue with one using the given bound and overflow policy"""
+        self.logging_msg_queue = LoggingMsgQueue(maxsize, overflow)
+
+    def get_logging_msg(self, timeout: Optional[float] = 0) -> Optional[LoggingMsg]:
+        """Pop the oldest LoggingMsg, or None if the queue stays empty for timeout seconds"""
+        return self.logging_msg_queue.get(timeout)
 
-    def get_logging_msg(self, logging_msg: LoggingMsg) -> np.uint8:
-        if self.logging_msg_queue:
-            logging_msg = self.logging_msg_queue.pop(0)
-            return np.uint8(1)
-        return np.uint8(0)
+    def drain_logging_msg(self, max_n: Optional[int] = None, timeout: Optional[float] = 0) -> List[LoggingMsg]:
+        """Pop up to max_n queued LoggingMsg in one batch"""
+        return self.logging_msg_queue.drain(max_n, timeout)
 
-    def set_logging_msg(self, msg_type: int, data: Optional[np.ndarray] = None, data_size: np.uint32 = 0):
+    def set_logging_msg(self, msg_type: int, data: Optional[np.ndarray] = None, data_size: np.uint32 = 0,
+                        timeout: Optional[float] = None) -> bool:
+        """Queue a LoggingMsg. Returns False if the overflow policy dropped it."""
         header = ProtocolHeader(0, msg_type, 0, data_size)
         logging_msg = LoggingMsg(header, data)
-        self.logging_msg_queue.append(logging_msg) 
\ No newline at end of file
+        return self.logging_msg_queue.put(logging_msg, timeout) 
\ No newline at end of file
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import deque
+from backend_log import ERROR, define_event, get_logger
+from scheduler import default_scheduler
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+log = get_logger()
+
+LOG_WRITER_FAILED = define_event("Event window writer failed: {}", ERROR)
+
+DEFAULT_BYTE_BUDGET = 256 * 1024 * 1024  # Upper bound on buffered payload bytes
+
+
+@dataclass
+class BufferedMsg:
+    """One received payload with its monotonic arrival time"""
+    arrival_ns: int
+    header: Any
+    payload: Any
+    size: int
+
+
+@dataclass
+class EventWindow:
+    """Messages captured around one EVENT: history before it and follow-up after it"""
+    event_ns: int
+    messages: List[BufferedMsg] = field(default_factory=list)
+    dropped: int = 0  # Messages evicted from this window by the byte budget
+
+
+def payload_size(payload) -> int:
+    if payload is None:
+        return 0
+    nbytes = getattr(payload, 'nbytes', None)  # NumPy arrays and memoryviews
+    return nbytes if nbytes is not None else len(payload)
+
+
+class EventRingBuffer:
+    """Keeps the last history_time seconds of payloads and captures a window on EVENT.
+
+    append() only takes a lock and touches a deque, so it is safe to call from
+    the receive path. trigger() freezes the current history and keeps capturing
+    for follow_time seconds; the finished EventWindow is handed to writer on a
+    separate thread. Memory, windows waiting for the writer included, is bounded
+    by byte_budget: plain history is evicted first, then the oldest waiting
+    windows, then the oldest part of a capture in progress.
+    """
+
+    def __init__(self, history_time=10.0, follow_time=10.0, byte_budget=DEFAULT_BYTE_BUDGET,
+                 writer: Optional[Callable[[EventWindow], None]] = None, scheduler=None):
+        self.history_ns = int(history_time * 1e9)
+        self.follow_ns = int(follow_time * 1e9)
+        self.byte_budget = byte_budget
+        self.writer = writer
+        self.buffered_bytes = 0  # History and capture in progress
+        self.queued_bytes = 0  # Finished windows until the writer is done with them
+        self.dropped = 0
+        self.dropped_windows = 0
+        self._history = deque()
+        self._capture = None  # deque of the window while capturing
+        self._capture_event_ns = 0
+        self._capture_dropped = 0
+        self._capture_end_ns = 0
+        self._capture_timer = None
+        self.scheduler = scheduler or default_scheduler()
+        self._lock = threading.Lock()
+        self._windows = deque()  # (EventWindow, bytes) waiting for the writer; None stops it
+        self._windows_ready = threading.Condition(self._lock)
+        self._writer_thread = threading.Thread(target=self._write_windows, daemon=True)
+        self._writer_thread.start()
+
+    def configure(self, history_time, follow_time):
+        with self._lock:
+            self.history_ns = int(history_time * 1e9)
+            self.follow_ns = int(follow_time * 1e9)
+
+    @property
+    def held_bytes(self):
+        """Payload bytes kept in memory; a message both in a waiting window and the history counts twice"""
+        return self.buffered_bytes + self.queued_bytes
+
+    @property
+    def capturing(self):
+        return self._capture is not None
+
+    def append(self, payload, header=None, now_ns=None):
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        msg = BufferedMsg(now_ns, header, payload, payload_size(payload))
+        with self._lock:
+            self.buffered_bytes += msg.size
+            if self._capture is not None:
+                self._capture.append(msg)
+            else:
+                self._history.append(msg)
+                self._expire_history(now_ns)
+            self._enforce_budget()
+
+    def trigger(self, now_ns=None):
+        """Freeze the history and capture follow_time more seconds. A trigger during a capture extends it."""
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        with self._lock:
+            if self._capture is None:
+                self._expire_history(now_ns)
+                self._capture = self._history
+                self._capture_event_ns = now_ns
+                self._capture_dropped = 0
+                self._history = deque()
+            self._capture_end_ns = now_ns + self.follow_ns
+            if self._capture_timer is None:
+                self._capture_timer = self.scheduler.call_later(self.follow_ns / 1e9, self._capture_deadline)
+            else:
+                self.scheduler.reschedule(self._capture_timer, self.follow_ns / 1e9)
+
+    def _capture_deadline(self):
+        # A deadline already firing while a later trigger extends it must not end the capture early
+        if time.monotonic_ns() >= self._capture_end_ns:
+            self.finish_capture()
+
+    def finish_capture(self, now_ns=None):
+        """Hand the current window to the writer thread"""
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        with self._lock:
+            if self._capture is None:
+                return
+            window = EventWindow(self._capture_event_ns, list(self._capture), self._capture_dropped)
+            # Appends went to the capture only; its last history_time seconds are the history again
+            cutoff = now_ns - self.history_ns
+            self._history = deque(msg for msg in self._capture if msg.arrival_ns >= cutoff)
+            self.buffered_bytes -= sum(msg.size for msg in window.messages if msg.arrival_ns < cutoff)
+            self._capture = None
+            self._capture_timer = None
+            # The window stays in memory until it is written, so it counts against the budget until then
+            size = sum(msg.size for msg in window.messages)
+            self.queued_bytes += size
+            self._windows.append((window, size))
+            self._enforce_budget()
+            self._windows_ready.notify()
+
+    def _expire_history(self, now_ns):
+        history = self._history
+        cutoff = now_ns - self.history_ns
+        while history and history[0].arrival_ns < cutoff:
+            self.buffered_bytes -= history.popleft().size
+
+    def _enforce_budget(self):
+        # Evict plain history first, then the oldest waiting windows, then the oldest part of a capture in progress
+        while self.held_bytes > self.byte_budget and self._history:
+            self.buffered_bytes -= self._history.popleft().size
+            self.dropped += 1
+        windows = self._windows
+        while self.held_bytes > self.byte_budget and windows and windows[0] is not None:
+            window, size = windows.popleft()
+            self.queued_bytes -= size
+            self.dropped += len(window.messages)
+            self.dropped_windows += 1
+        while self.held_bytes > self.byte_budget and self._capture:
+            self.buffered_bytes -= self._capture.popleft().size
+            self._capture_dropped += 1
+            self.dropped += 1
+
+    def _write_windows(self):
+        while True:
+            with self._windows_ready:
+                self._windows_ready.wait_for(lambda: self._windows)
+                item = self._windows.popleft()
+            if item is None:
+                return
+            window, size = item
+            try:
+                if self.writer is not None:
+                    self.writer(window)
+            except Exception as e:
+                log.log(LOG_WRITER_FAILED, str(e))
+            finally:
+                with self._lock:
+                    self.queued_bytes -= size
+
+    def close(self):
+        """Flush a capture in progress and stop the writer thread"""
+        if self._capture_timer is not None:
+            self._capture_timer.cancel()
+        self.finish_capture()
+        with self._windows_ready:
+            self._windows.append(None)
+            self._windows_ready.notify()
+        self._writer_thread.join()
@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+
+from tcp_common import HEADER_SIZE, HEADER_STRUCT, FrameHeader
+
+# Recording layout: every record is a 21-byte ProtocolHeader (TimeStamp, MessageType,
+# SequenceNumber, BodyLength) followed by BodyLength payload bytes. The sidecar
+# "<file>.idx" holds one fixed-size entry per record, in file order.
+INDEX_SUFFIX = ".idx"
+INDEX_ENTRY = struct.Struct('<QQQ')  # TimeStamp, SequenceNumber, record offset
+INDEX_FIELDS = 3
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+class IndexedLogReader:
+    """Memory-maps a recording and its index for O(log n) lookups by timestamp or sequence number.
+
+    Records are returned as memoryviews into the mapping, so nothing is copied.
+    Timestamps and sequence numbers are expected to be non-decreasing in file
+    order, which holds for files written by the recorder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data_file = open(path, 'rb')
+        self._index_file = open(index_path(path), 'rb')
+        self._data = self._map(self._data_file)
+        self._index_map = self._map(self._index_file)
+        self.data = memoryview(self._data) if self._data is not None else memoryview(b'')
+        index_bytes = len(self._index_map) if self._index_map is not None else 0
+        # Ignore a trailing partial entry left by an interrupted writer
+        self.count = index_bytes // INDEX_ENTRY.size
+        if self._index_map is not None:
+            self.index = memoryview(self._index_map)[:self.count * INDEX_ENTRY.size].cast('Q')
+        else:
+            self.index = memoryview(b'').cast('Q')
+        # The index can run ahead of the data while a recording is still being written
+        self.count = self._lower_bound(2, len(self.data) - HEADER_SIZE + 1)
+        while self.count and self._record_end(self.count - 1) > len(self.data):
+            self.count -= 1
+
+    def _record_end(self, i):
+        offset = self.offset(i)
+        return offset + HEADER_SIZE + HEADER_STRUCT.unpack_from(self.data, offset)[3]
+
+    @staticmethod
+    def _map(file):
+        if os.fstat(file.fileno()).st_size == 0:
+            return None  # mmap cannot map empty files
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def timestamp(self, i):
+        return self.index[i * INDEX_FIELDS]
+
+    def sequence_number(self, i):
+        return self.index[i * INDEX_FIELDS + 1]
+
+    def offset(self, i):
+        return self.index[i * INDEX_FIELDS + 2]
+
+    def _lower_bound(self, field, value):
+        lo, hi = 0, self.count
+        index = self.index
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if index[mid * INDEX_FIELDS + field] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_time_range(self, start_ts, end_ts):
+        """Return (first, last) record indexes with start_ts <= TimeStamp < end_ts"""
+        return self._lower_bound(0, start_ts), self._lower_bound(0, end_ts)
+
+    def find_sequence(self, sequence_number):
+        """Return the record index holding sequence_number, or -1"""
+        i = self._lower_bound(1, sequence_number)
+        if i < self.count and self.sequence_number(i) == sequence_number:
+            return i
+        return -1
+
+    def record(self, i):
+        """Return (FrameHeader, payload memoryview) of record i"""
+        offset = self.offset(i)
+        header = FrameHeader(*HEADER_STRUCT.unpack_from(self.data, offset))
+        start = offset + HEADER_SIZE
+        return header, self.data[start:start + header.body_length]
+
+    def records(self, first, last):
+        for i in range(first, last):
+            yield self.record(i)
+
+    def records_between(self, start_ts, end_ts):
+        return self.records(*self.find_time_range(start_ts, end_ts))
+
+    def span(self, first, last):
+        """Raw bytes of records first..last-1 as one memoryview"""
+        if first >= last:
+            return self.data[0:0]
+        return self.data[self.offset(first):self._record_end(last - 1)]
+
+    def index_array(self):
+        """The index as a structured NumPy view (timestamp, sequence_number, offset)"""
+        import numpy as np
+        dtype = np.dtype([('timestamp', '<u8'), ('sequence_number', '<u8'), ('offset', '<u8')])
+        if self._index_map is None:
+            return np.zeros(0, dtype=dtype)
+        return np.frombuffer(self._index_map, dtype=dtype, count=self.count)
+
+    def close(self):
+        self.index.release()
+        self.data.release()
+        for mapping in (self._data, self._index_map):
+            if mapping is not None:
+                mapping.close()
+        self._data_file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,460 @@
+import argparse
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+
+from backend_client import HANDSHAKE_STEPS, HANDSHAKE_TIMEOUT, open_connection, run_handshake
+from data_record_config_msg import CONFIG_CODEC, DataRecordConfigMsg, Header, LoggingFile, MetaData
+from metrics import percentile
+from tcp_common import (HEADER_SIZE, HEADER_STRUCT, COMMAND_MESSAGE_TYPE, EVENT_RECEIVED_MESSAGE_TYPE,
+                        START_CONFIG_MESSAGE_TYPE, END_CONFIG_MESSAGE_TYPE, recv_message)
+
+# Capture file: CAPTURE_MAGIC, then one record per send call: CAPTURE_RECORD followed by the bytes
+# exactly as they were written to the socket. Replaying a capture sends the same bytes, handshake
+# frames and sequence numbers included.
+CAPTURE_MAGIC = b'LGC1'
+CAPTURE_RECORD = struct.Struct('<QIBI')  # ns since capture start, controller id, channel, byte count
+CONTROL_CHANNEL = 0
+DATA_CHANNEL = 1
+
+ACK_TIMEOUT = 2.0  # Seconds to wait for outstanding EVENT acknowledgements after the run
+EVENT_BODY = b"EVENT"
+
+
+class CaptureWriter:
+    """Appends the bytes sent by every simulated controller to a capture file"""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(CAPTURE_MAGIC)
+        self.lock = threading.Lock()
+        self.started = time.monotonic_ns()
+
+    def write(self, controller_id, channel, data):
+        record = CAPTURE_RECORD.pack(time.monotonic_ns() - self.started, controller_id, channel, len(data))
+        with self.lock:
+            self.file.write(record)
+            self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_capture(path):
+    """Yields (ns since capture start, controller id, channel, bytes) in file order"""
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a load generator capture")
+        while True:
+            record = f.read(CAPTURE_RECORD.size)
+            if not record:
+                return
+            if len(record) < CAPTURE_RECORD.size:
+                raise ValueError(f"Truncated capture record in {path}")
+            timestamp, controller_id, channel, size = CAPTURE_RECORD.unpack(record)
+            data = f.read(size)
+            if len(data) < size:
+                raise ValueError(f"Truncated capture record in {path}")
+            yield timestamp, controller_id, channel, data
+
+
+def split_frames(data):
+    """(MessageType, SequenceNumber, body) of every complete frame in data"""
+    frames = []
+    offset = 0
+    while offset + HEADER_SIZE <= len(data):
+        _, message_type, sequence_number, body_length = HEADER_STRUCT.unpack_from(data, offset)
+        body = data[offset + HEADER_SIZE:offset + HEADER_SIZE + body_length]
+        frames.append((message_type, sequence_number, body))
+        offset += HEADER_SIZE + body_length
+    return frames
+
+
+class CountingSocket:
+    """Socket wrapper that counts, and optionally captures, everything sent through it"""
+
+    def __init__(self, sock, stats, capture, controller_id, channel):
+        self.sock = sock
+        self.stats = stats
+        self.capture = capture
+        self.controller_id = controller_id
+        self.channel = channel
+
+    def sendall(self, data):
+        if self.capture is not None:
+            self.capture.write(self.controller_id, self.channel, bytes(data))
+        self.stats.sent(data)
+        self.sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+class LoadStats:
+    """Counters and latency samples shared by all simulated controllers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_sent = {}  # MessageType -> frames
+        self.bytes_sent = 0
+        self.frames_received = {}  # MessageType -> frames
+        self.errors = {}  # kind -> count
+        self.latencies = {}  # kind -> seconds
+
+    def sent(self, data):
+        with self.lock:
+            self.bytes_sent += len(data)
+            for message_type, _, _ in split_frames(data):
+                self.frames_sent[message_type] = self.frames_sent.get(message_type, 0) + 1
+
+    def received(self, message_type):
+        with self.lock:
+            self.frames_received[message_type] = self.frames_received.get(message_type, 0) + 1
+
+    def error(self, kind, count=1):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + count
+
+    def latency(self, kind, seconds):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def report(self, elapsed):
+        with self.lock:
+            frames = sum(self.frames_sent.values())
+            latencies = {}
+            for kind, samples in sorted(self.latencies.items()):
+                samples = sorted(samples)
+                latencies[kind] = {
+                    "count": len(samples),
+                    "p50_ms": percentile(samples, 0.50) * 1000,
+                    "p99_ms": percentile(samples, 0.99) * 1000,
+                    "p999_ms": percentile(samples, 0.999) * 1000,
+                    "max_ms": samples[-1] * 1000,
+                }
+            return {
+                "elapsed_s": elapsed,
+                "frames_sent": frames,
+                "bytes_sent": self.bytes_sent,
+                "frames_per_sec": frames / elapsed if elapsed else 0.0,
+                "bytes_per_sec": self.bytes_sent / elapsed if elapsed else 0.0,
+                "frames_sent_by_type": {str(k): v for k, v in sorted(self.frames_sent.items())},
+                "frames_received_by_type": {str(k): v for k, v in sorted(self.frames_received.items())},
+                "latency": latencies,
+                "errors": dict(sorted(self.errors.items())),
+            }
+
+
+def shutdown(sock):
+    """Close a socket and wake a reader thread blocked on it"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+class AckTracker:
+    """Matches EVENT_RECEIVED pushes to the EVENTs sent on one data socket"""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.pending = {}  # SequenceNumber -> perf_counter() at send
+        self.condition = threading.Condition()
+
+    def expect(self, sequence_number):
+        with self.condition:
+            self.pending[sequence_number] = time.perf_counter()
+
+    def read(self, sock):
+        """Reader thread: runs until the socket is closed"""
+        while True:
+            try:
+                frame = recv_message(sock)
+            except (OSError, ValueError):
+                frame = None
+            if frame is None:
+                break
+            header, _ = frame
+            self.stats.received(header.message_type)
+            if header.message_type == EVENT_RECEIVED_MESSAGE_TYPE:
+                with self.condition:
+                    sent = self.pending.pop(header.sequence_number, None)
+                    self.condition.notify_all()
+                if sent is not None:
+                    self.stats.latency("event_ack", time.perf_counter() - sent)
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        """Wait for the outstanding acknowledgements; the ones still missing count as errors"""
+        with self.condition:
+            self.condition.wait_for(lambda: not self.pending, timeout)
+            missing = len(self.pending)
+            self.pending.clear()
+        if missing:
+            self.stats.error("event_ack_timeout", missing)
+
+
+def make_config(logging_files, logging_dir):
+    files = [LoggingFile(i, "1", f"load{i}_", "_raw", "bin") for i in range(logging_files)]
+    return DataRecordConfigMsg(Header(0, 0, 0, 0), logging_dir, 1, 10, 20, 60, 0, files,
+                               MetaData({"source": "load_generator"}, ""))
+
+
+class SimulatedController:
+    """One controller: handshake, START, EVENT bursts and START/END cycles at fixed rates, END"""
+
+    def __init__(self, controller_id, host, ports, options, stats, capture=None):
+        self.controller_id = controller_id
+        self.host = host
+        self.ports = ports
+        self.options = options
+        self.stats = stats
+        self.capture = capture
+        self.sequence_number = 0
+        self.acks = AckTracker(stats)
+        self.config_body = bytes(CONFIG_CODEC.encode(make_config(options.logging_files, options.logging_dir),
+                                                     HEADER_SIZE))
+
+    def open(self, channel, timeout):
+        # Every frame sent is counted, handshake included, as replay counts the captured bytes
+        sock = open_connection(self.host, self.ports[channel], timeout)
+        return CountingSocket(sock, self.stats, self.capture, self.controller_id, channel)
+
+    def next_sequence(self):
+        self.sequence_number += 1
+        return self.sequence_number
+
+    def send_config(self, sock, message_type):
+        package = bytearray(self.config_body)
+        HEADER_STRUCT.pack_into(package, 0, time.time_ns(), message_type, self.next_sequence(),
+                                len(package) - HEADER_SIZE)
+        sock.sendall(package)
+
+    def send_event(self, sock):
+        sequence_number = self.next_sequence()
+        self.acks.expect(sequence_number)
+        sock.sendall(HEADER_STRUCT.pack(time.time_ns(), COMMAND_MESSAGE_TYPE, sequence_number, len(EVENT_BODY))
+                     + EVENT_BODY)
+
+    def run(self, deadline):
+        started = time.perf_counter()
+        try:
+            control_socket = self.open(CONTROL_CHANNEL, HANDSHAKE_TIMEOUT)
+        except OSError:
+            self.stats.error("connect")
+            return
+        try:
+            try:
+                first = self.next_sequence()
+                self.sequence_number += 1  # 1->2 and 3->4 use two sequence numbers
+                run_handshake(control_socket, first, time.monotonic() + HANDSHAKE_TIMEOUT)
+                data_socket = self.open(DATA_CHANNEL, HANDSHAKE_TIMEOUT)
+                data_socket.settimeout(None)
+            except Exception:
+                self.stats.error("handshake")
+                return
+            self.stats.latency("handshake", time.perf_counter() - started)
+            for _, response_type in HANDSHAKE_STEPS:
+                self.stats.received(response_type)
+            reader = threading.Thread(target=self.acks.read, args=(data_socket,), daemon=True)
+            reader.start()
+            try:
+                self.drive(data_socket, deadline)
+            except OSError:
+                self.stats.error("send")
+            finally:
+                shutdown(data_socket)
+                reader.join()
+        finally:
+            control_socket.close()
+
+    def drive(self, sock, deadline):
+        options = self.options
+        event_interval = 1.0 / options.event_rate if options.event_rate > 0 else None
+        cycle_interval = 1.0 / options.cycle_rate if options.cycle_rate > 0 else None
+        now = time.monotonic()
+        next_event = now + event_interval if event_interval else float('inf')
+        next_cycle = now + cycle_interval if cycle_interval else float('inf')
+        self.send_config(sock, START_CONFIG_MESSAGE_TYPE)
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wake = min(next_event, next_cycle, deadline)
+            if wake > now:
+                time.sleep(wake - now)
+                continue
+            if next_event <= now:
+                for _ in range(options.burst):
+                    self.send_event(sock)
+                next_event += event_interval
+            if next_cycle <= now:
+                self.send_config(sock, END_CONFIG_MESSAGE_TYPE)
+                self.send_config(sock, START_CONFIG_MESSAGE_TYPE)
+                next_cycle += cycle_interval
+        self.acks.wait(ACK_TIMEOUT)
+        self.send_config(sock, END_CONFIG_MESSAGE_TYPE)
+
+
+def run_load(host, ports, options, capture_path=None):
+    """Run options.controllers simulated controllers for options.duration seconds; returns the report"""
+    stats = LoadStats()
+    capture = CaptureWriter(capture_path) if capture_path else None
+    controllers = [SimulatedController(i, host, ports, options, stats, capture) for i in range(options.controllers)]
+    started = time.monotonic()
+    deadline = started + options.duration
+    threads = [threading.Thread(target=controller.run, args=(deadline,), daemon=True) for controller in controllers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if capture is not None:
+        capture.close()
+    return stats.report(time.monotonic() - started)
+
+
+class ReplayedController:
+    """Connections and outstanding EVENTs of one captured controller"""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.sockets = {}  # channel -> socket
+        self.readers = []
+        self.failed = False
+        self.acks = AckTracker(stats)
+
+    def socket(self, host, ports, channel):
+        sock = self.sockets.get(channel)
+        if sock is None:
+            sock = self.sockets[channel] = open_connection(host, ports[channel], HANDSHAKE_TIMEOUT)
+            sock.settimeout(None)
+            reader = threading.Thread(target=self.acks.read, args=(sock,), daemon=True)
+            reader.start()
+            self.readers.append(reader)
+        return sock
+
+    def close(self):
+        for sock in self.sockets.values():
+            shutdown(sock)
+        for reader in self.readers:
+            reader.join()
+
+
+def replay(path, host, ports, speed=1.0):
+    """Replay a capture at speed times the recorded pace (0 = as fast as possible); returns the report
+
+    Records are sent in capture order from one thread, so START/END/EVENT keep their relative order
+    across controllers. As in a live run, a controller's final END first waits (up to ACK_TIMEOUT) for
+    that controller's outstanding EVENT acknowledgements; records after it are delayed meanwhile.
+    """
+    # Index of the record carrying each controller's final END
+    final_end = {}
+    for index, (_, controller_id, _, data) in enumerate(read_capture(path)):
+        if any(message_type == END_CONFIG_MESSAGE_TYPE for message_type, _, _ in split_frames(data)):
+            final_end[controller_id] = index
+    stats = LoadStats()
+    controllers = {}  # controller id -> ReplayedController
+    started = time.monotonic()
+    try:
+        for index, (timestamp, controller_id, channel, data) in enumerate(read_capture(path)):
+            if speed > 0:
+                delay = started + timestamp / 1e9 / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            controller = controllers.get(controller_id)
+            if controller is None:
+                controller = controllers[controller_id] = ReplayedController(stats)
+            if controller.failed:
+                continue
+            try:
+                sock = controller.socket(host, ports, channel)
+            except OSError:
+                stats.error("connect")
+                controller.failed = True
+                continue
+            if final_end.get(controller_id) == index:
+                controller.acks.wait(ACK_TIMEOUT)
+            for message_type, sequence_number, body in split_frames(data):
+                if message_type == COMMAND_MESSAGE_TYPE and bytes(body) == EVENT_BODY:
+                    controller.acks.expect(sequence_number)
+            try:
+                stats.sent(data)
+                sock.sendall(data)
+            except OSError:
+                stats.error("send")
+                controller.failed = True
+        for controller in controllers.values():
+            controller.acks.wait(ACK_TIMEOUT)
+    finally:
+        for controller in controllers.values():
+            controller.close()
+    return stats.report(time.monotonic() - started)
+
+
+def print_report(report):
+    print(f"{report['frames_sent']} frames, {report['bytes_sent']} bytes in {report['elapsed_s']:.2f} s: "
+          f"{report['frames_per_sec']:.0f} frames/s, {report['bytes_per_sec'] / 1e6:.2f} MB/s")
+    print(f"  sent by MessageType: {report['frames_sent_by_type']}")
+    print(f"  received by MessageType: {report['frames_received_by_type']}")
+    for kind, latency in report["latency"].items():
+        print(f"  {kind} latency ({latency['count']}): p50 {latency['p50_ms']:.2f} ms, "
+              f"p99 {latency['p99_ms']:.2f} ms, p999 {latency['p999_ms']:.2f} ms, max {latency['max_ms']:.2f} ms")
+    print(f"  errors: {report['errors'] or 'none'}")
+
+
+def parse_speed(value):
+    return 0.0 if value == "max" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a BackendProcess with simulated controllers, or replay a capture")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Simulate concurrent controllers")
+    run.add_argument("host")
+    run.add_argument("control_port", type=int)
+    run.add_argument("data_port", type=int)
+    run.add_argument("--controllers", type=int, default=10, help="Concurrent controllers")
+    run.add_argument("--duration", type=float, default=10.0, help="Seconds to keep sending")
+    run.add_argument("--event-rate", type=float, default=1.0, help="EVENT bursts per second per controller")
+    run.add_argument("--burst", type=int, default=1, help="EVENTs per burst")
+    run.add_argument("--cycle-rate", type=float, default=0.0, help="END+START pairs per second per controller")
+    run.add_argument("--logging-files", type=int, default=0, help="LoggingFile entries in the config")
+    run.add_argument("--logging-dir", default="/tmp/load_generator", help="Recording directory in the config")
+    run.add_argument("--capture", help="Record everything sent to this capture file")
+    run.add_argument("--output", help="Write the report as JSON")
+
+    play = commands.add_parser("replay", help="Send a capture again")
+    play.add_argument("capture")
+    play.add_argument("host")
+    play.add_argument("control_port", type=int)
+    play.add_argument("data_port", type=int)
+    play.add_argument("--speed", type=parse_speed, default=1.0, help="Pace multiplier, or 'max' (default 1)")
+    play.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    ports = [args.control_port, args.data_port]
+    if args.command == "run":
+        report = run_load(args.host, ports, args, args.capture)
+    else:
+        try:
+            report = replay(args.capture, args.host, ports, args.speed)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    sys.exit(1 if report["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import threading
+from collections import deque
+
+# What put() does when the queue is full
+OVERFLOW_BLOCK = "block"  # Wait for space (or until the timeout)
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # Discard the oldest queued message
+OVERFLOW_DROP_NEWEST = "drop_newest"  # Discard the message being added
+
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+
+class LoggingMsgQueue:
+    """Bounded, thread-safe FIFO with O(1) put/get and a batched drain.
+
+    A consumer calling drain() takes a whole batch under a single lock
+    acquisition, so high-rate producers and the consumer rarely contend.
+    """
+
+    def __init__(self, maxsize=10000, overflow=OVERFLOW_DROP_OLDEST):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item, timeout=None) -> bool:
+        """Add item. Returns False if it was dropped or the block timed out."""
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                elif not self._not_full.wait_for(lambda: len(self._items) < self.maxsize, timeout):
+                    self.dropped += 1
+                    return False
+            self._items.append(item)
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=0):
+        """Remove and return the oldest item, or None if nothing arrived within timeout (None waits forever)"""
+        with self._lock:
+            if not self._items and (timeout == 0 or not self._not_empty.wait_for(lambda: self._items, timeout)):
+                return None
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def drain(self, max_n=None, timeout=0):
+        """Remove and return up to max_n items (all if None) in FIFO order.
+
+        Waits up to timeout seconds for the first item; returns an empty list if none arrived.
+        """
+        with self._lock:
+            if not self._items and (timeout == 0 or not self._not_empty.wait_for(lambda: self._items, timeout)):
+                return []
+            if max_n is None or max_n >= len(self._items):
+                batch = list(self._items)
+                self._items = deque()
+            else:
+                popleft = self._items.popleft
+                batch = [popleft() for _ in range(max_n)]
+            self._not_full.notify_all()
+            return batch
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
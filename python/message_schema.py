@@ -0,0 +1,491 @@
+import os
+import struct
+import sys
+from typing import Callable, NamedTuple, Optional
+
+# Field kinds. Integers are little endian; every variable length field is prefixed by a u32.
+U8 = "u8"
+U32 = "u32"
+U64 = "u64"
+STRING = "string"  # u32 byte length + UTF-8 bytes
+LIST = "list"  # u32 item count + items encoded with Field.item
+META = "meta"  # u32 byte length + MetaData bytes (data_record_config_msg.encode_meta_data)
+
+_STRUCT_CODES = {U8: 'B', U32: 'I', U64: 'Q'}
+_NUMPY_TYPES = {U8: 'u1', U32: '<u4', U64: '<u8'}
+_CPP_TYPES = {U8: 'uint8_t', U32: 'uint32_t', U64: 'uint64_t', STRING: 'std::string', META: 'message_schema::MetaData'}  # Qualified: the member is also named MetaData
+
+
+class Field(NamedTuple):
+    name: str
+    kind: str
+    item: Optional['Schema'] = None  # Item schema of a LIST field
+    wire: Optional[str] = None  # Name on the C++ side, CamelCase of name by default
+
+    @property
+    def wire_name(self) -> str:
+        return self.wire or ''.join(part.capitalize() for part in self.name.split('_'))
+
+
+class Schema(NamedTuple):
+    name: str
+    fields: tuple
+    doc: str
+
+
+# The messages. Everything else (struct formats, dtypes, codecs, the C++ header) is derived from these.
+PROTOCOL_HEADER = Schema("ProtocolHeader", (
+    Field("timestamp", U64, wire="TimeStamp"),
+    Field("message_type", U8),
+    Field("sequence_number", U64),
+    Field("body_length", U32),
+), "Frame header in front of every message body")
+
+LOGGING_FILE = Schema("LoggingFile", (
+    Field("id", U32),
+    Field("enable", STRING),
+    Field("name_prefix", STRING),
+    Field("name_subfix", STRING),
+    Field("extension", STRING),
+), "One file of a recording")
+
+DATA_RECORD_CONFIG_MSG = Schema("DataRecordConfigMsg", (
+    Field("logging_directory_path", STRING),
+    Field("logging_mode", U32),
+    Field("history_time", U32),
+    Field("follow_time", U32),
+    Field("split_time", U32),
+    Field("data_length", U32),
+    Field("logging_file_list", LIST, LOGGING_FILE),
+    Field("meta_data", META),
+), "Body of the START/END config frames (MessageType 19/21)")
+
+DATA_RECORD_VIEWER_MSG = Schema("DataRecordViewerMsg", (
+    Field("register_num", STRING),
+    Field("issue_log", STRING),
+    Field("control_id", STRING),
+), "Body of a viewer message")
+
+SCHEMAS = (PROTOCOL_HEADER, LOGGING_FILE, DATA_RECORD_CONFIG_MSG, DATA_RECORD_VIEWER_MSG)
+
+
+def fixed_struct(schema: Schema) -> struct.Struct:
+    """struct.Struct of a schema made of integers only, such as the header"""
+    try:
+        return struct.Struct('<' + ''.join(_STRUCT_CODES[field.kind] for field in schema.fields))
+    except KeyError:
+        raise ValueError(f"{schema.name} has variable length fields") from None
+
+
+def numpy_dtype(schema: Schema):
+    """Packed numpy dtype of an integer-only schema, named like the C++ fields"""
+    import numpy as np  # Only needed for the dtype based API
+    return np.dtype([(field.wire_name, _NUMPY_TYPES[field.kind]) for field in schema.fields])
+
+
+class Codec(NamedTuple):
+    encode: Callable  # (msg, reserve=0, meta_keys=None) -> bytearray with `reserve` zeroed bytes in front
+    decode: Callable  # (view, offset=0, meta_keys=None) -> (msg, offset just past the message)
+    size: Callable  # (msg, meta_keys=None) -> encoded size in bytes
+    source: str  # Generated Python source, for inspection
+
+
+class _Generator:
+    def __init__(self, schema, make, item_makers, meta):
+        self.schema = schema
+        self.namespace = {'struct': struct, 'make': make}
+        if meta is not None:
+            self.namespace['meta_encode'], self.namespace['meta_decode'] = meta
+        self.item_makers = item_makers
+        self.structs = 0
+
+    def struct_name(self, codes):
+        name = f"S{self.structs}"
+        self.structs += 1
+        codec = struct.Struct('<' + ''.join(codes))
+        self.namespace[name + "_pack"] = codec.pack_into  # Bound methods, so calls skip the attribute lookup
+        self.namespace[name + "_unpack"] = codec.unpack_from
+        return name, codec.size
+
+    def item_schema(self, field):
+        item = field.item
+        if any(f.kind in (LIST, META) for f in item.fields):
+            raise ValueError(f"{self.schema.name}.{field.name}: list items may only hold integers and strings")
+        if item.name not in self.item_makers:
+            raise ValueError(f"No constructor given for {item.name}")
+        self.namespace[f"make_{item.name}"] = self.item_makers[item.name]
+        return item
+
+    @staticmethod
+    def constant_size(fields):
+        return sum(struct.calcsize('<' + _STRUCT_CODES[field.kind]) if field.kind in _STRUCT_CODES else 4
+                   for field in fields)
+
+    def layout(self, fields, value, target):
+        """Split fields into ('pack', [(code, encode expr, decode target)]) runs and the
+        ('bytes' | 'meta' | 'list', field) parts between them. A length or count prefix
+        joins the integers before it, so each run is one struct call."""
+        ops = []
+        run = []
+        for field in fields:
+            if field.kind in _STRUCT_CODES:
+                run.append((_STRUCT_CODES[field.kind], value(field), target(field)))
+                continue
+            if field.kind not in (STRING, META, LIST):
+                raise ValueError(f"{self.schema.name}.{field.name}: unknown field kind {field.kind!r}")
+            run.append(('I', f"len({value(field, True)})", f"n_{target(field)}"))
+            ops.append(('pack', run))
+            run = []
+            ops.append(('bytes' if field.kind == STRING else field.kind, field))
+        if run:
+            ops.append(('pack', run))
+        return ops
+
+    def generate(self):
+        schema = self.schema
+        if any(field.kind == META for field in schema.fields) and 'meta_encode' not in self.namespace:
+            raise ValueError(f"{schema.name} has a MetaData field but no meta codec was given")
+        # Strings are encoded once, while measuring; list items become tuples of their values
+        encode = ["def encode(msg, reserve=0, meta_keys=None):",
+                  f"    size = {self.constant_size(schema.fields)}"]
+        sizer = ["def size(msg, meta_keys=None):",
+                 f"    size = {self.constant_size(schema.fields)}"]
+        write = ["    out = bytearray(reserve + size)",
+                 "    offset = reserve"]
+        decode = ["def decode(view, offset=0, meta_keys=None):",
+                  "    try:"]
+
+        for field in schema.fields:
+            value = f"v_{field.name}"
+            if field.kind == STRING:
+                encode += [f"    {value} = msg.{field.name}.encode('utf-8')", f"    size += len({value})"]
+                sizer.append(f"    size += len(msg.{field.name}.encode('utf-8'))")
+            elif field.kind == META:
+                encode += [f"    {value} = meta_encode(msg.{field.name}, meta_keys)", f"    size += len({value})"]
+                sizer.append(f"    size += len(meta_encode(msg.{field.name}, meta_keys))")
+            elif field.kind == LIST:
+                item = self.item_schema(field)
+                strings = [f for f in item.fields if f.kind == STRING]
+                encode += [f"    {value} = []",
+                           f"    for item in msg.{field.name}:"]
+                encode += [f"        e_{f.name} = item.{f.name}.encode('utf-8')" for f in strings]
+                encode += ["        size += " + " + ".join(
+                               [str(self.constant_size(item.fields))] + [f"len(e_{f.name})" for f in strings]),
+                           f"        {value}.append(({', '.join(f'e_{f.name}' if f.kind == STRING else f'item.{f.name}' for f in item.fields)},))"]
+                sizer += [f"    for item in msg.{field.name}:",
+                          "        size += " + " + ".join([str(self.constant_size(item.fields))] + [
+                              f"len(item.{f.name}.encode('utf-8'))" for f in strings])]
+
+        def emit(ops, indent, item_names=None):
+            for op, part in ops:
+                if op == 'pack':
+                    name, run_size = self.struct_name([code for code, _, _ in part])
+                    write.extend([f"{indent}{name}_pack(out, offset, {', '.join(expr for _, expr, _ in part)})",
+                                  f"{indent}offset += {run_size}"])
+                    decode.extend([f"    {indent}{', '.join(t for _, _, t in part)}, = {name}_unpack(view, offset)",
+                                   f"    {indent}offset += {run_size}"])
+                    continue
+                field = part
+                local = f"i_{field.name}" if item_names else f"f_{field.name}"
+                data = f"i_{field.name}" if item_names else f"v_{field.name}"
+                if op == 'bytes':
+                    write.extend([f"{indent}out[offset:offset + len({data})] = {data}",
+                                  f"{indent}offset += len({data})"])
+                    decode.extend([f"    {indent}{local} = str(view[offset:offset + n_{local}], 'utf-8')",
+                                   f"    {indent}offset += n_{local}"])
+                elif op == 'meta':
+                    write.extend([f"{indent}out[offset:offset + len({data})] = {data}",
+                                  f"{indent}offset += len({data})"])
+                    decode.extend([f"    {indent}{local} = meta_decode(view[offset:offset + n_{local}], meta_keys)",
+                                   f"    {indent}offset += n_{local}"])
+                else:
+                    item = field.item
+                    names = [f"i_{f.name}" for f in item.fields]
+                    write.append(f"{indent}for {', '.join(names)}, in {data}:")
+                    decode.extend([f"    {indent}{local} = []",
+                                   f"    {indent}append = {local}.append",
+                                   f"    {indent}for _ in range(n_{local}):"])
+                    emit(self.layout(item.fields, lambda f, length=False: f"i_{f.name}", lambda f: f"i_{f.name}"),
+                         indent + "    ", names)
+                    decode.append(f"    {indent}    append(make_{item.name}({', '.join(names)}))")
+
+        emit(self.layout(schema.fields,
+                         lambda f, length=False: f"v_{f.name}" if length else f"msg.{f.name}",
+                         lambda f: f"f_{f.name}"), "    ")
+        # A short buffer either fails a struct read or leaves offset past the end
+        decode += ["    except struct.error as e:",
+                   f"        raise ValueError(\"Truncated {schema.name}\") from e",
+                   "    if offset > len(view):",
+                   f"        raise ValueError(f\"Truncated {schema.name}: need {{offset}} bytes, have {{len(view)}}\")",
+                   f"    return make({', '.join(f'f_{field.name}' for field in schema.fields)}), offset"]
+        source = "\n".join(encode + write + ["    return out", ""] + sizer + ["    return size", ""] + decode) + "\n"
+        exec(compile(source, f"<codec {schema.name}>", "exec"), self.namespace)
+        return Codec(self.namespace['encode'], self.namespace['decode'], self.namespace['size'], source)
+
+
+_codecs = {}
+
+
+def compile_codec(schema: Schema, make: Callable, item_makers: Optional[dict] = None,
+                  meta: Optional[tuple] = None) -> Codec:
+    """Generate (once) the encoder, decoder and size calculator of a schema.
+
+    make builds the message from the decoded field values, in schema order;
+    item_makers does the same for list items, by item schema name. meta is the
+    (encode, decode) pair used for META fields.
+    """
+    item_makers = item_makers or {}
+    key = (schema, make, tuple(sorted(item_makers.items(), key=lambda item: item[0])), meta)
+    codec = _codecs.get(key)
+    if codec is None:
+        codec = _codecs[key] = _Generator(schema, make, item_makers, meta).generate()
+    return codec
+
+
+_CPP_PREAMBLE = """\
+// Wire codecs shared with python/message_schema.py. Generated from the Python schemas, do not edit:
+//   python python/message_schema.py --cpp cpp/message_schema.h
+#ifndef MESSAGE_SCHEMA_H
+#define MESSAGE_SCHEMA_H
+
+#include <cstddef>
+#include <cstdint>
+#include <stdexcept>
+#include <string>
+#include <utility>
+#include <vector>
+
+namespace message_schema {
+
+{constants}
+
+// Little endian writer appending to a byte string
+class Writer {
+public:
+    std::string buffer;
+
+    void u8(uint8_t value) { buffer.push_back(static_cast<char>(value)); }
+    void u32(uint32_t value) { integer(value, 4); }
+    void u64(uint64_t value) { integer(value, 8); }
+    void string(const std::string& value) {
+        u32(static_cast<uint32_t>(value.size()));
+        buffer += value;
+    }
+    void varint(uint64_t value) {
+        while (value >= 0x80) {
+            u8(static_cast<uint8_t>((value & 0x7F) | 0x80));
+            value >>= 7;
+        }
+        u8(static_cast<uint8_t>(value));
+    }
+
+private:
+    void integer(uint64_t value, int size) {
+        for (int i = 0; i < size; ++i) {
+            buffer.push_back(static_cast<char>((value >> (8 * i)) & 0xFF));
+        }
+    }
+};
+
+// Little endian reader over a received buffer; throws std::runtime_error when it runs short
+class Reader {
+public:
+    Reader(const char* data, size_t size) : pos(reinterpret_cast<const uint8_t*>(data)), end(pos + size) {}
+
+    uint8_t u8() { need(1); return *pos++; }
+    uint32_t u32() { return static_cast<uint32_t>(integer(4)); }
+    uint64_t u64() { return integer(8); }
+    std::string bytes(size_t size) {
+        need(size);
+        std::string value(reinterpret_cast<const char*>(pos), size);
+        pos += size;
+        return value;
+    }
+    std::string string() { return bytes(u32()); }
+    uint64_t varint() {
+        uint64_t value = 0;
+        for (int shift = 0; ; shift += 7) {
+            uint8_t byte = u8();
+            value |= static_cast<uint64_t>(byte & 0x7F) << shift;
+            if (byte < 0x80) {
+                return value;
+            }
+        }
+    }
+    size_t remaining() const { return static_cast<size_t>(end - pos); }
+
+private:
+    void need(size_t size) {
+        if (remaining() < size) {
+            throw std::runtime_error("Truncated message");
+        }
+    }
+    uint64_t integer(int size) {
+        need(size);
+        uint64_t value = 0;
+        for (int i = 0; i < size; ++i) {
+            value |= static_cast<uint64_t>(pos[i]) << (8 * i);
+        }
+        pos += size;
+        return value;
+    }
+
+    const uint8_t* pos;
+    const uint8_t* end;
+};
+
+inline size_t varintSize(uint64_t value) {
+    size_t size = 1;
+    while (value >= 0x80) {
+        value >>= 7;
+        ++size;
+    }
+    return size;
+}
+
+// MetaData: flags, entry count, key/value pairs, issue (see data_record_config_msg.encode_meta_data).
+// Keys are always sent inline; messages using a session key dictionary (META_KEY_IDS) are rejected.
+struct MetaData {
+    std::vector<std::pair<std::string, std::string>> Data;
+    std::string Issue;
+};
+
+inline size_t metaBlobSize(const MetaData& m) {
+    size_t size = 1 + varintSize(m.Data.size());
+    for (const auto& entry : m.Data) {
+        size += varintSize(entry.first.size() << 1) + entry.first.size();
+        size += varintSize(entry.second.size()) + entry.second.size();
+    }
+    return size + varintSize(m.Issue.size()) + m.Issue.size();
+}
+
+inline size_t encodedSize(const MetaData& m) {
+    return 4 + metaBlobSize(m);
+}
+
+inline void encode(Writer& w, const MetaData& m) {
+    w.u32(static_cast<uint32_t>(metaBlobSize(m)));
+    w.u8(0);
+    w.varint(m.Data.size());
+    for (const auto& entry : m.Data) {
+        w.varint(entry.first.size() << 1);
+        w.buffer += entry.first;
+        w.varint(entry.second.size());
+        w.buffer += entry.second;
+    }
+    w.varint(m.Issue.size());
+    w.buffer += m.Issue;
+}
+
+inline void decode(Reader& r, MetaData& m) {
+    std::string blob = r.string();
+    Reader meta(blob.data(), blob.size());
+    if (meta.u8() & META_KEY_IDS) {
+        throw std::runtime_error("MetaData uses a key dictionary");
+    }
+    uint64_t count = meta.varint();
+    m.Data.clear();
+    for (uint64_t i = 0; i < count; ++i) {
+        uint64_t reference = meta.varint();
+        if (reference & 1) {
+            throw std::runtime_error("MetaData uses a key dictionary");
+        }
+        std::string key = meta.bytes(reference >> 1);
+        std::string value = meta.bytes(meta.varint());
+        m.Data.emplace_back(std::move(key), std::move(value));
+    }
+    m.Issue = meta.bytes(meta.varint());
+    if (meta.remaining() != 0) {
+        throw std::runtime_error("Trailing bytes after MetaData");
+    }
+}
+
+"""
+
+
+def _cpp_struct(schema):
+    lines = [f"// {schema.doc}", f"struct {schema.name} {{"]
+    for field in schema.fields:
+        if field.kind == LIST:
+            lines.append(f"    std::vector<{field.item.name}> {field.wire_name};")
+        elif field.kind in _STRUCT_CODES:
+            lines.append(f"    {_CPP_TYPES[field.kind]} {field.wire_name} = 0;")
+        else:
+            lines.append(f"    {_CPP_TYPES[field.kind]} {field.wire_name};")
+    lines.append("};")
+    lines.append("")
+
+    fixed = _Generator.constant_size([field for field in schema.fields if field.kind in _STRUCT_CODES])
+    variable = any(field.kind not in _STRUCT_CODES for field in schema.fields)
+    size = [f"inline size_t encodedSize(const {schema.name}&{' m' if variable else ''}) {{",
+            f"    size_t size = {fixed};"]
+    encode = [f"inline void encode(Writer& w, const {schema.name}& m) {{"]
+    decode = [f"inline void decode(Reader& r, {schema.name}& m) {{"]
+    for field in schema.fields:
+        member = f"m.{field.wire_name}"
+        if field.kind in _STRUCT_CODES:
+            encode.append(f"    w.{field.kind}({member});")
+            decode.append(f"    {member} = r.{field.kind}();")
+        elif field.kind == STRING:
+            size.append(f"    size += 4 + {member}.size();")
+            encode.append(f"    w.string({member});")
+            decode.append(f"    {member} = r.string();")
+        elif field.kind == META:
+            size.append(f"    size += encodedSize({member});")
+            encode.append(f"    encode(w, {member});")
+            decode.append(f"    decode(r, {member});")
+        elif field.kind == LIST:
+            size += ["    size += 4;",
+                     f"    for (const auto& item : {member}) {{",
+                     "        size += encodedSize(item);",
+                     "    }"]
+            encode += [f"    w.u32(static_cast<uint32_t>({member}.size()));",
+                       f"    for (const auto& item : {member}) {{",
+                       "        encode(w, item);",
+                       "    }"]
+            decode += ["    uint32_t count = r.u32();",
+                       f"    {member}.clear();",
+                       "    for (uint32_t i = 0; i < count; ++i) {",
+                       f"        {field.item.name} item;",
+                       "        decode(r, item);",
+                       f"        {member}.push_back(std::move(item));",
+                       "    }"]
+    size += ["    return size;", "}", ""]
+    return lines + size + encode + ["}", ""] + decode + ["}", ""]
+
+
+def emit_cpp_header() -> str:
+    """C++ header with the same structs, constants and byte layout as the Python codecs"""
+    import tcp_common  # Not imported at module level: tcp_common builds its header struct from this module
+    constants = [
+        f"constexpr size_t HEADER_SIZE = {fixed_struct(PROTOCOL_HEADER).size};",
+        f"constexpr uint32_t MAX_BODY_LENGTH = {tcp_common.MAX_BODY_LENGTH};",
+        "constexpr uint8_t META_KEY_IDS = 0x01;  // MetaData flag: keys sent as session dictionary ids",
+        "",
+        "// MessageType values",
+    ]
+    for name, value in vars(tcp_common).items():
+        if name.endswith(("_MESSAGE_TYPE", "_MSG_TYPE")):
+            constants.append(f"constexpr uint8_t {name} = {value};")
+    lines = [_CPP_PREAMBLE.replace("{constants}", "\n".join(constants))]
+    for schema in SCHEMAS:
+        lines += _cpp_struct(schema)
+    lines += ["}  // namespace message_schema", "", "#endif  // MESSAGE_SCHEMA_H", ""]
+    return "\n".join(lines)
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] != ["--cpp"] or len(args) > 2:
+        print("Usage: python message_schema.py --cpp [OUTPUT]")
+        print("Writes the C++ header, by default to cpp/message_schema.h")
+        sys.exit(1)
+    path = args[1] if len(args) == 2 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        "..", "cpp", "message_schema.h")
+    with open(path, "w") as f:
+        f.write(emit_cpp_header())
+    print(f"Wrote {os.path.normpath(path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import bisect
+import threading
+
+# Latency buckets in seconds, from sub-millisecond loopback to the handshake timeout
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labels, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of samples already in ascending order; 0.0 when there are none"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+class _Sharded:
+    """Per-thread storage: each thread updates only its own dict, so updates take no lock.
+
+    A thread's shard is registered once under a lock; readers merge copies of all shards.
+    Shards of threads that have exited are folded into one retired total, so
+    connection threads that come and go do not accumulate.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # (thread, shard)
+        self._retired = {}  # Totals of exited threads
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._sweep()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _sweep(self):
+        # Called with _shards_lock held; an exited thread no longer writes to its shard
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._fold(self._retired, shard)
+        self._shards = live
+
+    def _fold(self, base, shard):
+        raise NotImplementedError
+
+    def _snapshots(self):
+        with self._shards_lock:
+            self._sweep()
+            shards = [shard for _, shard in self._shards]
+            retired = {}
+            self._fold(retired, self._retired)
+        return [retired] + [shard.copy() for shard in shards]
+
+
+class Counter(_Sharded):
+    """Monotonic count, optionally split by label values"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, labels=()):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _fold(self, base, shard):
+        for labels, value in shard.items():
+            base[labels] = base.get(labels, 0) + value
+
+    def values(self) -> dict:
+        merged = {}
+        for shard in self._snapshots():
+            self._fold(merged, shard)
+        return merged
+
+    def value(self, labels=()):
+        return self.values().get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram(_Sharded):
+    """Distribution of observed values over fixed upper bounds, optionally split by label values"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # [count per bucket (last one is +Inf), sum]
+            entry = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def _fold(self, base, shard):
+        for labels, (counts, total) in shard.items():
+            current = base.setdefault(labels, [[0] * len(counts), 0.0])
+            current[0] = [a + b for a, b in zip(current[0], counts)]
+            current[1] += total
+
+    def values(self) -> dict:
+        """labels -> (cumulative bucket counts, sum, count)"""
+        merged = {}
+        for shard in self._snapshots():
+            self._fold(merged, shard)
+        result = {}
+        for labels, (counts, total) in merged.items():
+            cumulative = []
+            running = 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            result[labels] = (cumulative, total, running)
+        return result
+
+    def samples(self):
+        bounds = [_format_value(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for labels, (cumulative, total, count) in sorted(self.values().items()):
+            for bound, value in zip(bounds, cumulative):
+                yield self.name + "_bucket", _format_labels(self.labelnames, labels, (("le", bound),)), value
+            yield self.name + "_sum", _format_labels(self.labelnames, labels), total
+            yield self.name + "_count", _format_labels(self.labelnames, labels), count
+
+
+class Gauge:
+    """Current value, either set directly or read from a function when scraped"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def set_function(self, function, labels=()):
+        self._functions[labels] = function
+
+    def remove(self, labels=()):
+        self._values.pop(labels, None)
+        self._functions.pop(labels, None)
+
+    def values(self) -> dict:
+        result = dict(self._values)
+        for labels, function in list(self._functions.items()):
+            try:
+                result[labels] = function()
+            except Exception:
+                continue  # A source that went away is simply not reported
+        return result
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class MetricsRegistry:
+    """Named metrics of one process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def default_registry() -> MetricsRegistry:
+    """Process wide registry shared by every module"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry()
+        return _default_registry
+
+
+def start_http_server(port, host='127.0.0.1', registry=None):
+    """Serve GET /metrics on a daemon thread. Binds to localhost unless host says otherwise."""
+    # Imported here: http.server is slow to import and most processes never serve metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = (registry or default_registry()).render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are too frequent to print
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def serve_from_args(args):
+    """Remove --metrics-port PORT from args and start the endpoint if it was given"""
+    if "--metrics-port" not in args:
+        return None
+    i = args.index("--metrics-port")
+    if i + 1 >= len(args):
+        raise ValueError("--metrics-port needs a value")
+    port = int(args[i + 1])
+    del args[i:i + 2]
+    return start_http_server(port)
@@ -0,0 +1,215 @@
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+from backend_log import ERROR, define_event, get_logger
+from indexed_log import INDEX_ENTRY, index_path
+from logging_msg_queue import LoggingMsgQueue, OVERFLOW_DROP_NEWEST
+from tcp_common import HEADER_STRUCT, LOGGING_MSG_TYPE
+
+# LOGGING_MSG_TYPE bodies start with the LoggingFile id of the stream they belong to
+STREAM_ID_STRUCT = struct.Struct('<I')
+
+BLOCK_SIZE = 4096  # Writes are issued in multiples of this
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024  # Per-stream write buffer
+DEFAULT_QUEUE_SIZE = 100000  # Pending payloads before new ones are dropped
+DRAIN_BATCH = 1024
+INDEX_BUFFER_SIZE = 64 * 1024
+
+RECORD_FORMAT_RAW = "raw"  # Payload bytes only
+RECORD_FORMAT_INDEXED = "indexed"  # Header framed records plus a sidecar index, see indexed_log
+
+log = get_logger()
+
+LOG_WRITE_FAILED = define_event("Recorder write failed: {}", ERROR)
+LOG_CLOSE_FAILED = define_event("Recorder close failed: {}", ERROR)
+
+
+def is_enabled(value) -> bool:
+    """LoggingFile.enable is sent as text"""
+    return str(value).strip().lower() in ("1", "true", "yes", "on", "enable", "enabled")
+
+
+def make_file_name(logging_file, started, suffix="") -> str:
+    extension = logging_file.extension.lstrip('.')
+    name = f"{logging_file.name_prefix}{started.strftime('%Y%m%d_%H%M%S')}{logging_file.name_subfix}{suffix}"
+    return f"{name}.{extension}" if extension else name
+
+
+class StreamFile:
+    """One open output file with an aligned write buffer"""
+
+    def __init__(self, directory, logging_file, buffer_size, record_format=RECORD_FORMAT_INDEXED, file_suffix=""):
+        self.directory = directory
+        self.logging_file = logging_file
+        self.file_suffix = file_suffix
+        self.indexed = record_format == RECORD_FORMAT_INDEXED
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.used = 0
+        self.offset = 0  # Bytes written to the current file, including the buffer
+        self.file = None
+        self.index_file = None
+        self.index_buffer = bytearray()
+        self.opened_at = 0.0
+        self.path = None
+
+    def open(self):
+        started = datetime.now()
+        path = os.path.join(self.directory, make_file_name(self.logging_file, started, self.file_suffix))
+        if path == self.path or os.path.exists(path):  # Split within the same second
+            base, ext = os.path.splitext(path)
+            path = f"{base}_{started.strftime('%f')}{ext}"
+        self.file = open(path, 'wb', buffering=0)
+        if self.indexed:
+            self.index_file = open(index_path(path), 'wb', buffering=0)
+        self.path = path
+        self.offset = 0
+        self.opened_at = time.monotonic()
+
+    def write_record(self, header, payload):
+        """Write one payload, framed by its header and indexed when the format is indexed"""
+        if not self.indexed:
+            self.write(payload)
+            return
+        if header is None:
+            timestamp, message_type, sequence_number = time.time_ns(), LOGGING_MSG_TYPE, 0
+        else:
+            timestamp, message_type, sequence_number = header.timestamp, header.message_type, header.sequence_number
+        self.index_buffer += INDEX_ENTRY.pack(timestamp, sequence_number, self.offset)
+        self.write(HEADER_STRUCT.pack(timestamp, message_type, sequence_number, len(payload)))
+        self.write(payload)
+        if len(self.index_buffer) >= INDEX_BUFFER_SIZE:
+            # Data keeps its aligned buffer; readers skip index entries not yet backed by data
+            self.index_file.write(self.index_buffer)
+            self.index_buffer = bytearray()
+
+    def write(self, payload):
+        payload = memoryview(payload).cast('B')
+        self.offset += len(payload)
+        size = len(self.buffer)
+        while payload:
+            n = min(len(payload), size - self.used)
+            self.view[self.used:self.used + n] = payload[:n]
+            self.used += n
+            payload = payload[n:]
+            if self.used == size:
+                self.file.write(self.view)
+                self.used = 0
+
+    def flush(self):
+        if self.used:
+            self.file.write(self.view[:self.used])
+            self.used = 0
+        if self.index_buffer:
+            self.index_file.write(self.index_buffer)
+            self.index_buffer = bytearray()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+            if self.index_file is not None:
+                self.index_file.close()
+                self.index_file = None
+
+
+class StreamRecorder:
+    """Writes enabled LoggingMsg streams to files under logging_directory_path.
+
+    write() only queues the payload; a dedicated writer thread copies payloads
+    into large per-stream buffers, issues block-aligned writes and starts a new
+    file for every stream each split_time seconds. Payloads that do not fit in
+    the queue are dropped and counted instead of stalling the caller.
+    """
+
+    def __init__(self, directory, split_time, logging_files, buffer_size=DEFAULT_BUFFER_SIZE,
+                 queue_size=DEFAULT_QUEUE_SIZE, record_format=RECORD_FORMAT_INDEXED, file_suffix=""):
+        self.directory = directory or "."
+        self.record_format = record_format
+        self.file_suffix = file_suffix  # Keeps files of several writers to the same directory apart
+        self.split_time = float(split_time)
+        self.buffer_size = max(BLOCK_SIZE, buffer_size // BLOCK_SIZE * BLOCK_SIZE)
+        self.logging_files = {int(f.id): f for f in logging_files if is_enabled(f.enable)}
+        self.queue = LoggingMsgQueue(queue_size, OVERFLOW_DROP_NEWEST)
+        self.streams = {}
+        self.bytes_written = 0
+        self.files_opened = 0
+        self.lost = 0  # Records that failed to write
+        self.running = True
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Build from a DataRecordConfigMsg"""
+        return cls(config.logging_directory_path, config.split_time, config.logging_file_list, **kwargs)
+
+    @property
+    def dropped(self):
+        return self.queue.dropped + self.lost
+
+    def write(self, stream_id, payload, header=None) -> bool:
+        if stream_id not in self.logging_files:
+            return False
+        return self.queue.put((stream_id, payload, header))
+
+    def write_frame(self, body, header=None) -> bool:
+        """Queue a LOGGING_MSG_TYPE body: stream id followed by the payload"""
+        if len(body) < STREAM_ID_STRUCT.size:
+            return False
+        stream_id = STREAM_ID_STRUCT.unpack_from(body, 0)[0]
+        return self.write(stream_id, memoryview(body)[STREAM_ID_STRUCT.size:], header)
+
+    def run(self):
+        while self.running or self.queue:
+            batch = self.queue.drain(DRAIN_BATCH, timeout=0.2)
+            error = None
+            # A record that fails is counted and skipped; the rest of the batch is still written
+            for stream_id, payload, header in batch:
+                try:
+                    self.write_record(stream_id, payload, header)
+                except Exception as e:
+                    self.lost += 1
+                    error = e
+            try:
+                self.rotate_due()
+            except Exception as e:
+                error = e
+            if error is not None:
+                log.log(LOG_WRITE_FAILED, str(error))
+        for stream in self.streams.values():
+            try:
+                stream.close()
+            except Exception as e:
+                log.log(LOG_CLOSE_FAILED, str(e))
+
+    def write_record(self, stream_id, payload, header):
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            stream = StreamFile(self.directory, self.logging_files[stream_id], self.buffer_size,
+                                self.record_format, self.file_suffix)
+            stream.open()
+            self.files_opened += 1
+            self.streams[stream_id] = stream
+        stream.write_record(header, payload)
+        self.bytes_written += len(payload)
+
+    def rotate_due(self):
+        if self.split_time <= 0:
+            return
+        now = time.monotonic()
+        for stream in self.streams.values():
+            if now - stream.opened_at >= self.split_time:
+                stream.close()
+                stream.open()
+                self.files_opened += 1
+
+    def close(self):
+        """Write out everything queued, close all files and stop the writer thread"""
+        self.running = False
+        self.thread.join()
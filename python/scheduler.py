@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import threading
+import time
+
+COMPACT_THRESHOLD = 1024  # Heap size from which stale entries are purged
+
+
+class TimerHandle:
+    """A scheduled callback. cancel() is O(1); the stale heap entry is skipped when it comes up."""
+
+    __slots__ = ("scheduler", "callback", "args", "when", "generation", "active")
+
+    def __init__(self, scheduler, callback, args):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.args = args
+        self.when = 0.0
+        self.generation = 0
+        self.active = False
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+
+class Scheduler:
+    """Runs every timer of the process on one thread, ordered by a heap of deadlines.
+
+    Cancelling only flips a flag and rescheduling pushes a new entry with a
+    bumped generation, so neither searches the heap. Callbacks run on the
+    scheduler thread and must be short; anything that can block belongs on
+    another thread. The thread starts with the first scheduled timer.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.active_timers = 0
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def call_later(self, delay, callback, *args):
+        return self.reschedule(TimerHandle(self, callback, args), delay)
+
+    def reschedule(self, handle, delay):
+        """Move handle to now + delay, reviving it if it was cancelled or has already fired"""
+        with self._condition:
+            if not self._running:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            if not handle.active:
+                handle.active = True
+                self.active_timers += 1
+            handle.generation += 1
+            handle.when = time.monotonic() + delay
+            heapq.heappush(self._heap, (handle.when, next(self._counter), handle.generation, handle))
+            if self._heap[0][3] is handle:
+                self._condition.notify()  # New earliest deadline
+            if len(self._heap) > COMPACT_THRESHOLD and len(self._heap) > 2 * self.active_timers:
+                self._heap = [entry for entry in self._heap if self._is_live(entry)]
+                heapq.heapify(self._heap)
+        return handle
+
+    def cancel(self, handle):
+        with self._condition:
+            if handle.active:
+                handle.active = False
+                self.active_timers -= 1
+
+    @staticmethod
+    def _is_live(entry):
+        handle = entry[3]
+        return handle.active and entry[2] == handle.generation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._running:
+                        return
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    entry = self._heap[0]
+                    if not self._is_live(entry):
+                        heapq.heappop(self._heap)
+                        continue
+                    delay = entry[0] - time.monotonic()
+                    if delay > 0:
+                        self._condition.wait(delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    handle = entry[3]
+                    handle.active = False
+                    self.active_timers -= 1
+                    break
+            try:
+                handle.callback(*handle.args)
+            except Exception as e:
+                print(f"Scheduled callback {getattr(handle.callback, '__name__', handle.callback)} failed: {str(e)}")
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    """Process wide scheduler shared by every backend"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Scheduler()
+        return _default_scheduler
@@ -0,0 +1,145 @@
+import struct
+from collections import OrderedDict, deque
+
+from tcp_common import SEQUENCE_NUMBER_OFFSET, SEQUENCE_NUMBER_STRUCT
+
+# Pipelined sessions: the controller opens a session on a backend connection with
+# PIPELINE_OPEN (body OPEN_STRUCT) and from then on numbers every frame it sends with a
+# per-backend SequenceNumber, keeping up to `window` frames unacknowledged. The backend
+# answers with PIPELINE_ACK: SequenceNumber is the highest sequence received without a
+# gap, the body lists the sequences received beyond it (ACK_COUNT_STRUCT + u64 each).
+# A session outlives its connection, so after a reconnect only the frames the backend
+# never saw are sent again.
+OPEN_STRUCT = struct.Struct('<QQI')  # Session id, first sequence number, window size
+ACK_COUNT_STRUCT = struct.Struct('<I')
+ACK_ENTRY_STRUCT = struct.Struct('<Q')
+
+DEFAULT_WINDOW = 64  # Frames in flight per backend
+
+# ReceiveWindow.receive() results
+ACCEPTED = "accepted"  # In order; delivered with whatever it unblocked
+BUFFERED = "buffered"  # Ahead of a gap; held until the gap is filled
+DUPLICATE = "duplicate"  # Already delivered or already held
+OUT_OF_WINDOW = "out_of_window"  # Too far ahead; dropped and left for retransmit
+
+
+def encode_ack(sequences) -> bytes:
+    sequences = list(sequences)
+    return ACK_COUNT_STRUCT.pack(len(sequences)) + b''.join(ACK_ENTRY_STRUCT.pack(s) for s in sequences)
+
+
+def decode_ack(body) -> list:
+    count = ACK_COUNT_STRUCT.unpack_from(body, 0)[0]
+    return [ACK_ENTRY_STRUCT.unpack_from(body, ACK_COUNT_STRUCT.size + i * ACK_ENTRY_STRUCT.size)[0]
+            for i in range(count)]
+
+
+class ReceiveWindow:
+    """Backend side of a session: delivers frames in sequence order exactly once"""
+
+    def __init__(self, first_sequence=1, size=DEFAULT_WINDOW):
+        self.next_expected = first_sequence
+        self.size = size
+        self.pending = {}  # sequence -> item received ahead of a gap
+        self.gaps = 0
+        self.duplicates = 0
+
+    @property
+    def cumulative_ack(self):
+        return self.next_expected - 1
+
+    def selective_acks(self):
+        return sorted(self.pending)
+
+    def receive(self, sequence, item):
+        """Returns (status, items now deliverable in order)"""
+        if sequence < self.next_expected or sequence in self.pending:
+            self.duplicates += 1
+            return DUPLICATE, []
+        if sequence >= self.next_expected + self.size:
+            return OUT_OF_WINDOW, []
+        if sequence > self.next_expected:
+            if not self.pending:
+                self.gaps += 1
+            self.pending[sequence] = item
+            return BUFFERED, []
+        ready = [item]
+        self.next_expected += 1
+        while self.next_expected in self.pending:
+            ready.append(self.pending.pop(self.next_expected))
+            self.next_expected += 1
+        return ACCEPTED, ready
+
+
+class SendWindow:
+    """Controller side of a session: numbers packages and keeps them until acknowledged.
+
+    Packages beyond the window wait in a backlog and are numbered when room frees up.
+    """
+
+    def __init__(self, size=DEFAULT_WINDOW, first_sequence=1):
+        self.size = size
+        self.next_sequence = first_sequence
+        self.unacked = OrderedDict()  # sequence -> package, in send order
+        self.sacked = set()  # Unacked sequences the backend reported as held
+        self.sent = set()  # Unacked sequences already sent on the current connection
+        self.backlog = deque()
+        self.retransmits = 0
+
+    @property
+    def first_unacked(self):
+        return next(iter(self.unacked)) if self.unacked else self.next_sequence
+
+    def in_flight(self):
+        return len(self.unacked)
+
+    def push(self, package):
+        """Queue a package; returns the packages that may be sent now"""
+        self.backlog.append(package)
+        return self._fill()
+
+    def _fill(self):
+        ready = []
+        while self.backlog and len(self.unacked) < self.size:
+            package = bytearray(self.backlog.popleft())
+            SEQUENCE_NUMBER_STRUCT.pack_into(package, SEQUENCE_NUMBER_OFFSET, self.next_sequence)
+            package = bytes(package)
+            self.unacked[self.next_sequence] = package
+            self.sent.add(self.next_sequence)
+            self.next_sequence += 1
+            ready.append(package)
+        return ready
+
+    def new_connection(self):
+        """Nothing unacked has been sent on the connection about to be used"""
+        self.sent.clear()
+
+    def ack(self, cumulative, selective=(), resend_all=False):
+        """Apply an acknowledgement; returns the retransmits followed by newly admitted packages.
+
+        A sequence not yet sent on the current connection is retransmitted when a
+        later one was selectively acked (a gap), or, with resend_all, whenever the
+        backend does not hold it.
+        """
+        unacked = self.unacked
+        while unacked:
+            sequence = next(iter(unacked))
+            if sequence > cumulative:
+                break
+            del unacked[sequence]
+            self.sacked.discard(sequence)
+            self.sent.discard(sequence)
+        self.sacked.update(s for s in selective if s in unacked)
+        if resend_all:
+            horizon = self.next_sequence
+        else:
+            horizon = max(self.sacked) if self.sacked else cumulative
+        resend = []
+        for sequence, package in unacked.items():
+            if sequence >= horizon:
+                break
+            if sequence not in self.sacked and sequence not in self.sent:
+                self.sent.add(sequence)
+                resend.append(package)
+        self.retransmits += len(resend)
+        return resend + self._fill()
@@ -0,0 +1,72 @@
+import threading
+
+SESSION_SHARDS = 16  # Independent locks; controllers in different shards never contend
+
+
+class ControllerSession:
+    """START/END state, EVENT debounce, READY timer and sequence tracking of one controller.
+
+    Fields are guarded by lock; the backend holds it only for state changes,
+    never while sending.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.lock = threading.Lock()
+        self.is_started = False
+        self.event_timer = None  # TimerHandle of the pending READY
+        self.last_event_time = None
+        self.channel = None  # Connection that sent the last command; READY is pushed on it
+        self.client_addr = None  # Legacy mode: READY is dialled back to this address
+        self.last_sequence = None  # SequenceNumber of the last command on a connection
+        self.grace_timer = None  # Ends a detached lockstep session unless a new connection resumes it
+
+
+class SessionTable:
+    """ControllerSessions by key, spread over shards that each have their own lock.
+
+    Lookups of an existing session take no lock at all (a dict read is atomic);
+    only creating and removing a session locks its shard.
+    """
+
+    def __init__(self, shards=SESSION_SHARDS):
+        self.shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def get(self, key):
+        sessions, _ = self.shard(key)
+        return sessions.get(key)
+
+    def get_or_create(self, key):
+        sessions, lock = self.shard(key)
+        session = sessions.get(key)
+        if session is None:
+            with lock:
+                session = sessions.get(key)
+                if session is None:
+                    session = sessions[key] = ControllerSession(key)
+        return session
+
+    def add(self, session):
+        """Insert an existing session under its (new) key"""
+        sessions, lock = self.shard(session.key)
+        with lock:
+            sessions[session.key] = session
+
+    def remove(self, key):
+        sessions, lock = self.shard(key)
+        with lock:
+            return sessions.pop(key, None)
+
+    def __len__(self):
+        return sum(len(sessions) for sessions, _ in self.shards)
+
+    def snapshot(self):
+        """Every session at the time of the call"""
+        result = []
+        for sessions, lock in self.shards:
+            with lock:
+                result.extend(sessions.values())
+        return result
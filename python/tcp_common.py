@@ -1,19 +1,93 @@
-import numpy as np
+import struct
 import time
+from typing import NamedTuple, Optional, Tuple
+
+from message_schema import PROTOCOL_HEADER, fixed_struct, numpy_dtype
+
+# Wire layout of the header: TimeStamp(8) MessageType(1) SequenceNumber(8) BodyLength(4), packed
+HEADER_STRUCT = fixed_struct(PROTOCOL_HEADER)
+HEADER_SIZE = HEADER_STRUCT.size  # 21 bytes
+SEQUENCE_NUMBER_OFFSET = struct.calcsize('<QB')  # SequenceNumber can be patched in place at this offset
+SEQUENCE_NUMBER_STRUCT = struct.Struct('<Q')
+MAX_BODY_LENGTH = 64 * 1024 * 1024  # Reject frames that claim more than 64 MiB
+
+HANDSHAKE_RESPONSES = {1: 2, 3: 4}  # Handshake request MessageType -> response MessageType, in handshake order
+START_CONFIG_MESSAGE_TYPE = 19  # Body is a DataRecordConfigMsg; start recording with it
+END_CONFIG_MESSAGE_TYPE = 21  # Body is a DataRecordConfigMsg; stop recording
+
+# Other MessageType values
+COMMAND_MESSAGE_TYPE = 0  # Body carries a text command such as EVENT or CONNECTION_FAIL:<names>
+LOGGING_MSG_TYPE = 40  # Body is a LoggingMsg payload to be buffered/recorded by the backend
+EVENT_RECEIVED_MESSAGE_TYPE = 42  # Backend -> controller: EVENT acknowledged (echoes its SequenceNumber)
+READY_MESSAGE_TYPE = 43  # Backend -> controller: event window finished, ready for the next EVENT
+STATS_REQUEST_MESSAGE_TYPE = 44  # Ask a backend for its metrics; header only
+STATS_RESPONSE_MESSAGE_TYPE = 45  # Body is the metrics in Prometheus text format (echoes the request SequenceNumber)
+PIPELINE_OPEN_MESSAGE_TYPE = 46  # Controller -> backend: start/resume a pipelined session, see seq_window
+PIPELINE_ACK_MESSAGE_TYPE = 47  # Backend -> controller: cumulative ack in SequenceNumber, selective acks in the body
+
+
+class FrameHeader(NamedTuple):
+    timestamp: int
+    message_type: int
+    sequence_number: int
+    body_length: int
+
 
 class ProtocolHeader:
     def __init__(self):
-        self.header_type = np.dtype([
-            ('TimeStamp', np.uint64),
-            ('MessageType', np.uint8),
-            ('SequenceNumber', np.uint64),
-            ('BodyLength', np.uint32)
-        ])
+        self.header_type = numpy_dtype(PROTOCOL_HEADER)
 
     def get_header_message(self, timestamp, message_type, sequence_number, body_length):
+        import numpy as np
         ret = np.array((timestamp, message_type, sequence_number, body_length), dtype=self.header_type)
         return ret
-    
+
+
+def pack_message(message_type: int, sequence_number: int, body: bytes = b'', timestamp: Optional[int] = None) -> bytes:
+    """Build one length-framed message (header + body)"""
+    if timestamp is None:
+        timestamp = time.time_ns()
+    return HEADER_STRUCT.pack(timestamp, message_type, sequence_number, len(body)) + body
+
+
+def recv_exact_into(sock, view: memoryview) -> bool:
+    """Fill view completely from sock. Returns False if the peer closed before the first byte."""
+    size = len(view)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            if received == 0:
+                return False
+            raise ConnectionError(f"Connection closed after {received} of {size} bytes")
+        received += n
+    return True
+
+
+def recv_exact(sock, size: int) -> Optional[bytearray]:
+    """Read exactly size bytes. Returns None if the peer closed before the first byte."""
+    buf = bytearray(size)
+    if not recv_exact_into(sock, memoryview(buf)):
+        return None
+    return buf
+
+
+def recv_message(sock, max_body_length: int = MAX_BODY_LENGTH) -> Optional[Tuple[FrameHeader, bytearray]]:
+    """Read one framed message. Returns None when the peer closed the connection cleanly."""
+    header_data = recv_exact(sock, HEADER_SIZE)
+    if header_data is None:
+        return None
+    header = FrameHeader(*HEADER_STRUCT.unpack(header_data))
+    if header.body_length > max_body_length:
+        raise ValueError(f"Body length {header.body_length} exceeds limit {max_body_length}")
+    if header.body_length == 0:
+        return header, bytearray()
+    body = recv_exact(sock, header.body_length)
+    if body is None:
+        raise ConnectionError("Connection closed before message body")
+    return header, body
+
+
 if __name__=="__main__":
     head_setter = ProtocolHeader()
     ret = head_setter.get_header_message(time.time_ns(), 1, 1, 0)
@@ -0,0 +1,66 @@
+import socket
+import threading
+
+import pytest
+
+import backend_client
+from backend_client import NotificationReader, is_socket_alive
+from tcp_common import EVENT_RECEIVED_MESSAGE_TYPE, READY_MESSAGE_TYPE, pack_message
+
+
+@pytest.fixture(autouse=True)
+def without_msg_dontwait(monkeypatch):
+    # As on Windows
+    monkeypatch.delattr(socket, "MSG_DONTWAIT", raising=False)
+
+
+def test_is_socket_alive():
+    local, peer = socket.socketpair()
+    with local:
+        assert is_socket_alive(local)
+        peer.sendall(b"x")
+        assert is_socket_alive(local)
+        assert local.recv(1) == b"x"  # The probe did not consume it
+        peer.close()
+        assert not is_socket_alive(local)
+    assert not is_socket_alive(None)
+
+
+def test_notification_reader_delivers_frames_and_close():
+    received, closed = [], threading.Event()
+    reader = NotificationReader(lambda name, header, body: received.append((name, header.message_type, body)),
+                                lambda name: closed.set())
+    local, peer = socket.socketpair()
+    try:
+        reader.add("backend1", local)
+        frame = pack_message(READY_MESSAGE_TYPE, 0)
+        # Split across sends: a frame is delivered only once complete
+        peer.sendall(pack_message(EVENT_RECEIVED_MESSAGE_TYPE, 7, b"ok") + frame[:5])
+        peer.sendall(frame[5:])
+        peer.close()
+        assert closed.wait(2.0)
+        assert received == [("backend1", EVENT_RECEIVED_MESSAGE_TYPE, b"ok"), ("backend1", READY_MESSAGE_TYPE, b"")]
+    finally:
+        reader.close()
+        local.close()
+
+
+def test_connection_discards_sockets_opened_to_a_replaced_host(monkeypatch):
+    connection = backend_client.BackendConnection("10.0.0.1", [9090, 9091])
+    opened = []
+
+    def open_connection(host, port, timeout):
+        local, peer = socket.socketpair()
+        opened.append((host, local, peer))
+        return local
+
+    monkeypatch.setattr(backend_client, "open_connection", open_connection)
+    # The GUI applies a new host while the handshake with the old one is running
+    monkeypatch.setattr(backend_client, "run_handshake", lambda *args: connection.set_host("10.0.0.2"))
+    with pytest.raises(ConnectionError):
+        connection.connect(1)
+    assert connection.host == "10.0.0.2"
+    assert connection.sockets == [None, None]
+    assert [host for host, _, _ in opened] == ["10.0.0.1"]
+    assert opened[0][1].fileno() == -1  # Closed
+    opened[0][2].close()
@@ -0,0 +1,61 @@
+import socket
+import threading
+
+import pytest
+
+from backend_process import BackendProcess, SocketChannel
+from scheduler import Scheduler
+from tcp_common import (COMMAND_MESSAGE_TYPE, EVENT_RECEIVED_MESSAGE_TYPE, START_CONFIG_MESSAGE_TYPE, pack_message,
+                        recv_message)
+
+
+def test_channel_closes_after_failed_send():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        channel = SocketChannel(sender)
+        # The peer never reads, so sendall times out with part of the data written
+        with pytest.raises(OSError):
+            channel.send(bytes(64 * 1024 * 1024))
+        assert channel.closed
+        with pytest.raises(ConnectionError):
+            channel.send(b"next frame")
+        # The socket was shut down, so the reader sees the end of the connection
+        receiver.setblocking(False)
+        while True:
+            try:
+                if not receiver.recv(1 << 20):
+                    break
+            except BlockingIOError:
+                pytest.fail("connection was not shut down")
+
+
+def tcp_pair():
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        client = socket.create_connection(server.getsockname())
+        accepted, _ = server.accept()
+    return accepted, client
+
+
+@pytest.mark.parametrize("message_type, body", [
+    (COMMAND_MESSAGE_TYPE, b"\xff\xfe"),  # Not UTF-8
+    (START_CONFIG_MESSAGE_TYPE, b"\x05\x00"),  # Truncated config
+])
+def test_bad_frame_is_dropped_and_session_kept(message_type, body):
+    sender, receiver = tcp_pair()
+    backend = BackendProcess([19090, 19091], persistent=True, scheduler=Scheduler())
+    addr = ("10.0.0.1", 50001)
+    server = threading.Thread(target=backend.serve_connection, args=(sender, addr, 1), daemon=True)
+    server.start()
+    try:
+        with receiver:
+            receiver.settimeout(2.0)
+            receiver.sendall(pack_message(COMMAND_MESSAGE_TYPE, 1, b"START"))
+            receiver.sendall(pack_message(message_type, 2, body))
+            receiver.sendall(pack_message(COMMAND_MESSAGE_TYPE, 3, b"EVENT"))
+            header, _ = recv_message(receiver)
+            assert (header.message_type, header.sequence_number) == (EVENT_RECEIVED_MESSAGE_TYPE, 3)
+            assert backend.is_started
+    finally:
+        server.join(2.0)
+        backend.event_buffer.close()
+        backend.scheduler.stop()
@@ -0,0 +1,26 @@
+import signal
+import socket
+
+import pytest
+
+import backend_supervisor
+from backend_supervisor import MAX_STARTUP_FAILURES, BackendSupervisor
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGHUP, signal.SIGTERM)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_supervisor_gives_up_when_workers_cannot_bind(monkeypatch, restore_signals):
+    monkeypatch.setattr(backend_supervisor, "RESTART_BACKOFF", 0.0)
+    # Bound without SO_REUSEPORT, so the workers cannot share them
+    with socket.create_server(("", 0)) as taken, socket.create_server(("", 0)) as other:
+        ports = [taken.getsockname()[1], other.getsockname()[1]]
+        supervisor = BackendSupervisor(ports, workers=1)
+        assert supervisor.run() == 1
+    assert supervisor.startup_failures == MAX_STARTUP_FAILURES
+    assert supervisor.workers == []
@@ -0,0 +1,67 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from controller import serve
+
+
+class FakeController:
+    backends = [{"name": "backend1"}]
+
+    def __init__(self):
+        self.checks = 0
+
+    def check_connections(self):
+        self.checks += 1
+
+    def connect(self, timeout=None):
+        return {}
+
+    def status(self):
+        return [("backend1", True)]
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = str(tmp_path / "controller.sock")
+    controller, stopping = FakeController(), threading.Event()
+    thread = threading.Thread(target=serve, args=(controller, path, 0.05, stopping), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 2.0
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    yield controller, path
+    stopping.set()
+    thread.join(5.0)
+
+
+def client(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(2.0)
+    sock.connect(path)
+    return sock, sock.makefile('r', encoding='utf-8')
+
+
+def test_idle_client_does_not_block_others_or_health_checks(daemon):
+    controller, path = daemon
+    idle, _ = client(path)
+    with idle:
+        sleeping, sleeping_reader = client(path)
+        with sleeping:
+            sleeping.sendall(b"sleep 0.5\n")
+            active, reader = client(path)
+            with active:
+                started = time.monotonic()
+                active.sendall(b"status\n")
+                assert reader.readline() == "ok backend1=ready\n"
+                assert time.monotonic() - started < 0.4
+                active.sendall(b"bogus\n")
+                assert reader.readline().startswith("error Unknown command")
+            checks = controller.checks
+            time.sleep(0.2)
+            assert controller.checks > checks
+            assert sleeping_reader.readline() == "ok slept\n"
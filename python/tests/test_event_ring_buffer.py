@@ -0,0 +1,117 @@
+import threading
+
+from event_ring_buffer import EventRingBuffer
+
+SECOND = 1_000_000_000
+
+
+class ManualScheduler:
+    """Never fires; the tests end captures with finish_capture"""
+
+    class Handle:
+        def cancel(self):
+            pass
+
+    def call_later(self, delay, callback, *args):
+        return self.Handle()
+
+    def reschedule(self, handle, delay):
+        return handle
+
+
+def make_buffer(writer=None, **kwargs):
+    return EventRingBuffer(writer=writer, scheduler=ManualScheduler(), **kwargs)
+
+
+def payloads(window):
+    return [bytes(msg.payload) for msg in window.messages]
+
+
+def test_history_expires_after_history_time():
+    buffer = make_buffer(history_time=2.0, follow_time=1.0)
+    buffer.append(b"old", now_ns=0)
+    buffer.append(b"mid", now_ns=1 * SECOND)
+    buffer.append(b"new", now_ns=2 * SECOND + 1)
+    assert buffer.buffered_bytes == 6
+    assert buffer.dropped == 0  # Expiry is not a drop
+    buffer.close()
+
+
+def test_window_has_history_and_follow_up():
+    windows = []
+    buffer = make_buffer(windows.append, history_time=2.0, follow_time=1.0)
+    buffer.append(b"expired", now_ns=0)
+    buffer.append(b"before", now_ns=2 * SECOND)
+    buffer.trigger(now_ns=3 * SECOND)
+    assert buffer.capturing
+    buffer.append(b"after", now_ns=3 * SECOND + 1)
+    buffer.finish_capture(now_ns=4 * SECOND)
+    buffer.close()
+    assert len(windows) == 1
+    assert payloads(windows[0]) == [b"before", b"after"]
+    assert windows[0].event_ns == 3 * SECOND
+    # The last history_time seconds of the capture are the history again
+    assert buffer.buffered_bytes == len(b"before") + len(b"after")
+    assert buffer.queued_bytes == 0
+
+
+def test_trigger_during_capture_extends_it():
+    windows = []
+    buffer = make_buffer(windows.append, history_time=1.0, follow_time=1.0)
+    buffer.trigger(now_ns=0)
+    buffer.append(b"a", now_ns=SECOND // 2)
+    buffer.trigger(now_ns=SECOND // 2)
+    assert buffer._capture_end_ns == SECOND // 2 + SECOND
+    buffer.append(b"b", now_ns=SECOND + SECOND // 4)
+    buffer.finish_capture(now_ns=2 * SECOND)
+    buffer.close()
+    assert len(windows) == 1
+    assert payloads(windows[0]) == [b"a", b"b"]
+    assert windows[0].event_ns == 0
+
+
+def test_budget_evicts_history_oldest_first():
+    buffer = make_buffer(history_time=100.0, byte_budget=10)
+    for i in range(5):
+        buffer.append(b"abcd", now_ns=i)
+    assert buffer.buffered_bytes == 8
+    assert buffer.dropped == 3
+    buffer.close()
+
+
+def test_budget_evicts_oldest_part_of_capture():
+    windows = []
+    buffer = make_buffer(windows.append, history_time=100.0, byte_budget=10)
+    buffer.trigger(now_ns=0)
+    for i in range(4):
+        buffer.append(bytes([i]) * 4, now_ns=i + 1)
+    buffer.finish_capture(now_ns=10)
+    buffer.close()
+    assert payloads(windows[0]) == [b"\2" * 4, b"\3" * 4]
+    assert windows[0].dropped == 2
+
+
+def test_waiting_windows_count_against_budget():
+    writing, release = threading.Event(), threading.Event()
+    written = []
+
+    def slow_writer(window):
+        writing.set()
+        release.wait()
+        written.append(payloads(window))
+
+    buffer = make_buffer(slow_writer, history_time=0.0, follow_time=0.0, byte_budget=12)
+    for i in range(4):
+        now = i * SECOND
+        buffer.trigger(now_ns=now)
+        buffer.append(bytes([i]) * 4, now_ns=now)
+        buffer.finish_capture(now_ns=now + 1)
+        writing.wait()
+        assert buffer.held_bytes <= 12
+    # The first window is with the writer; of the ones waiting, the oldest was dropped
+    assert buffer.dropped_windows == 1
+    assert buffer.dropped == 1
+    release.set()
+    buffer.close()
+    assert written == [[b"\0" * 4], [b"\2" * 4], [b"\3" * 4]]
+    assert buffer.queued_bytes == 0
@@ -0,0 +1,78 @@
+import pytest
+
+from indexed_log import INDEX_ENTRY, IndexedLogReader, index_path
+from tcp_common import HEADER_STRUCT, LOGGING_MSG_TYPE
+
+
+def write_log(path, records):
+    """records: (timestamp, sequence_number, payload); returns (data, index) bytes"""
+    data, index = bytearray(), bytearray()
+    for timestamp, sequence_number, payload in records:
+        index += INDEX_ENTRY.pack(timestamp, sequence_number, len(data))
+        data += HEADER_STRUCT.pack(timestamp, LOGGING_MSG_TYPE, sequence_number, len(payload)) + payload
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(index_path(path), 'wb') as f:
+        f.write(index)
+    return bytes(data), bytes(index)
+
+
+RECORDS = [(100, 1, b"a"), (200, 2, b"bb"), (200, 4, b""), (300, 7, b"dddd")]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "stream.bin")
+
+
+def test_records_and_lookups(path):
+    write_log(path, RECORDS)
+    with IndexedLogReader(path) as reader:
+        assert len(reader) == 4
+        assert [(h.timestamp, h.sequence_number, bytes(p)) for h, p in reader.records(0, 4)] == RECORDS
+        assert reader.find_sequence(4) == 2
+        assert reader.find_sequence(3) == -1
+        assert reader.find_sequence(8) == -1
+        assert reader.find_time_range(200, 300) == (1, 3)
+        assert reader.find_time_range(0, 100) == (0, 0)
+        assert reader.find_time_range(301, 400) == (4, 4)
+        assert [bytes(p) for _, p in reader.records_between(150, 1000)] == [b"bb", b"", b"dddd"]
+        assert bytes(reader.span(1, 3)) == bytes(reader.data[reader.offset(1):reader.offset(3)])
+
+
+def test_trailing_partial_index_entry_is_ignored(path):
+    write_log(path, RECORDS)
+    with open(index_path(path), 'ab') as f:
+        f.write(b"\1" * (INDEX_ENTRY.size - 1))
+    with IndexedLogReader(path) as reader:
+        assert len(reader) == 4
+        assert reader.find_sequence(7) == 3
+
+
+def test_truncated_index_covers_only_its_records(path):
+    _, index = write_log(path, RECORDS)
+    with open(index_path(path), 'wb') as f:
+        f.write(index[:2 * INDEX_ENTRY.size])
+    with IndexedLogReader(path) as reader:
+        assert len(reader) == 2
+        assert reader.find_sequence(4) == -1
+        assert reader.find_time_range(0, 1000) == (0, 2)
+
+
+def test_index_ahead_of_data_stops_at_last_complete_record(path):
+    data, _ = write_log(path, RECORDS)
+    # The data of the last record is only partly written
+    with open(path, 'wb') as f:
+        f.write(data[:-2])
+    with IndexedLogReader(path) as reader:
+        assert len(reader) == 3
+        assert reader.find_sequence(7) == -1
+        assert bytes(reader.span(0, 3)) == data[:len(data) - HEADER_STRUCT.size - 4]
+
+
+def test_empty_log(path):
+    write_log(path, [])
+    with IndexedLogReader(path) as reader:
+        assert len(reader) == 0
+        assert reader.find_sequence(1) == -1
+        assert reader.find_time_range(0, 1000) == (0, 0)
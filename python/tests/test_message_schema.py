@@ -0,0 +1,93 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from data_record_config_msg import (CONFIG_CODEC, VIEWER_CODEC, DataRecordConfigMsg, DataRecordViewerMsg, Header,
+                                    LoggingFile, MetaData, MetaKeyDictionary)
+from message_schema import emit_cpp_header
+
+CPP_HEADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cpp", "message_schema.h")
+
+
+def config_msg():
+    return DataRecordConfigMsg(
+        header=Header(0, 0, 0, 0),
+        logging_directory_path="/data/로그",
+        logging_mode=1,
+        history_time=30,
+        follow_time=10,
+        split_time=60,
+        data_length=2,
+        logging_file_list=[LoggingFile(1, "1", "a_", "_raw", "bin"), LoggingFile(2, "0", "", "", "")],
+        meta_data=MetaData({"vehicle": "car-07", "weather": "rain"}, "brake judder"))
+
+
+def viewer_msg():
+    return DataRecordViewerMsg(Header(0, 0, 0, 0), "12가3456", "lane drift", "ctl-1")
+
+
+def assert_truncation_raises(codec, encoded, **kwargs):
+    for length in range(len(encoded)):
+        with pytest.raises(ValueError):
+            codec.decode(memoryview(encoded)[:length], **kwargs)
+
+
+def test_viewer_round_trip():
+    msg = viewer_msg()
+    encoded = VIEWER_CODEC.encode(msg)
+    assert VIEWER_CODEC.size(msg) == len(encoded)
+    assert VIEWER_CODEC.decode(encoded) == (msg, len(encoded))
+
+
+def test_viewer_reserve_and_offset():
+    msg = viewer_msg()
+    encoded = VIEWER_CODEC.encode(msg, reserve=21)
+    assert encoded[:21] == bytes(21)
+    assert VIEWER_CODEC.decode(encoded, 21) == (msg, len(encoded))
+
+
+def test_viewer_truncation_raises():
+    assert_truncation_raises(VIEWER_CODEC, VIEWER_CODEC.encode(viewer_msg()))
+
+
+def test_config_size_matches_encoding():
+    msg = config_msg()
+    dictionary = MetaKeyDictionary(["vehicle"])
+    assert CONFIG_CODEC.size(msg) == len(CONFIG_CODEC.encode(msg))
+    assert CONFIG_CODEC.size(msg, dictionary) == len(CONFIG_CODEC.encode(msg, meta_keys=dictionary))
+
+
+def test_config_round_trip():
+    pytest.importorskip("numpy")  # The config message holds numpy integers
+    msg = config_msg()
+    encoded = CONFIG_CODEC.encode(msg)
+    assert CONFIG_CODEC.decode(encoded) == (msg, len(encoded))
+
+
+def test_config_round_trip_with_meta_dictionary():
+    pytest.importorskip("numpy")
+    msg = config_msg()
+    dictionary = MetaKeyDictionary(["vehicle", "weather"])
+    encoded = CONFIG_CODEC.encode(msg, meta_keys=dictionary)
+    assert CONFIG_CODEC.decode(encoded, meta_keys=dictionary) == (msg, len(encoded))
+    with pytest.raises(ValueError, match="not installed"):
+        CONFIG_CODEC.decode(encoded)
+    with pytest.raises(ValueError, match="not installed"):
+        CONFIG_CODEC.decode(encoded, meta_keys=MetaKeyDictionary(["weather"]))
+
+
+def test_config_truncation_raises():
+    pytest.importorskip("numpy")
+    assert_truncation_raises(CONFIG_CODEC, CONFIG_CODEC.encode(config_msg()))
+
+
+def test_cpp_header_is_current():
+    with open(CPP_HEADER) as f:
+        assert f.read() == emit_cpp_header(), "Regenerate it: python python/message_schema.py --cpp"
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_cpp_header_compiles():
+    subprocess.run(["g++", "-std=c++17", "-fsyntax-only", "-x", "c++", CPP_HEADER], check=True)
@@ -0,0 +1,68 @@
+import pytest
+
+from data_record_config_msg import MetaData, MetaKeyDictionary, decode_meta_data, encode_meta_data
+
+SAMPLE = MetaData({"vehicle": "car-07", "driver": "kim", "weather": "rain", "": "empty key"}, "brake judder")
+
+
+def test_round_trip_without_dictionary():
+    assert decode_meta_data(encode_meta_data(SAMPLE)) == SAMPLE
+
+
+def test_round_trip_with_dictionary():
+    dictionary = MetaKeyDictionary(["vehicle", "weather"])
+    encoded = encode_meta_data(SAMPLE, dictionary)
+    assert decode_meta_data(encoded, dictionary) == SAMPLE
+    # Dictionary keys travel as ids, the others as text
+    assert b"vehicle" not in encoded and b"weather" not in encoded
+    assert b"driver" in encoded
+    assert len(encoded) < len(encode_meta_data(SAMPLE)) + 4
+
+
+def test_round_trip_non_ascii_and_long_values():
+    meta = MetaData({"설명": "가" * 300, "k" * 200: ""}, "")
+    assert decode_meta_data(encode_meta_data(meta)) == meta
+    dictionary = MetaKeyDictionary(["설명"])
+    assert decode_meta_data(encode_meta_data(meta, dictionary), dictionary) == meta
+
+
+def test_empty():
+    meta = MetaData({}, "")
+    assert decode_meta_data(encode_meta_data(meta)) == meta
+
+
+@pytest.mark.parametrize("use_dictionary", [False, True])
+def test_truncation_raises(use_dictionary):
+    dictionary = MetaKeyDictionary(["vehicle", "weather"]) if use_dictionary else None
+    encoded = encode_meta_data(SAMPLE, dictionary)
+    for length in range(len(encoded)):
+        with pytest.raises(ValueError):
+            decode_meta_data(encoded[:length], dictionary)
+
+
+def test_trailing_bytes_raise():
+    with pytest.raises(ValueError, match="trailing"):
+        decode_meta_data(encode_meta_data(SAMPLE) + b"\0")
+
+
+def test_dictionary_not_installed_raises():
+    encoded = encode_meta_data(SAMPLE, MetaKeyDictionary(["vehicle"]))
+    with pytest.raises(ValueError, match="not installed"):
+        decode_meta_data(encoded)
+
+
+def test_dictionary_mismatch_raises():
+    encoded = encode_meta_data(SAMPLE, MetaKeyDictionary(["vehicle", "weather"]))
+    with pytest.raises(ValueError, match="not installed"):
+        decode_meta_data(encoded, MetaKeyDictionary(["weather", "vehicle"]))
+
+
+def test_unknown_key_id_raises():
+    # flags 0, one pair whose key is id 0, but no dictionary is in use
+    with pytest.raises(ValueError, match="Unknown MetaData key id"):
+        decode_meta_data(bytes([0, 1, 1, 0, 0]))
+
+
+def test_duplicate_dictionary_keys_raise():
+    with pytest.raises(ValueError, match="duplicate"):
+        MetaKeyDictionary(["vehicle", "driver", "vehicle"])
@@ -0,0 +1,91 @@
+import glob
+import os
+import time
+
+import recorder
+from data_record_config_msg import LoggingFile
+from indexed_log import INDEX_SUFFIX, IndexedLogReader
+from recorder import RECORD_FORMAT_RAW, STREAM_ID_STRUCT, StreamRecorder
+from tcp_common import LOGGING_MSG_TYPE, FrameHeader
+
+FILES = [LoggingFile(1, "1", "a_", "_raw", "bin"), LoggingFile(2, "0", "b_", "_raw", "bin")]
+
+
+def data_files(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "*")) if not path.endswith(INDEX_SUFFIX))
+
+
+def read_all(path):
+    with IndexedLogReader(path) as reader:
+        return [(h.timestamp, h.sequence_number, bytes(p)) for h, p in reader.records(0, len(reader))]
+
+
+def test_recorder_reader_round_trip(tmp_path):
+    rec = StreamRecorder(str(tmp_path), 0, FILES, buffer_size=4096)
+    for i in range(1, 1001):
+        payload = bytes([i % 256]) * (i % 50)
+        assert rec.write(1, payload, FrameHeader(1000 + i, LOGGING_MSG_TYPE, i, len(payload)))
+    assert rec.write_frame(STREAM_ID_STRUCT.pack(1) + b"frame", FrameHeader(5000, LOGGING_MSG_TYPE, 2000, 9))
+    # Stream 2 is disabled, stream 3 is not configured
+    assert not rec.write(2, b"x") and not rec.write(3, b"x")
+    rec.close()
+    [path] = data_files(str(tmp_path))
+    assert os.path.basename(path).startswith("a_")
+    records = read_all(path)
+    assert len(records) == 1001 and rec.dropped == 0
+    assert records[10] == (1011, 11, bytes([11]) * 11)
+    assert records[-1] == (5000, 2000, b"frame")
+    with IndexedLogReader(path) as reader:
+        assert reader.find_sequence(500) == 499
+        assert reader.find_time_range(1100, 1200) == (99, 199)
+
+
+def test_raw_format_writes_payloads_only(tmp_path):
+    rec = StreamRecorder(str(tmp_path), 0, FILES, record_format=RECORD_FORMAT_RAW)
+    rec.write(1, b"abc")
+    rec.write(1, b"def")
+    rec.close()
+    [path] = glob.glob(os.path.join(str(tmp_path), "*"))
+    with open(path, 'rb') as f:
+        assert f.read() == b"abcdef"
+
+
+def test_split_starts_new_readable_files(tmp_path):
+    rec = StreamRecorder(str(tmp_path), 0.05, FILES)
+    rec.write(1, b"first", FrameHeader(1, LOGGING_MSG_TYPE, 1, 5))
+    deadline = time.monotonic() + 5.0
+    while rec.files_opened < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    rec.write(1, b"second", FrameHeader(2, LOGGING_MSG_TYPE, 2, 6))
+    rec.close()
+    records = [read_all(path) for path in data_files(str(tmp_path))]
+    assert [(1, 1, b"first")] in records and [(2, 2, b"second")] in records
+    assert rec.files_opened == len(records)
+
+
+def test_failed_records_are_counted_and_the_rest_written(tmp_path, monkeypatch):
+    write_record = recorder.StreamFile.write_record
+
+    def failing(self, header, payload):
+        if bytes(payload) == b"bad":
+            raise OSError("disk full")
+        write_record(self, header, payload)
+
+    monkeypatch.setattr(recorder.StreamFile, "write_record", failing)
+    rec = StreamRecorder(str(tmp_path), 0, FILES)
+    for i, payload in enumerate((b"ok1", b"bad", b"ok2")):
+        rec.write(1, payload, FrameHeader(i, LOGGING_MSG_TYPE, i, 3))
+    rec.close()
+    assert rec.lost == 1 and rec.dropped == 1
+    [path] = data_files(str(tmp_path))
+    assert [payload for _, _, payload in read_all(path)] == [b"ok1", b"ok2"]
+
+
+def test_full_queue_drops_newest(tmp_path):
+    rec = StreamRecorder(str(tmp_path), 0, FILES, queue_size=2)
+    rec.running = False
+    rec.thread.join()  # Nothing drains the queue now
+    assert rec.write(1, b"a") and rec.write(1, b"b")
+    assert not rec.write(1, b"c")
+    assert rec.dropped == 1
@@ -0,0 +1,85 @@
+from seq_window import (ACCEPTED, BUFFERED, DUPLICATE, OUT_OF_WINDOW, ReceiveWindow, SendWindow, decode_ack,
+                        encode_ack)
+from tcp_common import HEADER_STRUCT, pack_message
+
+
+def sequence_of(package):
+    return HEADER_STRUCT.unpack_from(package, 0)[2]
+
+
+def test_receive_in_order():
+    window = ReceiveWindow(first_sequence=1, size=8)
+    assert window.receive(1, "a") == (ACCEPTED, ["a"])
+    assert window.receive(2, "b") == (ACCEPTED, ["b"])
+    assert window.cumulative_ack == 2
+    assert window.selective_acks() == []
+
+
+def test_receive_gap_is_held_then_delivered_in_order():
+    window = ReceiveWindow(first_sequence=1, size=8)
+    assert window.receive(3, "c") == (BUFFERED, [])
+    assert window.receive(4, "d") == (BUFFERED, [])
+    assert window.cumulative_ack == 0
+    assert window.selective_acks() == [3, 4]
+    assert window.gaps == 1
+    assert window.receive(1, "a") == (ACCEPTED, ["a"])
+    assert window.receive(2, "b") == (ACCEPTED, ["b", "c", "d"])
+    assert window.cumulative_ack == 4
+    assert window.selective_acks() == []
+
+
+def test_receive_duplicates_are_suppressed():
+    window = ReceiveWindow(first_sequence=1, size=8)
+    window.receive(1, "a")
+    window.receive(3, "c")
+    assert window.receive(1, "a") == (DUPLICATE, [])
+    assert window.receive(3, "c") == (DUPLICATE, [])
+    assert window.duplicates == 2
+    assert window.receive(2, "b") == (ACCEPTED, ["b", "c"])
+
+
+def test_receive_beyond_window_is_dropped():
+    window = ReceiveWindow(first_sequence=1, size=4)
+    assert window.receive(5, "e") == (OUT_OF_WINDOW, [])
+    assert window.selective_acks() == []
+    assert window.receive(4, "d") == (BUFFERED, [])
+
+
+def test_ack_encoding_round_trip():
+    assert decode_ack(encode_ack([])) == []
+    assert decode_ack(encode_ack([7, 9, 2 ** 40])) == [7, 9, 2 ** 40]
+
+
+def test_send_window_numbers_packages_and_holds_backlog():
+    window = SendWindow(size=2, first_sequence=10)
+    sent = window.push(pack_message(0, 0, b"a")) + window.push(pack_message(0, 0, b"b"))
+    assert [sequence_of(p) for p in sent] == [10, 11]
+    assert window.push(pack_message(0, 0, b"c")) == []  # Window full
+    admitted = window.ack(10)
+    assert [sequence_of(p) for p in admitted] == [12]
+    assert window.in_flight() == 2
+    assert window.first_unacked == 11
+
+
+def test_send_window_retransmits_gap_after_reconnect():
+    window = SendWindow(size=8)
+    for body in (b"a", b"b", b"c", b"d"):
+        window.push(pack_message(0, 0, body))
+    window.new_connection()
+    # The backend got 1 and 3 only: 2 is a gap, 4 is beyond the highest selective ack
+    resend = window.ack(1, [3])
+    assert [sequence_of(p) for p in resend] == [2]
+    assert window.retransmits == 1
+    # The same acknowledgement again does not resend 2 on this connection
+    assert window.ack(1, [3]) == []
+
+
+def test_send_window_resend_all_skips_what_the_backend_holds():
+    window = SendWindow(size=8)
+    for body in (b"a", b"b", b"c", b"d"):
+        window.push(pack_message(0, 0, body))
+    window.new_connection()
+    resend = window.ack(1, [3], resend_all=True)
+    assert [sequence_of(p) for p in resend] == [2, 4]
+    assert window.ack(4) == []
+    assert window.in_flight() == 0
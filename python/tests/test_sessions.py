@@ -0,0 +1,290 @@
+import threading
+import time
+
+import pytest
+
+import backend_process
+from backend_process import SEQUENCE_REGRESSIONS, BackendProcess
+from backend_supervisor import BackendSupervisor, Worker
+from data_record_config_msg import CONFIG_CODEC, DataRecordConfigMsg, Header, LoggingFile, MetaData
+from scheduler import Scheduler
+from session_table import SessionTable
+from tcp_common import START_CONFIG_MESSAGE_TYPE, FrameHeader
+
+GUI = ("10.0.0.1", 50001)
+AUTOMATION = ("10.0.0.2", 50002)
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.pipeline = None
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRecorder:
+    def __init__(self, config):
+        self.config = config
+        self.logging_files = {}
+        self.directory = config.logging_directory_path
+        self.queue = ()
+        self.dropped = 0
+        self.closed = False
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        return cls(config)
+
+    def close(self):
+        self.closed = True
+
+
+def config(directory):
+    return DataRecordConfigMsg(Header(0, 0, 0, 0), directory, 1, 10, 20, 60, 0,
+                               [LoggingFile(1, "1", "a_", "_raw", "bin")], MetaData({}, ""))
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler()
+    yield scheduler
+    scheduler.stop()
+
+
+@pytest.fixture
+def backend(scheduler, monkeypatch):
+    monkeypatch.setattr(backend_process, "StreamRecorder", FakeRecorder)
+    backend = BackendProcess([19090, 19091], persistent=True, scheduler=scheduler, event_debounce=0.0)
+    yield backend
+    backend.event_buffer.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_table_get_or_create_and_remove():
+    table = SessionTable(shards=4)
+    session = table.get_or_create("a")
+    assert table.get_or_create("a") is session
+    assert table.get("a") is session and table.get("b") is None
+    table.get_or_create("b")
+    assert len(table) == 2
+    assert {s.key for s in table.snapshot()} == {"a", "b"}
+    assert table.remove("a") is session
+    assert table.remove("a") is None
+    assert len(table) == 1
+
+
+def test_table_add_moves_session_to_its_new_key():
+    table = SessionTable()
+    session = table.remove(table.get_or_create("old").key)
+    session.key = "new"
+    table.add(session)
+    assert table.get("new") is session and table.get("old") is None
+
+
+def test_table_concurrent_creation_yields_one_session_per_key():
+    table = SessionTable()
+    results = [[] for _ in range(8)]
+    barrier = threading.Barrier(len(results))
+
+    def create(found):
+        barrier.wait()
+        for key in range(200):
+            found.append(table.get_or_create(key))
+
+    threads = [threading.Thread(target=create, args=(found,)) for found in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(table) == 200
+    for found in results[1:]:
+        assert all(a is b for a, b in zip(found, results[0]))
+
+
+def test_end_of_one_controller_keeps_the_other_started(backend):
+    gui, automation = FakeChannel(), FakeChannel()
+    backend.command_start("START", GUI, gui, 1, config("/data/gui"))
+    backend.command_start("START", AUTOMATION, automation, 1)
+    assert backend.started_sessions == 2
+    backend.command_end("END", GUI, gui, 2)
+    assert backend.is_started
+    assert backend.sessions.get(automation).is_started
+    assert not backend.sessions.get(gui).is_started
+    assert backend.recorder is not None
+    # EVENTs of the ENDed controller are ignored, the other's are acknowledged
+    backend.command_event("EVENT", GUI, gui, 3)
+    backend.command_event("EVENT", AUTOMATION, automation, 2)
+    assert gui.sent == [] and len(automation.sent) == 1
+    backend.command_end("END", AUTOMATION, automation, 3)
+    assert not backend.is_started
+    assert backend.recorder is None
+
+
+def test_concurrent_start_end_from_two_controllers(backend, monkeypatch):
+    started_at_start = []  # started_sessions whenever recording (re)starts
+    start_recording = backend.start_recording
+
+    def recording(config, publish=True):
+        started_at_start.append(backend.started_sessions)
+        start_recording(config, publish)
+
+    monkeypatch.setattr(backend, "start_recording", recording)
+    shared = config("/data/shared")
+    channels = [FakeChannel(), FakeChannel()]
+    barrier = threading.Barrier(2)
+
+    def drive(addr, channel):
+        barrier.wait()
+        for i in range(500):
+            backend.command_start("START", addr, channel, 2 * i + 1, shared)
+            backend.command_end("END", addr, channel, 2 * i + 2)
+
+    threads = [threading.Thread(target=drive, args=args) for args in zip((GUI, AUTOMATION), channels)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.started_sessions == 0
+    assert not backend.is_started
+    assert backend.recorder is None and backend.recording_config is None
+    # Recording only ever started on a 0 -> 1 transition, never while the other session was STARTED
+    assert started_at_start and set(started_at_start) == {1}
+
+
+def test_recording_starts_once_and_conflicting_config_is_ignored(backend):
+    gui, automation = FakeChannel(), FakeChannel()
+    backend.command_start("START", GUI, gui, 1, config("/data/gui"))
+    recorder = backend.recorder
+    backend.command_start("START", AUTOMATION, automation, 1, config("/data/gui"))
+    assert backend.recorder is recorder
+    backend.command_start("START", AUTOMATION, automation, 2, config("/data/automation"))
+    assert backend.recorder is recorder and backend.recording_config.logging_directory_path == "/data/gui"
+    # Once it is the only STARTED session, a controller may change the config
+    backend.command_end("END", GUI, gui, 2)
+    backend.command_start("START", AUTOMATION, automation, 3, config("/data/automation"))
+    assert recorder.closed
+    assert backend.recorder.config.logging_directory_path == "/data/automation"
+
+
+def test_start_config_frame_starts_recording(backend):
+    pytest.importorskip("numpy")  # Decoding a config produces numpy integers
+    body = CONFIG_CODEC.encode(config("/data/gui"))
+    backend.handle_frame(FrameHeader(0, START_CONFIG_MESSAGE_TYPE, 1, len(body)), body, GUI, FakeChannel())
+    assert backend.is_started
+    assert backend.recorder.config.logging_directory_path == "/data/gui"
+
+
+def test_closed_connection_ends_its_session(backend):
+    backend.session_grace = 0.0
+    gui, automation = FakeChannel(), FakeChannel()
+    backend.command_start("START", GUI, gui, 1)
+    backend.command_start("START", AUTOMATION, automation, 1)
+    backend.channel_closed(gui, GUI)
+    assert gui.closed
+    assert backend.sessions.get(gui) is None
+    assert backend.started_sessions == 1
+    backend.channel_closed(automation, AUTOMATION)
+    assert not backend.is_started and len(backend.sessions) == 0
+
+
+def test_closed_connection_ends_session_after_grace(backend):
+    backend.session_grace = 0.05
+    gui = FakeChannel()
+    backend.command_start("START", GUI, gui, 1, config("/data/gui"))
+    backend.channel_closed(gui, GUI)
+    assert backend.is_started and backend.recorder is not None
+    wait_for(lambda: not backend.is_started)
+    assert backend.recorder is None and not backend.detached
+
+
+def test_reconnect_within_grace_resumes_session(backend):
+    backend.session_grace = 5.0
+    gui, other_host = FakeChannel(), FakeChannel()
+    backend.command_start("START", GUI, gui, 1)
+    session = backend.sessions.get(gui)
+    backend.channel_closed(gui, GUI)
+    # A connection from another host does not take it over
+    backend.command_event("EVENT", AUTOMATION, other_host, 1)
+    assert other_host.sent == []
+    reconnected = FakeChannel()
+    backend.command_event("EVENT", (GUI[0], 50003), reconnected, 2)
+    assert backend.sessions.get(reconnected) is session
+    assert session.channel is reconnected and session.is_started
+    assert len(reconnected.sent) == 1  # EVENT_RECEIVED
+    assert session.grace_timer is None and not backend.detached
+    assert backend.started_sessions == 1
+
+
+def test_other_controller_on_same_host_gets_its_own_session(backend):
+    backend.session_grace = 5.0
+    gui, automation = FakeChannel(), FakeChannel()
+    backend.command_start("START", GUI, gui, 40, config("/data/gui"))
+    session = backend.sessions.get(gui)
+    backend.channel_closed(gui, GUI)
+    # Same host, but its numbering does not continue the GUI's
+    backend.command_start("START", (GUI[0], 50004), automation, 5)
+    backend.command_end("END", (GUI[0], 50004), automation, 6)
+    assert backend.sessions.get(automation) is not session
+    assert session.is_started and backend.started_sessions == 1
+    assert backend.is_started and backend.recorder is not None
+    assert backend.detached == {GUI[0]: [session]}
+    # The GUI itself still resumes
+    reconnected = FakeChannel()
+    backend.command_event("EVENT", (GUI[0], 50005), reconnected, 41)
+    assert backend.sessions.get(reconnected) is session
+
+
+def test_sequence_regressions_are_counted(backend):
+    labels = (backend.metrics_label,)
+    before = SEQUENCE_REGRESSIONS.value(labels)
+    gui, automation = FakeChannel(), FakeChannel()
+    backend.command_start("START", GUI, gui, 5)
+    backend.command_event("EVENT", GUI, gui, 6)
+    # Each session numbers on its own: a lower number from another controller is no regression
+    backend.command_start("START", AUTOMATION, automation, 1)
+    assert SEQUENCE_REGRESSIONS.value(labels) == before
+    backend.command_event("EVENT", GUI, gui, 6)
+    backend.command_end("END", GUI, gui, 2)
+    assert SEQUENCE_REGRESSIONS.value(labels) == before + 2
+    backend.command_end("END", AUTOMATION, automation, 2)
+    assert SEQUENCE_REGRESSIONS.value(labels) == before + 2
+
+
+class FakeWorkerConn:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def test_supervisor_tracks_started_workers():
+    supervisor = BackendSupervisor([19090, 19091], workers=3)
+    supervisor.workers = [Worker(worker_id, None, FakeWorkerConn()) for worker_id in range(3)]
+    first, second, third = supervisor.workers
+    supervisor.forward(first, ("record", (config("/data/gui"),)))
+    supervisor.forward(first, ("start", ()))
+    assert first.conn.sent == []
+    assert second.conn.sent[-1] == ("start", ()) and third.conn.sent[-1] == ("start", ())
+    supervisor.forward(second, ("start", ()))
+    assert first.conn.sent == [("start", ())]
+    # The first worker's sessions END; the second one's keep everyone recording
+    supervisor.forward(first, ("reset", ()))
+    assert supervisor.config is not None
+    assert second.conn.sent[-1] == ("reset", ()) and third.conn.sent[-1] == ("start", ())
+    assert first.conn.sent[-1] == ("start", ())
+    supervisor.forward(second, ("reset", ()))
+    assert supervisor.config is None
+    assert first.conn.sent[-1] == ("reset", ()) and third.conn.sent[-1] == ("reset", ())